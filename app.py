@@ -1,48 +1,246 @@
+import io
+import json
 import os
-from flask import Flask, render_template, request
+import time
+from flask import (
+    Flask, Response, abort, g, jsonify, redirect, render_template, request, send_file, stream_template,
+    stream_with_context, url_for,
+)
 from dotenv import load_dotenv
-
-from core.ideas import generate_event_ideas
-from core.invitation import generate_invitations
-from core.timeline import make_timeline
+from markupsafe import Markup
+
+from core.batch import BatchProgress, run_batch
+from core.jobs import enqueue_plan, get_plan_job, start_job_workers
+from core.plan import generate_plan, iter_plan, read_event_spec
+from utils.admission import admission_stats, traffic
+from utils.breaker import breaker_status
+from utils.cache import cache_bypass, cache_stats
+from utils.cassette import cassette_stats, record_submission
+from utils.config import (
+    BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, METRICS_ENABLED, PLAN_JOBS, PLAN_STREAMING, REQUEST_BUDGET,
+    client_pool_stats,
+)
+from utils.deadline import request_deadline, timeout_stats
+from utils.hedge import hedge_stats
+from utils.llm import usage_stats
+from utils.metrics import HTTP_SECONDS, render as render_metrics
+from utils.profiling import (
+    authorized, finish_profile, list_profiles, profile_path, requested_mode, start_profile,
+)
+from utils.retry import retry_stats
+from utils.semcache import semantic_cache_stats
+from utils.singleflight import singleflight_stats
+from utils.tracing import end_trace, span, start_trace
+from utils.warmstore import warm_store, warm_store_stats
 
 load_dotenv()  # Loads OPENAI_API_KEY from .env
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret")  # for flash messages
 
+if PLAN_JOBS:
+    start_job_workers()  # resume anything still queued from before a restart
+warm_store()  # map the prebuilt ideas before the first request (and before a preload fork)
+
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+    g.trace = start_trace(f"{request.method} {request.path}")
+    if request.endpoint == "index" and request.method == "POST":
+        mode = requested_mode(
+            request.headers.get("X-Profile") or request.args.get("profile"), _admin_token()
+        )
+        g.profile = start_profile(mode) if mode else None  # None too while another request is profiled
+
+
+@app.after_request
+def _observe_request(response):
+    start = g.get("request_start")
+    if start is not None:
+        # Streamed responses are timed to their first chunk; the sections finish after this
+        HTTP_SECONDS.observe(time.perf_counter() - start, request.endpoint or "-", request.method,
+                             response.status_code)
+    timing = end_trace(g.get("trace"))
+    if timing:
+        response.headers["Server-Timing"] = timing
+    profile = finish_profile(g.get("profile"))
+    if profile:
+        response.headers["X-Profile"] = profile
+    return response
+
+
+@app.teardown_request
+def _end_trace(error=None):
+    end_trace(g.get("trace"))  # no-op unless the view raised before after_request
+    finish_profile(g.get("profile"))
+
+
+def _replayed_headers():
+    # The request headers that change how a plan is made, for bench/replay.py to send again
+    return {k: v for k, v in request.headers.items() if k.lower() in ("cache-control", "accept")}
+
+
+def _admin_token():
+    return request.headers.get("X-Admin-Token") or request.args.get("admin_token")
+
+
+def _flag(name: str) -> bool:
+    return request.values.get(name, "").lower() in {"1", "true", "yes"}
+
+
+def _wants_json() -> bool:
+    best = request.accept_mimetypes.best_match(["text/html", "application/json"])
+    return request.args.get("format") == "json" or best == "application/json"
+
+
+def _streamed_sections(spec, no_cache):
+    # Rendered fragments for results_stream.html, in the order the sections finish
+    # The headers are long gone by now, so the sections' spans only go to TRACE_FILE
+    trace = start_trace("POST / (streamed sections)")
+    try:
+        with cache_bypass(no_cache), request_deadline(REQUEST_BUDGET), traffic(group=spec["organizing_group"]):
+            for name, section in iter_plan(spec):
+                with span(f"{name}.render"):
+                    fragment = Markup(render_template(f"_{name}.html", **{name: section}))
+                yield name, fragment
+    finally:
+        end_trace(trace)
+
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
-        event_type = request.form.get("event_type", "Block Party").strip()
-        guests = int(request.form.get("guests", "50") or 50)
-        budget = request.form.get("budget", "Moderate").strip()
-        location = request.form.get("location", "").strip()
-        organizing_group = request.form.get("organizing_group", "").strip()
-        event_date = request.form.get("event_date", "").strip()
-        event_time = request.form.get("event_time", "").strip()
-        venue = request.form.get("venue", "").strip()
-        tone = request.form.get("tone", "casual").strip()
-
-        # OpenAI-powered generation (with graceful fallbacks in each function)
-        ideas = generate_event_ideas(event_type, guests, budget, location)
-        invitations = generate_invitations(
-            event_type, organizing_group, event_date, event_time, venue, tone
-        )
-        timeline = make_timeline(event_type, event_date)
+        spec = read_event_spec(request.form)
+        record_submission(request.path, request.query_string.decode(), _replayed_headers(), request.form.to_dict())
+
+        # Cache-Control: no-cache or ?nocache=1 forces fresh completions for this request
+        no_cache = "no-cache" in request.headers.get("Cache-Control", "") or _flag("nocache")
+
+        # Background job: answer with a job id at once, the plan is generated by a worker thread
+        if PLAN_JOBS or _flag("job"):
+            job_id = enqueue_plan(spec, no_cache)
+            status_url = url_for("plan_status", job_id=job_id)
+            if _wants_json():
+                return jsonify({"id": job_id, "status": "queued", "status_url": status_url}), 202
+            return redirect(status_url, code=303)
+
+        # Streaming: send the page shell now, then each section as soon as it is ready
+        # (not while profiling: the sections would finish after the profile is saved)
+        profile = g.get("profile")
+        if (PLAN_STREAMING or _flag("stream")) and profile is None:
+            return Response(
+                stream_template("results_stream.html", sections=_streamed_sections(spec, no_cache)),
+                headers={"X-Accel-Buffering": "no", "Cache-Control": "no-store"},
+            )
+
+        # OpenAI-powered generation, all three sections in parallel
+        # (each generator keeps its own graceful fallback)
+        # The whole page gets REQUEST_BUDGET seconds; a section that runs out serves its fallback
+        with cache_bypass(no_cache), request_deadline(REQUEST_BUDGET), traffic(group=spec["organizing_group"]):
+            # cProfile only follows this thread, so a deterministic profile runs the sections in turn
+            plan = generate_plan(spec, concurrent=profile is None or profile.mode != "cprofile")
 
         # Render results page
-        return render_template(
-            "results.html",
-            invitations=invitations,
-            ideas=ideas,
-            timeline=timeline,
-        )
+        with span("render"):
+            return render_template(
+                "results.html",
+                invitations=plan["invitations"],
+                ideas=plan["ideas"],
+                timeline=plan["timeline"],
+            )
 
     return render_template("index.html")
 
 
+@app.route("/plans/<job_id>")
+def plan_status(job_id):
+    """Status of a queued plan plus whichever sections are ready (JSON, or an auto-refreshing page)."""
+    job = get_plan_job(job_id)
+    if job is None:
+        abort(404)
+    if _wants_json():
+        return jsonify(job)
+    return render_template("plan_status.html", job=job)
+
+
+@app.route("/status")
+def status():
+    """Health of the OpenAI backend as this worker sees it, plus the performance counters."""
+    breaker = breaker_status()
+    return jsonify({
+        "openai": breaker,
+        "degraded": breaker["state"] != "closed",
+        "connections": client_pool_stats(),
+        "usage": usage_stats(),
+        "cache": cache_stats(),
+        "semantic_cache": semantic_cache_stats(),
+        "warm_store": warm_store_stats(),
+        "coalescing": singleflight_stats(),
+        "timeouts": timeout_stats(),
+        "hedging": hedge_stats(),
+        "admission": admission_stats(),
+        "retries": retry_stats(),
+        "cassette": cassette_stats(),
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: section and upstream latency, outcomes, tokens, queue depth."""
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/profiles")
+def admin_profiles():
+    """Saved request profiles, newest first (X-Admin-Token or ?admin_token=)."""
+    if not authorized(_admin_token()):
+        abort(404)
+    return jsonify(list_profiles())
+
+
+@app.route("/admin/profiles/<name>")
+def admin_profile(name):
+    """Download one profile: .folded for flame graph tools, .prof for pstats/snakeviz."""
+    path = profile_path(name) if authorized(_admin_token()) else None
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype="text/plain" if name.endswith(".folded") else "application/octet-stream",
+                     as_attachment=True, download_name=name)
+
+
+@app.route("/api/batch", methods=["POST"])
+def api_batch():
+    """
+    JSONL in (request body, or an uploaded "file"), JSONL out in the same order, streamed.
+    One event spec per line with the form's field names; ?concurrency=N bounds the work.
+    """
+    upload = request.files.get("file")
+    if upload:
+        # Form uploads are spooled by werkzeug and closed before the response streams
+        lines = upload.read().decode("utf-8").splitlines()
+    else:
+        lines = io.TextIOWrapper(request.stream, encoding="utf-8")
+    concurrency = min(
+        BATCH_MAX_CONCURRENCY, max(1, request.args.get("concurrency", BATCH_CONCURRENCY, type=int))
+    )
+    mode = request.args.get("mode")
+    progress = BatchProgress()
+
+    def generate():
+        for result in run_batch(lines, concurrency, mode, progress):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        app.logger.info("batch finished: %s", progress.summary())
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     # Debug on for local dev
     app.run(debug=True)
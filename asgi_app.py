@@ -0,0 +1,177 @@
+"""
+Async (ASGI) entry point next to app.py. Same form, same templates, but the three
+sections are awaited on the event loop with AsyncOpenAI, so one worker can hold
+hundreds of pending plans instead of one per thread.
+
+Run with any ASGI server, e.g.:
+    uvicorn asgi_app:app --workers 2
+    hypercorn asgi_app:app
+"""
+import os
+import time
+
+from dotenv import load_dotenv
+from markupsafe import Markup
+from quart import Quart, Response, abort, g, jsonify, render_template, request, send_file, stream_template
+
+from core.plan import agenerate_plan, aiter_plan, read_event_spec
+from utils.admission import admission_stats, traffic
+from utils.breaker import breaker_status
+from utils.cache import cache_bypass, cache_stats
+from utils.cassette import cassette_stats, record_submission
+from utils.config import METRICS_ENABLED, PLAN_STREAMING, REQUEST_BUDGET, client_pool_stats
+from utils.deadline import request_deadline, timeout_stats
+from utils.hedge import hedge_stats
+from utils.llm import usage_stats
+from utils.metrics import HTTP_SECONDS, render as render_metrics
+from utils.profiling import (
+    authorized, finish_profile, list_profiles, profile_path, requested_mode, start_profile,
+)
+from utils.retry import retry_stats
+from utils.semcache import semantic_cache_stats
+from utils.singleflight import singleflight_stats
+from utils.tracing import end_trace, span, start_trace
+from utils.warmstore import warm_store, warm_store_stats
+
+load_dotenv()  # Loads OPENAI_API_KEY from .env
+
+app = Quart(__name__)
+app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret")
+warm_store()  # map the prebuilt ideas before the first request
+
+
+@app.before_request
+async def _start_timer():
+    g.request_start = time.perf_counter()
+    g.trace = start_trace(f"{request.method} {request.path}")
+    if request.endpoint == "index" and request.method == "POST":
+        mode = requested_mode(
+            request.headers.get("X-Profile") or request.args.get("profile"), _admin_token()
+        )
+        # Both profilers see everything else on the loop meanwhile, not just this request
+        g.profile = start_profile(mode) if mode else None
+
+
+@app.after_request
+async def _observe_request(response):
+    start = g.get("request_start")
+    if start is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - start, request.endpoint or "-", request.method,
+                             response.status_code)
+    timing = end_trace(g.get("trace"))
+    if timing:
+        response.headers["Server-Timing"] = timing
+    profile = finish_profile(g.get("profile"))
+    if profile:
+        response.headers["X-Profile"] = profile
+    return response
+
+
+@app.teardown_request
+async def _end_trace(error=None):
+    end_trace(g.get("trace"))
+    finish_profile(g.get("profile"))
+
+
+def _replayed_headers():
+    return {k: v for k, v in request.headers.items() if k.lower() in ("cache-control", "accept")}
+
+
+def _admin_token():
+    return request.headers.get("X-Admin-Token") or request.args.get("admin_token")
+
+
+def _flag(values, name: str) -> bool:
+    return values.get(name, "").lower() in {"1", "true", "yes"}
+
+
+async def _streamed_sections(spec, no_cache):
+    trace = start_trace("POST / (streamed sections)")
+    try:
+        with cache_bypass(no_cache), request_deadline(REQUEST_BUDGET), traffic(group=spec["organizing_group"]):
+            async for name, section in aiter_plan(spec):
+                with span(f"{name}.render"):
+                    fragment = Markup(await render_template(f"_{name}.html", **{name: section}))
+                yield name, fragment
+    finally:
+        end_trace(trace)
+
+
+@app.route("/", methods=["GET", "POST"])
+async def index():
+    if request.method == "POST":
+        form = await request.form
+        spec = read_event_spec(form)
+        record_submission(request.path, request.query_string.decode(), _replayed_headers(), form.to_dict())
+        no_cache = (
+            "no-cache" in request.headers.get("Cache-Control", "")
+            or _flag(request.args, "nocache")
+            or _flag(form, "nocache")
+        )
+
+        streaming = PLAN_STREAMING or _flag(request.args, "stream") or _flag(form, "stream")
+        if streaming and g.get("profile") is None:
+            return Response(
+                await stream_template("results_stream.html", sections=_streamed_sections(spec, no_cache)),
+                headers={"X-Accel-Buffering": "no", "Cache-Control": "no-store"},
+            )
+
+        with cache_bypass(no_cache), request_deadline(REQUEST_BUDGET), traffic(group=spec["organizing_group"]):
+            plan = await agenerate_plan(spec)
+
+        with span("render"):
+            return await render_template(
+                "results.html",
+                invitations=plan["invitations"],
+                ideas=plan["ideas"],
+                timeline=plan["timeline"],
+            )
+
+    return await render_template("index.html")
+
+
+@app.route("/status")
+async def status():
+    breaker = breaker_status()
+    return jsonify({
+        "openai": breaker,
+        "degraded": breaker["state"] != "closed",
+        "connections": client_pool_stats(),
+        "usage": usage_stats(),
+        "cache": cache_stats(),
+        "semantic_cache": semantic_cache_stats(),
+        "warm_store": warm_store_stats(),
+        "coalescing": singleflight_stats(),
+        "timeouts": timeout_stats(),
+        "hedging": hedge_stats(),
+        "admission": admission_stats(),
+        "retries": retry_stats(),
+        "cassette": cassette_stats(),
+    })
+
+
+@app.route("/metrics")
+async def metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/profiles")
+async def admin_profiles():
+    if not authorized(_admin_token()):
+        abort(404)
+    return jsonify(list_profiles())
+
+
+@app.route("/admin/profiles/<name>")
+async def admin_profile(name):
+    path = profile_path(name) if authorized(_admin_token()) else None
+    if path is None:
+        abort(404)
+    return await send_file(path, mimetype="text/plain" if name.endswith(".folded") else "application/octet-stream",
+                           as_attachment=True, attachment_filename=name)
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,56 @@
+"""
+Plan a whole season of events from a JSONL file.
+
+    python batch.py events.jsonl -o plans.jsonl --concurrency 8
+
+Each input line is a JSON object with the same fields as the web form
+(event_type, guests, budget, location, organizing_group, event_date,
+event_time, venue, tone) plus an optional "id". Results are written as JSONL in
+input order; progress and throughput go to stderr.
+"""
+import argparse
+import json
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()  # Loads OPENAI_API_KEY from .env
+
+from core.batch import BatchProgress, run_batch  # noqa: E402
+
+
+def _report(progress: BatchProgress, stop: threading.Event, every: float) -> None:
+    while not stop.wait(every):
+        print(progress.summary(), file=sys.stderr, flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Plan many events from a JSONL file")
+    parser.add_argument("input", help="JSONL file of event specs ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="where to write result JSONL (default stdout)")
+    parser.add_argument("--concurrency", type=int, default=4, help="plans generated at once")
+    parser.add_argument("--mode", choices=["sections", "combined"], help="override PLAN_MODE")
+    parser.add_argument("--progress-every", type=float, default=2.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    progress = BatchProgress()
+    stop = threading.Event()
+    threading.Thread(target=_report, args=(progress, stop, args.progress_every), daemon=True).start()
+    try:
+        for result in run_batch(src, args.concurrency, args.mode, progress):
+            dst.write(json.dumps(result, ensure_ascii=False) + "\n")
+            dst.flush()
+    finally:
+        stop.set()
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    print(progress.summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
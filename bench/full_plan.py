@@ -0,0 +1,69 @@
+"""
+Compare the three-call plan path against the single-completion "combined" mode.
+
+    python -m bench.full_plan --runs 10
+
+Uses whatever OpenAI endpoint is configured (OPENAI_API_KEY / OPENAI_BASE_URL), so
+point it at a local stub for repeatable numbers. Reports wall time per plan and
+prompt / completion tokens per plan for each mode. Every plan runs under cache_bypass,
+so both modes make their live calls each time (sections mode would otherwise be
+answered from the response cache after the first run).
+"""
+import argparse
+import statistics
+import time
+
+from core.plan import generate_plan, read_event_spec
+from utils.cache import cache_bypass
+from utils.llm import reset_usage, usage_stats
+
+SAMPLE_SPEC = {
+    "event_type": "Block Party",
+    "guests": "50",
+    "budget": "Moderate",
+    "location": "Elm Street, Springfield",
+    "organizing_group": "Elm Street Neighbors",
+    "event_date": "2026-07-04",
+    "event_time": "16:00",
+    "venue": "Elm Street Park",
+    "tone": "festive",
+}
+
+
+def _run(mode: str, runs: int, concurrent: bool) -> dict:
+    spec = read_event_spec(SAMPLE_SPEC)
+    reset_usage()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with cache_bypass():
+            generate_plan(spec, concurrent=concurrent, mode=mode)
+        timings.append(time.perf_counter() - start)
+    usage = usage_stats()
+    return {
+        "mode": mode,
+        "p50_ms": statistics.median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+        "calls": sum(u["calls"] for u in usage.values()) / runs,
+        "prompt_tokens": sum(u["prompt_tokens"] for u in usage.values()) / runs,
+        "completion_tokens": sum(u["completion_tokens"] for u in usage.values()) / runs,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--sequential", action="store_true", help="don't fan the per-section calls out")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'p50 ms':>9} {'max ms':>9} {'calls':>6} {'prompt tok':>11} {'compl tok':>10}")
+    for mode in ("sections", "combined"):
+        r = _run(mode, args.runs, not args.sequential)
+        print(
+            f"{r['mode']:<10} {r['p50_ms']:>9.1f} {r['max_ms']:>9.1f} {r['calls']:>6.1f} "
+            f"{r['prompt_tokens']:>11.0f} {r['completion_tokens']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Offline load test of POST / against the OpenAI stub (bench/stub_openai.py).
+
+    python -m bench.load --concurrency 1 8 32 --requests 200
+    python -m bench.load --app asgi --latency uniform:0.3,1.2 --rate-limit 0.05 --json after.json --baseline before.json
+
+For each concurrency level this starts a fresh stub (same seed, so the same latencies and
+failures) and a fresh app process pointed at it with the disk cache off, drives it with
+distinct forms (nocache=1 unless --cache) and reports throughput, p50/p95/p99 latency, the share of model-backed
+sections served from their fallback and upstream calls per request (both read from the
+app's /metrics). Extra environment variables (OPENAI_STREAMING=0, HEDGE_ENABLED=1, ...)
+pass through to the app. --url tests an app that is already running instead, with
+whatever upstream it has; with several workers /metrics only shows the one that answered.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from bench.serving import _form as _serving_form, _percentile
+from bench.stub_openai import StubServer, add_stub_arguments, stub_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_COMMANDS = {
+    "wsgi": [sys.executable, "-m", "flask", "--app", "app", "run", "--port", "{port}", "--with-threads",
+             "--no-reload", "--no-debugger"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", "{port}", "--log-level", "warning"],
+}
+_CALLS = re.compile(r'^openai_calls_total\{section="([^"]*)",outcome="([^"]*)"\} (\S+)$', re.M)
+
+
+def _form(i: int, same: bool) -> dict:
+    form = _serving_form(i, same)
+    if not same:
+        # A distinct location too, so concurrent ideas calls don't coalesce into one
+        form["location"] = f"{i + 1} Elm Street, Springfield"
+    return form
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_app(command: list, port: int, overrides: Dict[str, str]) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({"CACHE_DB": "", "PLAN_JOBS": "0", "PLAN_STREAMING": "0", "METRICS_ENABLED": "1"})
+    env.update(overrides)
+    proc = subprocess.Popen([part.format(port=port) for part in command], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app exited: {proc.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/status", timeout=1).raise_for_status()
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("app did not come up within 30s")
+
+
+def _stop_app(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def _upstream_calls(base_url: str) -> Optional[Dict[str, float]]:
+    """openai_calls_total summed over sections, by outcome; None if /metrics is off."""
+    try:
+        resp = httpx.get(base_url.rstrip("/") + "/metrics", timeout=5)
+        resp.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    totals: Dict[str, float] = {}
+    for _, outcome, value in _CALLS.findall(resp.text):
+        totals[outcome] = totals.get(outcome, 0.0) + float(value)
+    return totals
+
+
+async def _drive(url: str, total: int, concurrency: int, offset: int, same_form: bool, timeout: float,
+                 params: dict) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(offset, offset + total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(url, data=_form(i, same_form), params=params)
+                    resp.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {"ok": len(latencies), "errors": errors, "elapsed": elapsed, "latencies": latencies}
+
+
+def run_level(url: str, concurrency: int, args) -> dict:
+    params = {} if args.cache else {"nocache": "1"}
+    if args.warmup:
+        asyncio.run(_drive(url, args.warmup, min(args.warmup, concurrency), 10_000_000, args.same_form,
+                           args.timeout, params))
+    before = _upstream_calls(url)
+    r = asyncio.run(_drive(url, args.requests, concurrency, 0, args.same_form, args.timeout, params))
+    after = _upstream_calls(url)
+    latencies = r["latencies"]
+    result = {
+        "concurrency": concurrency,
+        "ok": r["ok"],
+        "errors": r["errors"],
+        "rps": r["ok"] / r["elapsed"] if r["elapsed"] else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+    result.update(_call_rates(before, after, args.requests))
+    return result
+
+
+def _call_rates(before: Optional[dict], after: Optional[dict], requests: int) -> dict:
+    """Fallback rate and upstream calls per request between two /metrics readings."""
+    if before is None or after is None:
+        return {"fallback_rate": None, "calls_per_request": None}
+    delta = {k: after.get(k, 0.0) - before.get(k, 0.0) for k in after}
+    fallbacks = delta.get("fallback", 0.0)
+    # Sections that wanted the model: the ones it answered plus the ones that fell back
+    asked = delta.get("success", 0.0) + fallbacks
+    calls = sum(v for k, v in delta.items() if k not in ("fallback", "rejected"))
+    return {
+        "fallback_rate": fallbacks / asked if asked else 0.0,
+        "calls_per_request": calls / requests if requests else 0.0,
+    }
+
+
+def _level(concurrency: int, args) -> dict:
+    if args.url:
+        return run_level(args.url, concurrency, args)
+    stub = StubServer(stub_config(args)).start()
+    port = _free_port()
+    app = _start_app(APP_COMMANDS[args.app], port, {
+        "OPENAI_BASE_URL": stub.base_url,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "bench",
+        "WARM_STORE": "",
+    })
+    try:
+        result = run_level(f"http://127.0.0.1:{port}/", concurrency, args)
+        result["stub"] = dict(stub.state.counts)
+        return result
+    finally:
+        _stop_app(app)
+        stub.stop()
+
+
+def _pct(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1%}"
+
+
+def _delta(now: float, then: Optional[float]) -> str:
+    if not then:
+        return ""
+    return f" ({(now - then) / then:+.0%})"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--app", choices=sorted(APP_COMMANDS), default="wsgi", help="app to start for each level")
+    parser.add_argument("--url", help="drive this running app instead of starting the stub and an app")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests first (connections, imports)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--same-form", action="store_true", help="post one form throughout (coalescing)")
+    parser.add_argument("--cache", action="store_true", help="let the caches answer (posts nocache=1 otherwise)")
+    parser.add_argument("--json", help="write the results here, e.g. as a baseline for later runs")
+    parser.add_argument("--baseline", help="results of an earlier --json run to compare req/s and p95 with")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {r["concurrency"]: r for r in json.load(f)["levels"]}
+
+    target = args.url or f"{args.app} app, stub latency {args.latency}"
+    print(f"{target}, {args.requests} requests per level")
+    print(f"{'conc':>5} {'ok':>6} {'err':>5} {'req/s':>14} {'p50 ms':>8} {'p95 ms':>14} {'p99 ms':>8} "
+          f"{'fallback':>9} {'calls/req':>10}")
+    results = []
+    for concurrency in args.concurrency:
+        r = _level(concurrency, args)
+        results.append(r)
+        base = baseline.get(concurrency, {})
+        rps = f"{r['rps']:.1f}{_delta(r['rps'], base.get('rps'))}"
+        p95 = f"{r['p95_ms']:.0f}{_delta(r['p95_ms'], base.get('p95_ms'))}"
+        calls = "-" if r["calls_per_request"] is None else f"{r['calls_per_request']:.2f}"
+        print(f"{concurrency:>5} {r['ok']:>6} {r['errors']:>5} {rps:>14} {r['p50_ms']:>8.0f} {p95:>14} "
+              f"{r['p99_ms']:>8.0f} {_pct(r['fallback_rate']):>9} {calls:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+                       "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Re-run recorded plan submissions against completions replayed from the same cassette.
+
+    CASSETTE_MODE=record gunicorn -w 4 app:app          # a day of real traffic into plan_cassette.sqlite3
+    python -m bench.replay plan_cassette.sqlite3 --concurrency 16
+    python -m bench.replay plan_cassette.sqlite3 --speed 60 --no-latency --json after.json --baseline before.json
+
+Starts the app with CASSETTE_MODE=replay (no network, no API key needed) and posts every
+recorded form again in its recorded order, with its query string and Cache-Control header:
+--concurrency at a time, or at the recorded arrival times sped up --speed times. Each
+completion is answered with its recorded bytes, chunk by chunk at the recorded offsets
+unless --no-latency. Replays are only exact for the settings they were recorded with
+(OPENAI_STREAMING, PLAN_MODE, TIMELINE_LLM, which work the caches absorb); calls the
+cassette has no answer for are reported as misses and fall back.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import List
+
+import httpx
+
+from bench.load import APP_COMMANDS, _call_rates, _delta, _free_port, _pct, _start_app, _stop_app, _upstream_calls
+from bench.serving import _percentile
+from utils.cassette import CassetteStore
+
+
+async def _post(client: httpx.AsyncClient, url: str, submission: dict) -> float:
+    start = time.perf_counter()
+    resp = await client.post(url + submission["path"].lstrip("/"), params=submission["query"] or None,
+                             data=submission["form"], headers=submission["headers"])
+    resp.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def _drive(url: str, submissions: List[dict], concurrency: int, speed: float, timeout: float) -> dict:
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=max(concurrency, 100), max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def one(submission):
+            nonlocal errors
+            try:
+                latencies.append(await _post(client, url, submission))
+            except httpx.HTTPError:
+                errors += 1
+
+        start = time.perf_counter()
+        if speed:
+            # Open loop: each form at its recorded offset from the first, compressed by speed
+            first = submissions[0]["started"] if submissions else 0.0
+
+            async def paced(submission):
+                await asyncio.sleep(max(0.0, start + (submission["started"] - first) / speed - time.perf_counter()))
+                await one(submission)
+
+            await asyncio.gather(*(paced(s) for s in submissions))
+        else:
+            queue = iter(submissions)
+
+            async def worker():
+                for submission in queue:
+                    await one(submission)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {"ok": len(latencies), "errors": errors, "elapsed": elapsed, "latencies": latencies}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("cassette", help="file recorded with CASSETTE_MODE=record")
+    parser.add_argument("--app", choices=sorted(APP_COMMANDS), default="wsgi")
+    parser.add_argument("--concurrency", type=int, default=8, help="forms in flight at once (closed loop)")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="post at the recorded arrival times, this many times faster (0: closed loop)")
+    parser.add_argument("--no-latency", action="store_true", help="answer completions at once")
+    parser.add_argument("--limit", type=int, default=0, help="only the first N submissions")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="write the result here, e.g. as a baseline for later runs")
+    parser.add_argument("--baseline", help="result of an earlier --json run to compare req/s and p95 with")
+    args = parser.parse_args()
+
+    cassette = os.path.abspath(args.cassette)
+    if not os.path.exists(cassette):
+        parser.error(f"no cassette at {cassette}")
+    submissions = CassetteStore(cassette).submissions()
+    if args.limit:
+        submissions = submissions[:args.limit]
+    if not submissions:
+        parser.error("the cassette holds no plan submissions")
+
+    port = _free_port()
+    app = _start_app(APP_COMMANDS[args.app], port, {
+        "CASSETTE_MODE": "replay",
+        "CASSETTE_FILE": cassette,
+        "CASSETTE_LATENCY": "0" if args.no_latency else "1",
+    })
+    url = f"http://127.0.0.1:{port}/"
+    try:
+        before = _upstream_calls(url)
+        r = asyncio.run(_drive(url, submissions, args.concurrency, args.speed, args.timeout))
+        after = _upstream_calls(url)
+        replayed = httpx.get(url + "status", timeout=5).json().get("cassette") or {}
+    finally:
+        _stop_app(app)
+
+    latencies = r["latencies"]
+    result = {
+        "submissions": len(submissions),
+        "ok": r["ok"],
+        "errors": r["errors"],
+        "rps": r["ok"] / r["elapsed"] if r["elapsed"] else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        **_call_rates(before, after, len(submissions)),
+        "cassette": {k: replayed.get(k, 0) for k in ("served", "repeated", "misses")},
+    }
+    base = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)["result"]
+
+    pace = f"{args.speed:g}x recorded pace" if args.speed else f"concurrency {args.concurrency}"
+    print(f"{len(submissions)} submissions, {args.app} app, {pace}, "
+          f"{'no latency' if args.no_latency else 'recorded latency'}")
+    print(f"{'ok':>6} {'err':>5} {'req/s':>14} {'p50 ms':>8} {'p95 ms':>14} {'p99 ms':>8} {'fallback':>9} "
+          f"{'calls/req':>10} {'served':>7} {'repeated':>9} {'misses':>7}")
+    rps = f"{result['rps']:.1f}{_delta(result['rps'], base.get('rps'))}"
+    p95 = f"{result['p95_ms']:.0f}{_delta(result['p95_ms'], base.get('p95_ms'))}"
+    calls = "-" if result["calls_per_request"] is None else f"{result['calls_per_request']:.2f}"
+    c = result["cassette"]
+    print(f"{result['ok']:>6} {result['errors']:>5} {rps:>14} {result['p50_ms']:>8.0f} {p95:>14} "
+          f"{result['p99_ms']:>8.0f} {_pct(result['fallback_rate']):>9} {calls:>10} "
+          f"{c['served']:>7} {c['repeated']:>9} {c['misses']:>7}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+                       "result": result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Hit rate and lookup latency of the near-duplicate ideas cache (utils/semcache.py) at a given size.
+
+    python -m bench.semantic_cache --sizes 10000 100000
+
+Fills a SimilarityCache with synthetic events (event type + street + guests), then looks up
+rewordings of stored events (case, abbreviations, punctuation, a few guests more or less),
+which should hit, and events on streets that were never stored, which should miss.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from utils.config import SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_GUEST_RATIO, SEMANTIC_CACHE_THRESHOLD
+from utils.semcache import SimilarityCache
+
+EVENT_TYPES = ("Block Party", "Cultural Fair", "Talent Show", "Potluck", "Cleanup Drive")
+BUDGETS = ("Shoestring", "Moderate", "Premium")
+STREET_WORDS = (
+    "Elm", "Oak", "Maple", "Pine", "Cedar", "Birch", "Willow", "Aspen", "Chestnut", "Walnut", "Cherry", "Spruce",
+    "Hickory", "Magnolia", "Poplar", "Sycamore", "Juniper", "Laurel", "Hawthorn", "Linden", "Alder", "Cypress",
+    "Lake", "River", "Hill", "Park", "Spring", "Meadow", "Forest", "Valley", "Ridge", "Sunset", "Highland",
+    "Washington", "Lincoln", "Jefferson", "Madison", "Franklin", "Jackson", "Adams", "Monroe", "Grant",
+    "Church", "Mill", "School", "Market", "Bridge", "Union", "Center", "Prospect", "Broad", "Water",
+)
+SUFFIXES = (("St", "Street"), ("Ave", "Avenue"), ("Rd", "Road"), ("Dr", "Drive"), ("Ln", "Lane"),
+            ("Ct", "Court"), ("Blvd", "Boulevard"), ("Pl", "Place"))
+CITIES = ("Springfield", "Riverside", "Fairview", "Greenville", "Franklin", "Clinton", "Salem", "Madison")
+
+
+def _street(rng, numbered: range) -> tuple:
+    word = rng.choice(STREET_WORDS)
+    short, long_ = rng.choice(SUFFIXES)
+    return f"{rng.choice(numbered)} {word}", short, long_, rng.choice(CITIES)
+
+
+def _stored(rng, n: int):
+    seen = set()
+    while len(seen) < n:
+        number_word, short, long_, city = _street(rng, range(1, 400))
+        event_type, budget = rng.choice(EVENT_TYPES), rng.choice(BUDGETS)
+        key = (event_type, number_word, short, city, budget)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield key + (long_, rng.randint(10, 300))
+
+
+def _reworded(rng, event_type, number_word, short, city, budget, long_, guests):
+    event_type = rng.choice((event_type, event_type.lower(), event_type.upper(), event_type.replace(" ", "-")))
+    suffix = rng.choice((short, long_, short + "."))
+    sep = rng.choice((", ", " ", " - "))
+    text = f"{event_type} {number_word} {suffix}{sep}{city}"
+    return text, budget, max(1, round(guests * rng.uniform(0.9, 1.1)))
+
+
+def _run(size: int, queries: int, dim: int, threshold: float, ratio: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    cache = SimilarityCache(size, dim, threshold, ratio, ttl=3600)
+    stored = list(_stored(rng, size))
+    start = time.perf_counter()
+    for event_type, number_word, short, city, budget, long_, guests in stored:
+        cache.set(f"{event_type} {number_word} {short}, {city}", {"Themes": [number_word]}, budget, guests)
+    insert_s = time.perf_counter() - start
+
+    def lookup(text, budget, guests):
+        t = time.perf_counter()
+        hit = cache.get(text, budget, guests)
+        return hit, time.perf_counter() - t
+
+    timings, dup_hits, false_hits = [], 0, 0
+    for _ in range(queries):
+        entry = rng.choice(stored)
+        hit, elapsed = lookup(*_reworded(rng, *entry))
+        timings.append(elapsed)
+        dup_hits += hit is not None and hit[0]["Themes"] == [entry[1]]
+    for _ in range(queries):
+        # Numbers above 400 and a fresh city never occur in the stored set
+        number_word, short, _, _ = _street(rng, range(400, 900))
+        hit, elapsed = lookup(f"{rng.choice(EVENT_TYPES)} {number_word} {short}, Lakewood",
+                              rng.choice(BUDGETS), rng.randint(10, 300))
+        timings.append(elapsed)
+        false_hits += hit is not None
+
+    timings.sort()
+    return {
+        "size": size,
+        "matrix_mb": size * dim * 4 / 2 ** 20,
+        "insert_us": insert_s / size * 1e6,
+        "dup_hit_rate": dup_hits / queries,
+        "false_hit_rate": false_hits / queries,
+        "p50_ms": statistics.median(timings) * 1000,
+        "p99_ms": timings[int(len(timings) * 0.99) - 1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=1000, help="near-duplicate and novel lookups each")
+    parser.add_argument("--dim", type=int, default=SEMANTIC_CACHE_DIM)
+    parser.add_argument("--threshold", type=float, default=SEMANTIC_CACHE_THRESHOLD)
+    parser.add_argument("--guest-ratio", type=float, default=SEMANTIC_CACHE_GUEST_RATIO)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"dim={args.dim} threshold={args.threshold} guest ratio={args.guest_ratio}")
+    print(f"{'entries':>8} {'matrix MB':>10} {'insert us':>10} {'dup hits':>9} {'false hits':>11} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for size in args.sizes:
+        r = _run(size, args.queries, args.dim, args.threshold, args.guest_ratio, args.seed)
+        print(
+            f"{r['size']:>8} {r['matrix_mb']:>10.1f} {r['insert_us']:>10.1f} {r['dup_hit_rate']:>9.1%} "
+            f"{r['false_hit_rate']:>11.1%} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Load comparison between the WSGI app (app.py) and the ASGI app (asgi_app.py).
+
+Start both against the same upstream (a local stub keeps numbers repeatable), e.g.
+    gunicorn -w 1 --threads 8 -b 127.0.0.1:8001 app:app
+    uvicorn asgi_app:app --workers 1 --port 8002
+then drive them with the same load:
+    python -m bench.serving --url http://127.0.0.1:8001/ --url http://127.0.0.1:8002/ --concurrency 200
+
+Every request posts a slightly different form (so the caches and request
+coalescing don't hide the upstream) unless --same-form is given.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+BASE_FORM = {
+    "event_type": "Block Party",
+    "guests": "50",
+    "budget": "Moderate",
+    "location": "Elm Street, Springfield",
+    "organizing_group": "Elm Street Neighbors",
+    "event_time": "16:00",
+    "venue": "Elm Street Park",
+    "tone": "festive",
+}
+
+
+def _form(i: int, same: bool) -> dict:
+    form = dict(BASE_FORM)
+    # A distinct date per request defeats caching and coalescing of every section
+    form["event_date"] = "2026-07-04" if same else f"20{27 + i // 365 % 70}-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+    return form
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def drive(url: str, total: int, concurrency: int, same_form: bool, timeout: float) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(url, data=_form(i, same_form))
+                    resp.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "url": url,
+        "ok": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.fmean(latencies) * 1000) if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare plan throughput of the WSGI and ASGI apps")
+    parser.add_argument("--url", action="append", required=True, help="app base URL; repeat to compare")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--same-form", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'url':<32} {'ok':>6} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for url in args.url:
+        r = asyncio.run(drive(url, args.requests, args.concurrency, args.same_form, args.timeout))
+        print(
+            f"{r['url']:<32} {r['ok']:>6} {r['errors']:>5} {r['rps']:>8.1f} "
+            f"{r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['p99_ms']:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
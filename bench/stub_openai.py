@@ -0,0 +1,343 @@
+"""
+A local stand-in for the OpenAI chat-completions API, for benchmarks that cost nothing and
+don't inherit OpenAI's latency swings.
+
+    python -m bench.stub_openai --port 8765 --latency lognormal:0.8,0.35 --error-rate 0.01 --rate-limit 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python app.py
+
+Answers POST /v1/chat/completions (plain and streamed) with JSON shaped like the ideas,
+invitations, timeline and combined-plan prompts ask for; the timeline echoes the draft's
+periods so it passes the app's checks. Latency is drawn from --latency, and a share of
+calls fail with a 500, a 429 (with retry-after-ms) or malformed JSON. Every draw comes from
+a generator seeded with --seed and the request itself (plus how many times that request was
+seen), so the same traffic gets the same latencies and failures whatever order it arrives in.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+THEMES = (
+    "Around-the-world potluck", "Retro street fair", "Garden party", "Games night under the lights",
+    "Neighborhood talent showcase", "Harvest festival", "Family picnic", "Music on the block",
+    "Cultural sharing circle", "Sustainability fair",
+)
+FOODS = (
+    "Build-your-own taco bar", "Potluck dessert table", "Grilled veggie skewers", "Lemonade stand run by kids",
+    "Community chili cook-off", "Fruit and cheese platters", "Pizza from a local shop", "Ice cream social",
+    "Dishes from neighbors' home countries", "Bake sale for a local cause",
+)
+ACTIVITIES = (
+    "Sidewalk chalk art", "Three-legged races", "Live music by neighbors", "Book swap", "Plant swap",
+    "Face painting", "Trivia about the neighborhood", "Group photo", "Street cleanup walk", "Story corner",
+)
+TASKS = (
+    "Confirm the venue booking", "Send reminders to volunteers", "Buy paper goods and ice",
+    "Check the weather forecast", "Set up tables and signs", "Post the flyer on the community board",
+    "Collect RSVPs", "Arrange extra seating", "Prepare a cleanup kit", "Test the speaker and music",
+    "Assign greeters at the entrance", "Share the schedule with helpers",
+)
+TONES = ("Join us", "You're invited", "Save the date", "Come celebrate")
+
+
+def latency_dist(spec: str) -> Callable[[random.Random], float]:
+    """
+    Seconds per call from "const:S", "uniform:LO,HI", "normal:MEAN,SD", "lognormal:MEDIAN,SIGMA"
+    or "exp:MEAN"; a bare number means const.
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "const", kind
+    try:
+        values = [float(v) for v in args.split(",")]
+        if kind == "const":
+            (s,) = values
+            return lambda rng: s
+        if kind == "uniform":
+            lo, hi = values
+            return lambda rng: rng.uniform(lo, hi)
+        if kind == "normal":
+            mean, sd = values
+            return lambda rng: max(0.0, rng.gauss(mean, sd))
+        if kind == "lognormal":
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(math.log(median), sigma)
+        if kind == "exp":
+            (mean,) = values
+            return lambda rng: rng.expovariate(1 / mean)
+    except (ValueError, ZeroDivisionError):
+        pass
+    raise ValueError(f"bad latency spec {spec!r}")
+
+
+def _pick(rng: random.Random, pool: tuple, n: int) -> list:
+    return rng.sample(pool, min(n, len(pool)))
+
+
+def _ideas(rng: random.Random) -> dict:
+    return {"Themes": _pick(rng, THEMES, 6), "Food": _pick(rng, FOODS, 6), "Activities": _pick(rng, ACTIVITIES, 6)}
+
+
+def _invitations(rng: random.Random) -> list:
+    return [
+        {
+            "title": f"{rng.choice(TONES)}!",
+            "body": f"Dear neighbors, {rng.choice(THEMES).lower()} is coming to our street. "
+                    f"Expect {rng.choice(FOODS).lower()} and {rng.choice(ACTIVITIES).lower()}. "
+                    "Everyone is welcome, bring family and friends.",
+        }
+        for _ in range(3)
+    ]
+
+
+def _timeline(rng: random.Random, user: str) -> list:
+    match = re.search(r"Draft timeline: (\[.*\])", user)
+    try:
+        periods = [block["period"] for block in json.loads(match.group(1))]
+    except (AttributeError, ValueError, KeyError, TypeError):
+        periods = ["4 weeks before", "1 week before", "Day of"]
+    return [{"period": period, "tasks": _pick(rng, TASKS, rng.randint(3, 5))} for period in periods]
+
+
+def canned_content(system: str, user: str, rng: random.Random) -> dict:
+    """The JSON object the app's prompt for this call asks for, told apart by its system prompt."""
+    if "key 'timeline'" in system:
+        return {"timeline": _timeline(rng, user)}
+    if "two keys: ideas, invitations" in system:
+        return {"ideas": _ideas(rng), "invitations": _invitations(rng)}
+    if "key 'invitations'" in system:
+        return {"invitations": _invitations(rng)}
+    if "Themes, Food, Activities" in system:
+        return _ideas(rng)
+    return {}
+
+
+class StubConfig:
+    def __init__(self, latency: str = "const:0.2", error_rate: float = 0.0, rate_limit: float = 0.0,
+                 malformed_rate: float = 0.0, rpm: int = 0, retry_after_ms: int = 200, ttft_share: float = 0.3,
+                 seed: int = 7):
+        self.latency = latency_dist(latency)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.malformed_rate = malformed_rate
+        self.rpm = rpm
+        self.retry_after_ms = retry_after_ms
+        self.ttft_share = ttft_share  # share of the latency before the first streamed chunk
+        self.seed = seed
+
+
+class StubState:
+    """Per-server counters, the seen-count of each request (for its seed) and the RPM window."""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.seen: Dict[str, int] = {}
+        self.window: deque = deque()
+        self.counts = {"requests": 0, "ok": 0, "server_error": 0, "rate_limited": 0, "malformed": 0}
+
+    def rng_for(self, body: bytes) -> random.Random:
+        digest = hashlib.sha1(body).hexdigest()
+        with self.lock:
+            n = self.seen[digest] = self.seen.get(digest, -1) + 1
+        return random.Random(f"{self.config.seed}:{digest}:{n}")
+
+    def over_rpm(self) -> bool:
+        if not self.config.rpm:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            while self.window and now - self.window[0] > 60:
+                self.window.popleft()
+            if len(self.window) >= self.config.rpm:
+                return True
+            self.window.append(now)
+            return False
+
+    def count(self, what: str) -> None:
+        with self.lock:
+            self.counts[what] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        out = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "bench"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            with self.state.lock:
+                self._json(200, dict(self.state.counts))
+        else:
+            self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        state, config = self.state, self.state.config
+        state.count("requests")
+        try:
+            body = json.loads(raw)
+            messages = body["messages"]
+        except (ValueError, KeyError, TypeError):
+            self._json(400, {"error": {"message": "malformed request", "type": "invalid_request_error"}})
+            return
+        rng = state.rng_for(raw)
+        latency = config.latency(rng)
+        roll = rng.random()
+
+        if state.over_rpm() or roll < config.rate_limit:
+            state.count("rate_limited")
+            time.sleep(min(latency, 0.05))
+            self._json(429, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error",
+                                       "code": "rate_limit_exceeded"}},
+                       {"retry-after-ms": str(config.retry_after_ms)})
+            return
+        if roll < config.rate_limit + config.error_rate:
+            state.count("server_error")
+            time.sleep(latency)
+            self._json(500, {"error": {"message": "Internal error (stub)", "type": "server_error"}})
+            return
+
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+        content = json.dumps(canned_content(system, user, rng))
+        if roll < config.rate_limit + config.error_rate + config.malformed_rate:
+            state.count("malformed")
+            content = content[: len(content) // 2]  # cut off mid-object
+        else:
+            state.count("ok")
+        usage = {
+            "prompt_tokens": (len(system) + len(user)) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (len(system) + len(user) + len(content)) // 4,
+        }
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            self._stream(content, usage, model, latency)
+            return
+        time.sleep(latency)
+        self._json(200, {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, content: str, usage: dict, model: str, latency: float) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(payload) -> None:
+            data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode()) + b"\n\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        # About four characters per token, a few tokens per chunk, spread over the rest of the latency
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        first = latency * self.state.config.ttft_share
+        gap = (latency - first) / len(pieces)
+        time.sleep(first)
+        try:
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(gap)
+                send({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                      "model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+            send({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                  "model": model, "choices": [], "usage": usage})
+            send(b"[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client hung up early (streamed JSON already had everything it keeps)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)  # clients hanging up is business as usual
+
+
+class StubServer:
+    """The stub on a background thread, for harnesses that run it in-process (bench/load.py)."""
+
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+        handler = type("Handler", (_Handler,), {"state": StubState(config)})
+        self.httpd = _Server((host, port), handler)
+        self.state = handler.state
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="openai-stub", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="lognormal:0.8,0.35",
+                        help="const:S, uniform:LO,HI, normal:MEAN,SD, lognormal:MEDIAN,SIGMA or exp:MEAN (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with a 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of calls answered with a 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of calls with truncated JSON")
+    parser.add_argument("--rpm", type=int, default=0, help="429 everything past this many calls a minute (0: no cap)")
+    parser.add_argument("--retry-after-ms", type=int, default=200)
+    parser.add_argument("--ttft-share", type=float, default=0.3, help="share of latency before the first chunk")
+    parser.add_argument("--seed", type=int, default=7)
+
+
+def stub_config(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(args.latency, args.error_rate, args.rate_limit, args.malformed_rate, args.rpm,
+                      args.retry_after_ms, args.ttft_share, args.seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubServer(stub_config(args), args.host, args.port)
+    print(f"OpenAI stub on {server.base_url} (GET {server.base_url}/stats for counts)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
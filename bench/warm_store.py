@@ -0,0 +1,123 @@
+"""
+Load time, resident memory and lookup latency of the memory-mapped warm store.
+
+    python -m bench.warm_store --entries 105 10000 100000
+    python -m bench.warm_store --store plan_warm.bin
+
+Writes a synthetic store of each size (ideas-sized values) to a temp file, then in a fresh
+child process per size measures opening it, the RSS it adds, and lookups; the same data
+loaded with json.load is measured alongside for comparison. --store measures an existing file.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from utils.warmstore import WarmStore, write_store
+
+
+def _rss_kib() -> tuple:
+    """(private, file-backed) resident KiB; file-backed pages of the store are shared by all workers."""
+    rss = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                rss[line.split(":")[0]] = int(line.split()[1])
+    return rss.get("RssAnon", 0), rss.get("RssFile", 0)
+
+
+def _delta(before: tuple) -> tuple:
+    return tuple(now - then for now, then in zip(_rss_kib(), before))
+
+
+def _value(i: int) -> dict:
+    return {
+        "Themes": [f"Theme idea {i}-{k} for the neighborhood" for k in range(6)],
+        "Food": [f"Food idea {i}-{k} everyone can share" for k in range(6)],
+        "Activities": [f"Activity idea {i}-{k} for all ages" for k in range(6)],
+    }
+
+
+def _measure_store(path: str, keys: list, out) -> None:
+    rss0 = _rss_kib()
+    start = time.perf_counter()
+    store = WarmStore(path)
+    load_ms = (time.perf_counter() - start) * 1000
+    rss_open = _delta(rss0)
+    timings = []
+    for parts in keys:
+        t = time.perf_counter()
+        store.get("ideas", *parts)
+        timings.append(time.perf_counter() - t)
+    out.put({
+        "load_ms": load_ms,
+        "rss_open_kib": rss_open,
+        "rss_after_kib": _delta(rss0),
+        "lookup_us": statistics.median(timings) * 1e6 if timings else 0.0,
+        "entries": len(store),
+        "file_kib": store.size_bytes / 1024,
+    })
+
+
+def _measure_json(path: str, out) -> None:
+    rss0 = _rss_kib()
+    start = time.perf_counter()
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    load_ms = (time.perf_counter() - start) * 1000
+    out.put({"load_ms": load_ms, "rss_kib": _delta(rss0), "entries": len(data)})
+
+
+def _in_child(target, *args) -> dict:
+    # A fresh process per measurement so RSS isn't muddied by earlier runs
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    proc = ctx.Process(target=target, args=args + (out,))
+    proc.start()
+    result = out.get()
+    proc.join()
+    return result
+
+
+def _kib(pair: tuple) -> str:
+    return f"{pair[0]} / {pair[1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[105, 10_000, 100_000])
+    parser.add_argument("--store", help="measure this store file instead of synthetic ones")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    # RSS columns are "private / file-backed" KiB added by opening the store and by the lookups after it
+    print(f"{'entries':>8} {'file KiB':>9} {'load ms':>8} {'RSS open':>14} {'RSS used':>14} "
+          f"{'lookup us':>10} {'json.load ms':>13} {'json RSS':>14}")
+    if args.store:
+        r = _in_child(_measure_store, args.store, [])
+        print(f"{r['entries']:>8} {r['file_kib']:>9.0f} {r['load_ms']:>8.3f} {_kib(r['rss_open_kib']):>14} "
+              f"{'-':>14} {'-':>10} {'-':>13} {'-':>14}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.entries:
+            keys = [("block party", f"<={i % 7}", "moderate", f"street {i}") for i in range(n)]
+            store_path = os.path.join(tmp, f"warm{n}.bin")
+            write_store(store_path, (("ideas", k, _value(i)) for i, k in enumerate(keys)))
+            json_path = os.path.join(tmp, f"warm{n}.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"|".join(k): _value(i) for i, k in enumerate(keys)}, f)
+
+            sample = [keys[(i * 7919) % n] for i in range(min(args.lookups, n))]
+            r = _in_child(_measure_store, store_path, sample)
+            j = _in_child(_measure_json, json_path)
+            print(f"{n:>8} {r['file_kib']:>9.0f} {r['load_ms']:>8.3f} {_kib(r['rss_open_kib']):>14} "
+                  f"{_kib(r['rss_after_kib']):>14} {r['lookup_us']:>10.1f} {j['load_ms']:>13.1f} "
+                  f"{_kib(j['rss_kib']):>14}")
+
+
+if __name__ == "__main__":
+    main()
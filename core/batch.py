@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional
+
+from core.plan import generate_plan, read_event_spec
+from utils.admission import BULK, traffic
+from utils.cache import make_key, normalize_text
+
+
+class BatchProgress:
+    """Counters for a running batch; safe to read from another thread."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.done = 0
+        self.deduped = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def bump(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.done}/{self.read} plans, {self.rate:.2f} plans/s, "
+            f"{self.deduped} deduped, {self.errors} errors, {self.elapsed:.1f}s"
+        )
+
+
+def spec_key(spec: Dict) -> str:
+    """
+    Specs that normalize to the same key get one generation. Unlike the ideas cache, the exact
+    guest count is part of the key: the timeline and the combined plan prompt quote it.
+    """
+    return make_key(
+        "spec",
+        *(int(v) if k == "guests" else normalize_text(v) for k, v in sorted(spec.items())),
+    )
+
+
+def _bulk_plan(spec: Dict, **kwargs) -> Dict:
+    # Batch plans queue behind interactive requests for upstream slots, fairly per organizing group
+    with traffic(BULK, spec["organizing_group"]):
+        return generate_plan(spec, **kwargs)
+
+
+def _parse_line(line: str) -> Dict:
+    raw = json.loads(line)
+    if not isinstance(raw, dict):
+        raise ValueError("each line must be a JSON object of event fields")
+    return raw
+
+
+def run_batch(
+    lines: Iterable[str],
+    concurrency: int = 4,
+    mode: Optional[str] = None,
+    progress: Optional[BatchProgress] = None,
+) -> Iterator[Dict]:
+    """
+    Plan every event spec in a JSONL stream and yield one result record per input line,
+    in input order, as soon as that line (and all lines before it) are done.
+
+    Record: {"line": n, "id": <spec id if given>, "spec": {...}, "plan": {...}}
+            or {"line": n, "error": "..."} for lines that can't be read.
+
+    At most `concurrency` plans are generated at once; each plan runs its sections one
+    after another, so that is also the number of upstream calls in flight. Identical
+    specs (after normalization) share a single generation.
+    """
+    progress = progress or BatchProgress()
+    window = max(1, concurrency) * 4  # lines read ahead of the oldest unfinished one
+    kwargs = {"concurrent": False}
+    if mode:
+        kwargs["mode"] = mode
+
+    pending: deque = deque()
+    by_key: Dict[str, Future] = {}
+
+    def record(n: int, raw: Dict, spec: Dict, future: Future) -> Dict:
+        plan = future.result()
+        progress.bump("done")
+        out = {"line": n, "spec": spec, "plan": plan}
+        if "id" in raw:
+            out["id"] = raw["id"]
+        return out
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as pool:
+        for n, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            progress.bump("read")
+            try:
+                raw = _parse_line(line)
+                spec = read_event_spec(raw)
+            except (ValueError, TypeError) as e:
+                progress.bump("errors")
+                pending.append((n, None, None, e))
+            else:
+                key = spec_key(spec)
+                future = by_key.get(key)
+                if future is None:
+                    future = by_key[key] = pool.submit(_bulk_plan, spec, **kwargs)
+                else:
+                    progress.bump("deduped")
+                pending.append((n, raw, spec, future))
+
+            while pending and (len(pending) >= window or _ready(pending[0])):
+                yield _emit(pending.popleft(), record, progress)
+
+        while pending:
+            yield _emit(pending.popleft(), record, progress)
+
+
+def _ready(item) -> bool:
+    future = item[3]
+    return not isinstance(future, Future) or future.done()
+
+
+def _emit(item, record, progress: BatchProgress) -> Dict:
+    n, raw, spec, future = item
+    if not isinstance(future, Future):
+        return {"line": n, "error": str(future)}
+    try:
+        return record(n, raw, spec, future)
+    except Exception as e:
+        progress.bump("errors")
+        return {"line": n, "error": f"generation failed: {e}"}
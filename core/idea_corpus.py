@@ -0,0 +1,437 @@
+import functools
+import random
+import zlib
+from datetime import date, datetime
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from core.timeline_rules import _event_kind
+from utils.cache import guest_bucket, normalize_text
+
+TIERS = {"shoestring": 0, "moderate": 1, "premium": 2}
+SIZES = ("small", "medium", "large")
+SEASONS = ("winter", "spring", "summer", "fall")
+CATEGORIES = ("Themes", "Food", "Activities")
+
+W, SP, SU, FA = "winter", "spring", "summer", "fall"
+SMALL, MEDIUM, LARGE = "small", "medium", "large"
+
+
+class Idea(NamedTuple):
+    text: str
+    family: str                        # at most one idea per family in a result
+    form: str                          # and at most MAX_PER_FORM per format
+    kinds: Optional[FrozenSet[str]]    # None = fits every event kind
+    tier: int                          # cheapest budget tier it works for
+    sizes: Optional[FrozenSet[str]]    # None = any guest count
+    seasons: Optional[FrozenSet[str]]  # None = all year
+
+
+def _tags(values) -> Optional[FrozenSet[str]]:
+    return frozenset(values) if values else None
+
+
+# ---- themes: motif x format ----
+
+NOT_CLEANUP = ("block", "fair", "show", "potluck", "general")
+
+# (motif, seasons, tier, kinds the motif suits)
+THEME_MOTIFS = (
+    ("Harvest Moon", (FA,), 0, None), ("Pumpkin Patch", (FA,), 0, None), ("Apple Orchard", (FA,), 0, None),
+    ("Oktoberfest", (FA,), 1, NOT_CLEANUP), ("Day of the Dead", (FA,), 1, NOT_CLEANUP),
+    ("Autumn Leaves", (FA,), 0, None), ("Diwali Lights", (FA,), 1, NOT_CLEANUP),
+    ("Sweater Weather", (FA, W), 0, NOT_CLEANUP), ("Winter Wonderland", (W,), 1, NOT_CLEANUP),
+    ("Snowflake", (W,), 0, NOT_CLEANUP), ("Cocoa & Carols", (W,), 0, NOT_CLEANUP),
+    ("Lunar New Year", (W,), 1, NOT_CLEANUP), ("Festival of Lights", (W,), 1, NOT_CLEANUP),
+    ("Cozy Cabin", (W,), 0, NOT_CLEANUP), ("New Year's Countdown", (W,), 1, NOT_CLEANUP),
+    ("Ice Palace", (W,), 2, NOT_CLEANUP), ("Mardi Gras", (W,), 1, NOT_CLEANUP),
+    ("Spring Bloom", (SP,), 0, None), ("Cherry Blossom", (SP,), 1, NOT_CLEANUP), ("Earth Day", (SP,), 0, None),
+    ("Garden Party", (SP, SU), 1, NOT_CLEANUP), ("Kite Day", (SP,), 0, NOT_CLEANUP),
+    ("Nowruz", (SP,), 1, NOT_CLEANUP), ("Holi Colors", (SP,), 1, NOT_CLEANUP), ("Seed & Sprout", (SP,), 0, None),
+    ("Tropical Luau", (SU,), 1, NOT_CLEANUP), ("Beach Bash", (SU,), 0, NOT_CLEANUP),
+    ("Starry Night", (SU, FA), 0, NOT_CLEANUP), ("Independence Day", (SU,), 1, NOT_CLEANUP),
+    ("Ice Cream Social", (SU,), 0, NOT_CLEANUP), ("Midsummer", (SU,), 1, NOT_CLEANUP),
+    ("Splash Zone", (SU,), 0, NOT_CLEANUP), ("Sunset Jazz", (SU,), 2, NOT_CLEANUP),
+    ("Rainbow Pride", (SU,), 1, NOT_CLEANUP), ("Garden-to-Table", (SU,), 1, NOT_CLEANUP),
+    ("Camp-Out", (SU, FA), 0, NOT_CLEANUP), ("Farmers Market", (SP, SU, FA), 0, NOT_CLEANUP),
+    ("Around the World", (), 0, NOT_CLEANUP), ("Retro 80s", (), 0, NOT_CLEANUP),
+    ("Roaring Twenties", (), 2, NOT_CLEANUP), ("Carnival", (), 1, NOT_CLEANUP), ("Game Night", (), 0, NOT_CLEANUP),
+    ("Fiesta", (), 0, NOT_CLEANUP), ("Country Fair", (), 0, NOT_CLEANUP), ("Superheroes", (), 0, None),
+    ("Under the Sea", (), 0, NOT_CLEANUP), ("Movie Magic", (), 0, NOT_CLEANUP),
+    ("Neighborhood Olympics", (), 0, NOT_CLEANUP), ("Decades Dance", (), 1, NOT_CLEANUP),
+    ("Bollywood", (), 1, NOT_CLEANUP), ("Salsa Night", (), 1, NOT_CLEANUP), ("Folk & Fiddle", (), 0, NOT_CLEANUP),
+    ("Storybook", (), 0, NOT_CLEANUP), ("Space Explorers", (), 0, NOT_CLEANUP), ("Wild West", (), 0, NOT_CLEANUP),
+    ("Black & White Gala", (), 2, NOT_CLEANUP), ("Masquerade", (), 2, NOT_CLEANUP),
+    ("Heritage", (), 0, None), ("Unity", (), 0, None), ("Good Neighbor", (), 0, None),
+    ("Green Streets", (), 0, None), ("Rock 'n' Roll", (), 1, NOT_CLEANUP), ("Disco Fever", (), 1, NOT_CLEANUP),
+    ("Pirate Cove", (), 0, None), ("Dino Discovery", (), 0, NOT_CLEANUP), ("Art Walk", (), 1, NOT_CLEANUP),
+    ("Vintage", (), 1, NOT_CLEANUP), ("Trash to Treasure", (), 0, None), ("Bee & Butterfly", (SP, SU), 0, None),
+    ("Hanukkah Glow", (W,), 1, NOT_CLEANUP), ("Kwanzaa Harvest", (W,), 1, NOT_CLEANUP),
+    ("Snow Day", (W,), 0, NOT_CLEANUP), ("Valentine's Kindness", (W,), 0, NOT_CLEANUP),
+    ("Fireside Tales", (FA, W), 0, NOT_CLEANUP), ("Mid-Autumn Moon", (FA,), 1, NOT_CLEANUP),
+    ("Scarecrow Row", (FA,), 0, None), ("Back to School", (SU, FA), 0, None),
+    ("May Day", (SP,), 0, NOT_CLEANUP), ("Rain Garden", (SP,), 0, None), ("Easter Parade", (SP,), 1, NOT_CLEANUP),
+    ("Cinco de Mayo", (SP,), 1, NOT_CLEANUP), ("Juneteenth", (SU,), 1, NOT_CLEANUP),
+    ("Lemonade Stand", (SU,), 0, NOT_CLEANUP), ("Firefly Night", (SU,), 0, NOT_CLEANUP),
+    ("Block Safari", (SP, SU, FA), 0, None), ("Backyard Olympics", (SP, SU), 0, NOT_CLEANUP),
+    ("Hometown Pride", (), 0, None), ("Garage Band", (), 0, NOT_CLEANUP), ("Comic Book", (), 0, NOT_CLEANUP),
+    ("Mad Science", (), 0, NOT_CLEANUP), ("Hollywood Red Carpet", (), 2, NOT_CLEANUP),
+    ("Mystery Night", (), 1, NOT_CLEANUP), ("Enchanted Forest", (), 1, None), ("Ocean Guardians", (), 0, None),
+    ("Tiny Town", (), 0, NOT_CLEANUP), ("Silver Screen Classics", (), 1, NOT_CLEANUP),
+    ("Global Village", (), 0, NOT_CLEANUP), ("Paper Lanterns", (), 0, NOT_CLEANUP),
+)
+
+# (format, kinds, sizes)
+THEME_FORMATS = (
+    ("{} Block Party", ("block",), ()), ("{} Street Fest", ("block",), (MEDIUM, LARGE)),
+    ("{} Cul-de-sac Social", ("block",), (SMALL, MEDIUM)),
+    ("{} Cultural Fair", ("fair",), ()), ("{} Night Market", ("fair",), (MEDIUM, LARGE)),
+    ("{} Community Expo", ("fair",), (LARGE,)),
+    ("{} Talent Night", ("show",), ()), ("{} Showcase", ("show",), (MEDIUM, LARGE)),
+    ("{} Open Mic", ("show",), (SMALL, MEDIUM)),
+    ("{} Potluck", ("potluck",), ()), ("{} Supper Club", ("potluck",), (SMALL,)),
+    ("{} Picnic", ("potluck",), ()),
+    ("{} Cleanup Day", ("cleanup",), ()), ("{} Green Team Drive", ("cleanup",), ()),
+    ("{} Park Makeover", ("cleanup",), (MEDIUM, LARGE)),
+    ("{} Porch Party", ("block",), (SMALL, MEDIUM)), ("{} Heritage Day", ("fair",), ()),
+    ("{} Variety Hour", ("show",), ()), ("{} Long-Table Dinner", ("potluck",), (MEDIUM, LARGE)),
+    ("{} Spruce-Up", ("cleanup",), ()),
+    ("{} Social", (), ()), ("{} Gathering", (), ()), ("{} Neighborhood Night", (), ()), ("{} Meet-Up", (), ()),
+)
+
+# ---- food: cuisine x format, plus standalone ideas ----
+
+CUISINES = (
+    "Mexican", "Italian", "Indian", "Korean", "Ethiopian", "Lebanese", "Caribbean", "Filipino", "Japanese",
+    "Greek", "Southern", "Vietnamese", "Brazilian", "Chinese", "Thai", "Moroccan", "Polish", "Nigerian",
+    "Peruvian", "Turkish", "Jamaican", "Persian", "Cajun", "Salvadoran", "Ukrainian", "Somali", "Puerto Rican",
+    "Spanish", "Haitian", "Pakistani", "Cuban", "Colombian", "Senegalese", "Georgian", "Hawaiian", "Irish",
+    "German", "Tex-Mex", "Afghan", "Sri Lankan", "Indonesian", "Armenian", "Ghanaian", "Malaysian",
+)
+
+# (format, kinds, tier, sizes, seasons)
+FOOD_FORMATS = (
+    ("{} potluck table", ("potluck", "block", "general"), 0, (), ()),
+    ("{} snack sampler", (), 0, (), ()),
+    ("Build-your-own {} bowls", (), 1, (), ()),
+    ("{} street-food stalls", ("fair", "block"), 1, (MEDIUM, LARGE), ()),
+    ("Catered {} buffet", (), 2, (MEDIUM, LARGE), ()),
+    ("{} food truck", ("block", "fair", "show"), 2, (LARGE,), ()),
+    ("{} dessert table", (), 0, (), ()),
+    ("{} grill station", ("block", "potluck", "general"), 1, (), (SP, SU, FA)),
+    ("Slow-cooker {} stews", ("potluck", "general", "cleanup"), 0, (), (FA, W)),
+    ("{} cooking demo with tastings", ("fair",), 1, (), ()),
+    ("{} finger foods for the intermission", ("show",), 0, (), ()),
+    ("{} picnic boxes", (), 1, (SMALL, MEDIUM), (SP, SU)),
+    ("Hearty {} lunch for volunteers", ("cleanup",), 0, (), ()),
+    ("{} small plates", (), 2, (SMALL, MEDIUM), ()),
+    ("{} breakfast spread", ("cleanup", "potluck", "general"), 1, (), ()),
+    ("Kid-friendly {} bites", (), 0, (), ()),
+    ("{} sides to share", ("potluck", "block", "general"), 0, (), ()),
+    ("{} tasting flight", ("fair", "show"), 1, (), ()),
+    ("Chilled {} salads", (), 0, (), (SP, SU)),
+    ("{} comfort-food night", ("potluck", "general"), 1, (SMALL, MEDIUM), (FA, W)),
+    ("{} grab-and-go snacks", ("cleanup", "show", "fair"), 0, (), ()),
+)
+
+# (text, kinds, tier, sizes, seasons)
+FOOD_EXTRAS = (
+    ("Lemonade & iced tea stand", (), 0, (), (SP, SU)),
+    ("Hot cocoa bar with toppings", (), 0, (), (W, FA)),
+    ("Apple cider & cinnamon donuts", (), 0, (), (FA,)),
+    ("Chili cook-off", ("potluck", "block", "general"), 0, (), (FA, W)),
+    ("S'mores fire pit", ("block", "potluck", "general"), 1, (), (SU, FA)),
+    ("Watermelon slices on ice", (), 0, (), (SU,)),
+    ("Popsicle cooler", (), 0, (), (SU,)),
+    ("Popcorn & candy concession", ("show",), 0, (), ()),
+    ("Bake sale table", ("fair", "show", "general"), 0, (), ()),
+    ("Pancake breakfast", (), 0, (), ()),
+    ("Burgers & veggie skewers on the grill", ("block", "potluck", "general"), 1, (), (SP, SU, FA)),
+    ("Pizza order from a local pizzeria", (), 1, (), ()),
+    ("Ice cream truck visit", ("block", "fair"), 2, (MEDIUM, LARGE), (SU,)),
+    ("Farmers-market fruit platter", (), 0, (), (SP, SU, FA)),
+    ("Coffee & donuts for early volunteers", ("cleanup",), 0, (), ()),
+    ("Refill station with reusable cups", ("cleanup", "fair", "block"), 0, (), ()),
+    ("Trail mix & granola bars", ("cleanup",), 0, (), ()),
+    ("Soup & bread potluck", ("potluck", "general"), 0, (), (FA, W)),
+    ("Pie contest", ("potluck", "fair", "general"), 0, (), (FA,)),
+    ("Cookie decorating table", (), 0, (), (W,)),
+    ("Fruit kebabs", (), 0, (), (SP, SU)),
+    ("Hot dog cart", (), 1, (), ()),
+    ("Sushi platters", (), 2, (SMALL, MEDIUM), ()),
+    ("Cheese & charcuterie boards", (), 2, (SMALL, MEDIUM), ()),
+    ("Mocktail bar", ("show", "general", "fair"), 1, (), ()),
+    ("Espresso cart", (), 2, (MEDIUM, LARGE), ()),
+    ("Soft pretzels & dips", (), 0, (), ()),
+    ("Nacho bar", (), 0, (), ()),
+    ("Deli sandwich platters", (), 1, (), ()),
+    ("Dish sign-up sheet with ingredient labels", ("potluck",), 0, (), ()),
+    ("Allergy-friendly snack table", (), 0, (), ()),
+    ("Vegan & gluten-free corner", (), 1, (), ()),
+    ("Masala chai & samosas", (), 1, (), (FA, W)),
+    ("Empanada trays", (), 1, (), ()),
+    ("Dumpling-folding party", ("potluck", "general"), 1, (SMALL, MEDIUM), (W,)),
+    ("Paella pan cook-along", ("potluck", "fair"), 2, (), (SU,)),
+    ("Crawfish boil", ("block", "potluck"), 2, (MEDIUM, LARGE), (SP, SU)),
+    ("Fondue pots", (), 2, (SMALL,), (W,)),
+    ("Mulled cider", (), 0, (), (W,)),
+    ("Shaved-ice snow cones", (), 0, (), (SU,)),
+    ("Grilled corn on the cob", (), 0, (), (SU, FA)),
+    ("Roasted chestnuts", (), 1, (), (W,)),
+    ("Bagel & spread bar", (), 1, (), ()),
+    ("Dessert potluck", ("potluck", "general", "show"), 0, (), ()),
+    ("Pastries from a neighborhood bakery", (), 1, (), ()),
+    ("Food truck rally", ("block", "fair"), 2, (LARGE,), (SP, SU, FA)),
+    ("Mac & cheese bar", (), 0, (), ()),
+    ("Taco Tuesday spread", (), 0, (), ()),
+    ("Fresh fruit smoothie bike", ("fair", "block", "cleanup"), 1, (), (SP, SU)),
+    ("Bring-a-thermos soup swap", ("cleanup", "potluck"), 0, (), (FA, W)),
+    ("Build-your-own sundae bar", (), 1, (), (SP, SU)),
+    ("Waffle bar with fruit toppings", (), 1, (), ()),
+    ("Baked potato bar", (), 0, (), (FA, W)),
+    ("Popcorn flavor bar", ("show", "general"), 0, (), ()),
+    ("Neighborhood jam & preserves tasting", ("potluck", "fair"), 0, (), (SU, FA)),
+    ("Garden-grown salsa contest", ("potluck", "fair", "block"), 0, (), (SU, FA)),
+    ("Pop-up lemonade by the kids", ("block", "general"), 0, (SMALL, MEDIUM), (SU,)),
+    ("Pupusa griddle", (), 1, (), ()),
+    ("Bao & bubble tea cart", (), 2, (MEDIUM, LARGE), ()),
+    ("Crepe station", (), 2, (), ()),
+)
+
+# ---- activities: subject x format, plus standalone ideas ----
+
+# (subject, type, seasons, tier)
+ACTIVITY_SUBJECTS = (
+    ("Chalk art", "craft", (SP, SU, FA), 0), ("Origami", "craft", (), 0), ("Tie-dye", "craft", (SP, SU), 0),
+    ("Pottery", "craft", (), 2), ("Lantern making", "craft", (FA, W), 0), ("Birdhouse building", "craft", (SP,), 1),
+    ("Knitting", "craft", (FA, W), 0), ("Calligraphy", "craft", (), 1), ("Mural painting", "craft", (SP, SU), 1),
+    ("Pumpkin carving", "craft", (FA,), 0), ("Wreath making", "craft", (W,), 1),
+    ("Flower crown", "craft", (SP, SU), 0), ("Recycled art", "craft", (), 0), ("Henna", "craft", (), 1),
+    ("Cookie decorating", "craft", (W,), 0), ("Kite making", "craft", (SP,), 0), ("Photography", "craft", (), 1),
+    ("Face painting", "craft", (), 0), ("Friendship bracelet", "craft", (), 0),
+    ("Salsa dance", "move", (), 1), ("Line dancing", "move", (), 0), ("Yoga", "move", (SP, SU, FA), 0),
+    ("Folk dance", "move", (), 0), ("Hula hoop", "move", (SP, SU), 0), ("Drum circle", "move", (), 0),
+    ("Zumba", "move", (), 1), ("Tai chi", "move", (), 0), ("Juggling", "move", (), 0),
+    ("Board game", "game", (), 0), ("Trivia", "game", (), 0), ("Cornhole", "game", (SP, SU, FA), 0),
+    ("Tug-of-war", "game", (SP, SU, FA), 0), ("Sack race", "game", (SP, SU, FA), 0),
+    ("Scavenger hunt", "game", (), 0), ("Water balloon", "game", (SU,), 0), ("Bingo", "game", (), 0),
+    ("Chess", "game", (), 0), ("Snowball target", "game", (W,), 0), ("Pickleball", "game", (SP, SU, FA), 1),
+    ("Karaoke", "perform", (), 1), ("Poetry", "perform", (), 0), ("Comedy", "perform", (), 0),
+    ("Magic tricks", "perform", (), 0), ("Storytelling", "perform", (), 0), ("Beatboxing", "perform", (), 0),
+    ("Dance-off", "perform", (), 0), ("Cultural costume", "perform", (), 0), ("Lip-sync", "perform", (), 0),
+    ("Litter pick-up", "green", (), 0), ("Tree planting", "green", (SP, FA), 1), ("Composting", "green", (), 0),
+    ("Seed planting", "green", (SP,), 0), ("Storm-drain stenciling", "green", (SP, SU, FA), 1),
+    ("Bike repair", "green", (SP, SU, FA), 0), ("Weeding & mulching", "green", (SP, SU), 0),
+    ("Weaving", "craft", (), 0), ("Block printing", "craft", (), 1), ("Candle making", "craft", (FA, W), 1),
+    ("Paper flower", "craft", (SP,), 0), ("Rock painting", "craft", (SP, SU, FA), 0),
+    ("Mask making", "craft", (), 0), ("Woodworking", "craft", (), 2), ("Sidewalk mosaic", "craft", (SU,), 1),
+    ("Swing dance", "move", (), 1), ("Capoeira", "move", (), 1), ("Bollywood dance", "move", (), 1),
+    ("Square dancing", "move", (), 0), ("Stretch & walk", "move", (), 0), ("Jump rope", "move", (SP, SU, FA), 0),
+    ("Dominoes", "game", (), 0), ("Giant Jenga", "game", (), 0), ("Bocce", "game", (SP, SU, FA), 0),
+    ("Kickball", "game", (SP, SU, FA), 0), ("Puzzle race", "game", (), 0), ("Frisbee", "game", (SP, SU, FA), 0),
+    ("Spelling bee", "game", (), 0), ("Sled race", "game", (W,), 0),
+    ("Open jam", "perform", (), 0), ("Spoken word", "perform", (), 0), ("Puppet show", "perform", (), 0),
+    ("Choir", "perform", (), 0), ("Step dance", "perform", (), 1),
+    ("Pollinator garden", "green", (SP, SU), 1), ("Invasive plant pull", "green", (SP, SU), 0),
+    ("Recycling sort", "green", (), 0), ("Tool library", "green", (), 1), ("Snow shoveling", "green", (W,), 0),
+)
+
+# type -> (kinds, [(format, tier bump, sizes)])
+ACTIVITY_FORMATS = {
+    "craft": ((), (
+        ("{} workshop", 0, ()), ("{} station for kids", 0, ()), ("{} demo by a neighbor", 0, ()),
+        ("{} class with a local pro", 1, (SMALL, MEDIUM)), ("{} take-home table", 0, ()),
+        ("Grown-ups' {} night", 0, (SMALL, MEDIUM)),
+    )),
+    "move": ((), (
+        ("{} class", 0, ()), ("{} demo", 0, ()), ("Family {} hour", 0, ()),
+        ("{} session with a local instructor", 1, (SMALL, MEDIUM)), ("{} warm-up to open the day", 0, ()),
+    )),
+    "game": (("block", "potluck", "fair", "general"), (
+        ("{} tournament", 0, (MEDIUM, LARGE)), ("{} contest with small prizes", 0, ()),
+        ("{} corner", 0, ()), ("Kids' {} league", 0, (MEDIUM, LARGE)), ("Grandparents vs. kids {}", 0, ()),
+    )),
+    "perform": (("show", "fair", "block", "general"), (
+        ("{} showcase", 0, ()), ("{} open stage", 0, ()), ("{} contest", 0, ()), ("{} workshop", 0, ()),
+        ("{} hour for first-timers", 0, ()),
+    )),
+    "green": (("cleanup", "general", "block"), (
+        ("{} crew", 0, ()), ("{} workshop", 0, ()), ("{} challenge with prizes", 0, ()),
+        ("{} demo", 0, ()), ("{} sign-up table for next month", 0, ()),
+    )),
+}
+
+# (text, kinds, tier, sizes, seasons)
+ACTIVITY_EXTRAS = (
+    ("Bounce house", ("block", "fair"), 2, (MEDIUM, LARGE), (SP, SU, FA)),
+    ("Petting zoo visit", ("fair", "block"), 2, (LARGE,), (SP, SU, FA)),
+    ("Outdoor movie screening", ("block", "general"), 1, (), (SU, FA)),
+    ("Live band on a flatbed stage", ("block", "fair"), 2, (LARGE,), (SP, SU, FA)),
+    ("Raffle for local-business prizes", (), 0, (), ()),
+    ("Photo booth with props", (), 1, (), ()),
+    ("Neighbor skills swap table", (), 0, (), ()),
+    ("Little free library build", ("cleanup", "general", "block"), 1, (), ()),
+    ("Before-and-after photo wall", ("cleanup",), 0, (), ()),
+    ("Weigh-in of bags collected", ("cleanup",), 0, (), ()),
+    ("Sidewalk talent parade", ("show", "block"), 0, (), (SP, SU, FA)),
+    ("Judges' panel of neighborhood kids", ("show",), 0, (), ()),
+    ("Audience-choice award", ("show",), 0, (), ()),
+    ("Recipe card swap", ("potluck",), 0, (), ()),
+    ("Dish-story round: who made what and why", ("potluck",), 0, (SMALL, MEDIUM), ()),
+    ("Passport stamps for every booth", ("fair",), 0, (), ()),
+    ("Flag parade of neighbors' home countries", ("fair", "block"), 0, (), ()),
+    ("Language taster corner", ("fair",), 0, (), ()),
+    ("Bike parade", ("block",), 0, (), (SP, SU, FA)),
+    ("Street hockey", ("block",), 0, (), (FA, W)),
+    ("Sprinkler dash", ("block", "general"), 0, (), (SU,)),
+    ("Stargazing with a borrowed telescope", (), 0, (SMALL, MEDIUM), (SU, FA)),
+    ("Caroling walk", (), 0, (), (W,)),
+    ("Gingerbread house contest", (), 1, (), (W,)),
+    ("Egg hunt", (), 0, (), (SP,)),
+    ("Leaf-pile jump", (), 0, (), (FA,)),
+    ("Community quilt square painting", (), 1, (), ()),
+    ("Time capsule", (), 0, (), ()),
+    ("Neighborhood history walk", (), 0, (), ()),
+    ("Welcome circle for new neighbors", (), 0, (), ()),
+)
+
+
+def _build() -> Dict[str, List[Idea]]:
+    themes = []
+    for motif, seasons, tier, motif_kinds in THEME_MOTIFS:
+        for fmt, kinds, sizes in THEME_FORMATS:
+            if kinds and motif_kinds and not set(kinds) & set(motif_kinds):
+                continue
+            themes.append(
+                Idea(fmt.format(motif), motif, fmt, _tags(kinds or motif_kinds), tier, _tags(sizes), _tags(seasons))
+            )
+
+    food = [
+        Idea(fmt.format(cuisine), cuisine, fmt, _tags(kinds), tier, _tags(sizes), _tags(seasons))
+        for fmt, kinds, tier, sizes, seasons in FOOD_FORMATS
+        for cuisine in CUISINES
+    ]
+    food += [Idea(text, text, text, _tags(k), t, _tags(sz), _tags(se)) for text, k, t, sz, se in FOOD_EXTRAS]
+
+    activities = []
+    for subject, kind_type, seasons, tier in ACTIVITY_SUBJECTS:
+        kinds, formats = ACTIVITY_FORMATS[kind_type]
+        for fmt, bump, sizes in formats:
+            text = fmt.format(subject if fmt.startswith("{}") else subject.lower())
+            activities.append(
+                Idea(text, subject, fmt, _tags(kinds), min(2, tier + bump), _tags(sizes), _tags(seasons))
+            )
+    activities += [
+        Idea(text, text, text, _tags(k), t, _tags(sz), _tags(se)) for text, k, t, sz, se in ACTIVITY_EXTRAS
+    ]
+
+    return {"Themes": themes, "Food": food, "Activities": activities}
+
+
+def _index(ideas: List[Idea]) -> Dict[tuple, FrozenSet[int]]:
+    """Inverted index: (facet, value) -> ids. Untagged ideas are posted under every value of the facet."""
+    postings: Dict[tuple, set] = {}
+
+    def post(key, i):
+        postings.setdefault(key, set()).add(i)
+
+    for i, idea in enumerate(ideas):
+        for kind in (idea.kinds or ("*",)):
+            post(("kind", kind), i)
+        for tier in range(idea.tier, len(TIERS)):
+            post(("tier", tier), i)
+        for size in (idea.sizes or SIZES):
+            post(("size", size), i)
+        for season in (idea.seasons or SEASONS):
+            post(("season", season), i)
+    return {key: frozenset(ids) for key, ids in postings.items()}
+
+
+CORPUS = _build()
+_INDEXES = {category: _index(ideas) for category, ideas in CORPUS.items()}
+# Fixed tie-break order, so equal scores aren't always won by the same end of the catalog
+_TIEBREAK = {category: random.Random(category).sample(range(len(ideas)), len(ideas)) for category, ideas in CORPUS.items()}
+
+POOL = 90          # best-ranked ideas a result is drawn from
+JITTER = 3.0       # random score added per draw; specific matches score 1-4 each
+MAX_PER_FORM = 2
+
+
+def _specificity(kinds) -> int:
+    # Made for this kind of event beats fits most events beats fits any event
+    if not kinds or len(kinds) > 4:
+        return 0
+    return 4 if len(kinds) <= 2 else 2
+
+
+@functools.lru_cache(maxsize=None)
+def _ranked(category: str, kind: str, tier: int, size: str, season: str) -> Tuple[Tuple[float, int], ...]:
+    ideas, index, order = CORPUS[category], _INDEXES[category], _TIEBREAK[category]
+    empty = frozenset()
+    ids = (
+        (index.get(("kind", kind), empty) | index.get(("kind", "*"), empty))
+        & index.get(("tier", tier), empty)
+        & index.get(("size", size), empty)
+        & index.get(("season", season), empty)
+    )
+    scored = []
+    for i in ids:
+        idea = ideas[i]
+        score = (
+            _specificity(idea.kinds)
+            + (2 if idea.seasons else 0)
+            + (1 if idea.sizes else 0)
+            + (1 if idea.tier == tier else 0)
+        )
+        scored.append((score, i))
+    scored.sort(key=lambda s: (-s[0], order[s[1]]))
+    return tuple(scored[:POOL])
+
+
+def _size(guests) -> str:
+    try:
+        n = int(guests)
+    except (TypeError, ValueError):
+        return MEDIUM
+    return SMALL if n <= 30 else MEDIUM if n <= 100 else LARGE
+
+
+def _season(event_date: str, today: Optional[date] = None) -> str:
+    try:
+        month = datetime.strptime(str(event_date).strip(), "%Y-%m-%d").month
+    except ValueError:
+        month = (today or date.today()).month
+    return SEASONS[month % 12 // 3]
+
+
+def suggest_ideas(event_type: str, guests: int, budget: str, location: str, event_date: str = "",
+                  per_category: int = 6) -> Dict[str, List[str]]:
+    """
+    Ideas from the local corpus, ranked by event kind, budget tier, guest count and season.
+    The draw is seeded from the inputs: the same event always gets the same ideas,
+    a different neighborhood or event type gets a different mix.
+    """
+    kind = _event_kind(event_type)
+    tier = TIERS.get(normalize_text(budget), 1)
+    size = _size(guests)
+    season = _season(event_date)
+    seed = "|".join((normalize_text(event_type), guest_bucket(guests), normalize_text(budget),
+                     normalize_text(location), season))
+    rnd = random.Random(zlib.crc32(seed.encode("utf-8"))).random
+
+    out = {}
+    for category in CATEGORIES:
+        ideas = CORPUS[category]
+        draw = [(score + rnd() * JITTER, i) for score, i in _ranked(category, kind, tier, size, season)]
+        draw.sort(reverse=True)
+        picked, families, forms = [], set(), {}
+        for _, i in draw:
+            idea = ideas[i]
+            if idea.family in families or forms.get(idea.form, 0) >= MAX_PER_FORM:
+                continue
+            families.add(idea.family)
+            forms[idea.form] = forms.get(idea.form, 0) + 1
+            picked.append(idea.text)
+            if len(picked) == per_category:
+                break
+        out[category] = picked
+    return out
@@ -1,31 +1,101 @@
 import os
-import json
-from openai import OpenAI
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+from core.idea_corpus import suggest_ideas
+from core.timeline_rules import _event_kind
+from utils.cache import _bypass, cached, guest_bucket, normalize_text
+from utils.config import IDEAS_LOCAL_BUDGETS, WARM_STORE_GENERIC
+from utils.llm import acomplete_json, complete_json
+from utils.metrics import SECTION_SECONDS, count_fallback, timed
+from utils.semcache import near_duplicate
+from utils.singleflight import coalesced
+from utils.tracing import spanned
+from utils.warmstore import warm_store
 
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+IDEA_CAPS = {("Themes",): 6, ("Food",): 6, ("Activities",): 6}
 
-def _fallback_ideas(event_type: str, guests: int, budget: str, location: str) -> Dict[str, List[str]]:
-    # Safe fallback for community events
+def _fallback_ideas(event_type: str, guests: int, budget: str, location: str,
+                    event_date: str = "") -> Dict[str, List[str]]:
+    # Ranked picks from the local idea corpus (core/idea_corpus.py), varied per event and neighborhood
+    return suggest_ideas(event_type, guests, budget, location, event_date)
+
+@spanned("ideas.normalize")
+def _normalize_ideas(data: dict) -> Dict[str, List[str]]:
     return {
-        "Themes": [
-            "Outdoor Movie Night",
-            "Cultural Food Fair",
-            "Neighborhood BBQ"
-        ],
-        "Food": [
-            "Potluck-style shared dishes",
-            "Local vendor stalls",
-            "Snacks and lemonade stand"
-        ],
-        "Activities": [
-            "Kids’ games and relay races",
-            "Open mic or talent show",
-            "Community raffle and cleanup crew"
-        ],
+        "Themes": [str(x).strip() for x in data.get("Themes", [])][:6],
+        "Food": [str(x).strip() for x in data.get("Food", [])][:6],
+        "Activities": [str(x).strip() for x in data.get("Activities", [])][:6],
     }
 
-def generate_event_ideas(event_type: str, guests: int, budget: str, location: str) -> Dict[str, List[str]]:
+def _usable_ideas(data: dict) -> Dict[str, List[str]]:
+    """The normalized ideas; ValueError when a category is missing or blank, so it is never cached."""
+    if not all(isinstance(data.get(category), list) for category in ("Themes", "Food", "Activities")):
+        raise ValueError("ideas: expected Themes, Food and Activities arrays")
+    ideas = {category: [idea for idea in items if idea] for category, items in _normalize_ideas(data).items()}
+    if not all(ideas.values()):
+        raise ValueError("ideas: an empty category")
+    return ideas
+
+def _ideas_key(event_type, guests, budget, location) -> tuple:
+    return normalize_text(event_type), guest_bucket(guests), normalize_text(budget), normalize_text(location)
+
+def _prebuilt_ideas(event_type, guests, budget, location):
+    store = warm_store()
+    if store is None or _bypass.get():
+        return None
+    hit = store.get("ideas", *_ideas_key(event_type, guests, budget, location))
+    if hit is None and WARM_STORE_GENERIC and normalize_text(location):
+        hit = store.get("ideas", *_ideas_key(event_type, guests, budget, ""))
+    return hit
+
+def _ideas_features(event_type, guests, budget, location) -> tuple:
+    # Free text for the similarity match; budget and kind of event must match exactly, guests by ratio
+    try:
+        guests = int(guests)
+    except (TypeError, ValueError):
+        guests = None
+    return f"{event_type} {location}", (normalize_text(budget), _event_kind(event_type)), guests
+
+@spanned("ideas.prompt")
+def _ideas_prompt(event_type, guests, budget, location) -> Tuple[str, str]:
+    system = (
+        "You are a neighborhood event planning assistant. "
+        "Respond ONLY as strict JSON with keys: Themes, Food, Activities. "
+        "Each value must be an array of 3-6 short, practical ideas. "
+        "Keep suggestions family-friendly, inclusive, and affordable. "
+        "Encourage collaboration (potlucks, cultural sharing, talent shows, cleanup drives). "
+        "No prose, no markdown, no extra keys."
+    )
+    user = (
+        f"Event type: {event_type}\n"
+        f"Expected neighbors: {guests}\n"
+        f"Budget: {budget}\n"
+        f"Location: {location}\n"
+        "Return JSON with 3 arrays: Themes, Food, Activities."
+    )
+    return system, user
+
+@cached("ideas", _ideas_key)
+@near_duplicate("ideas", _ideas_features)
+@coalesced("ideas", _ideas_key)
+def _ideas_from_llm(event_type: str, guests: int, budget: str, location: str) -> Dict[str, List[str]]:
+    system, user = _ideas_prompt(event_type, guests, budget, location)
+    return complete_json("ideas", system, user, temperature=0.7, model=MODEL, caps=IDEA_CAPS,
+                         validate=_usable_ideas)
+
+@cached("ideas", _ideas_key)
+@near_duplicate("ideas", _ideas_features)
+@coalesced("ideas", _ideas_key)
+async def _ideas_from_llm_async(event_type: str, guests: int, budget: str, location: str) -> Dict[str, List[str]]:
+    system, user = _ideas_prompt(event_type, guests, budget, location)
+    return await acomplete_json("ideas", system, user, temperature=0.7, model=MODEL, caps=IDEA_CAPS,
+                                validate=_usable_ideas)
+
+@timed(SECTION_SECONDS, "ideas")
+@spanned("ideas")
+def generate_event_ideas(event_type: str, guests: int, budget: str, location: str,
+                         event_date: str = "") -> Dict[str, List[str]]:
     """
     Returns a dict:
     {
@@ -33,43 +103,35 @@ def generate_event_ideas(event_type: str, guests: int, budget: str, location: st
       "Food":   [.. up to 6],
       "Activities": [.. up to 6]
     }
+    Prebuilt ideas (prebuild.py) are served first; budgets listed in IDEAS_LOCAL_BUDGETS
+    come from the local corpus without calling the model.
     """
+    prebuilt = _prebuilt_ideas(event_type, guests, budget, location)
+    if prebuilt is not None:
+        return prebuilt
+    if normalize_text(budget) in IDEAS_LOCAL_BUDGETS:
+        return _fallback_ideas(event_type, guests, budget, location, event_date)
     try:
-        client = OpenAI()
-        system = (
-            "You are a neighborhood event planning assistant. "
-            "Respond ONLY as strict JSON with keys: Themes, Food, Activities. "
-            "Each value must be an array of 3-6 short, practical ideas. "
-            "Keep suggestions family-friendly, inclusive, and affordable. "
-            "Encourage collaboration (potlucks, cultural sharing, talent shows, cleanup drives). "
-            "No prose, no markdown, no extra keys."
-        )
-        user = (
-            f"Event type: {event_type}\n"
-            f"Expected neighbors: {guests}\n"
-            f"Budget: {budget}\n"
-            f"Location: {location}\n"
-            "Return JSON with 3 arrays: Themes, Food, Activities."
-        )
-        resp = client.chat.completions.create(
-            model=MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            temperature=0.7,
-        )
-        raw = resp.choices[0].message.content
-        data = json.loads(raw)
-        # normalize
-        return {
-            "Themes": [str(x).strip() for x in data.get("Themes", [])][:6],
-            "Food": [str(x).strip() for x in data.get("Food", [])][:6],
-            "Activities": [str(x).strip() for x in data.get("Activities", [])][:6],
-        }
+        return _ideas_from_llm(event_type, guests, budget, location)
     except Exception:
-        return _fallback_ideas(event_type, guests, budget, location)
+        count_fallback("ideas")
+        return _fallback_ideas(event_type, guests, budget, location, event_date)
+
+@timed(SECTION_SECONDS, "ideas")
+@spanned("ideas")
+async def agenerate_event_ideas(event_type: str, guests: int, budget: str, location: str,
+                               event_date: str = "") -> Dict[str, List[str]]:
+    """Async twin of generate_event_ideas (AsyncOpenAI client), same shape and fallback."""
+    prebuilt = _prebuilt_ideas(event_type, guests, budget, location)
+    if prebuilt is not None:
+        return prebuilt
+    if normalize_text(budget) in IDEAS_LOCAL_BUDGETS:
+        return _fallback_ideas(event_type, guests, budget, location, event_date)
+    try:
+        return await _ideas_from_llm_async(event_type, guests, budget, location)
+    except Exception:
+        count_fallback("ideas")
+        return _fallback_ideas(event_type, guests, budget, location, event_date)
 
 
 
@@ -1,9 +1,14 @@
 import os
-import json
-from openai import OpenAI
-from typing import List, Dict
+from typing import List, Dict, Tuple
+
+from utils.cache import cached, normalize_text
+from utils.llm import acomplete_json, complete_json
+from utils.metrics import SECTION_SECONDS, count_fallback, timed
+from utils.singleflight import coalesced
+from utils.tracing import spanned
 
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+INVITATION_CAPS = {("invitations",): 3}
 
 def _fallback_invitations(event_type, organizing_group, event_date, event_time, venue, tone) -> List[Dict[str, str]]:
     base = f"{event_type} organized by {organizing_group}"
@@ -32,47 +37,82 @@ def _fallback_invitations(event_type, organizing_group, event_date, event_time,
         },
     ]
 
+@spanned("invitations.normalize")
+def _normalize_invitations(invites: list) -> List[Dict[str, str]]:
+    out = []
+    for i, inv in enumerate(invites[:3], start=1):
+        out.append({
+            "title": str(inv.get("title", f"Invitation {i}")).strip(),
+            "body": str(inv.get("body", "")).strip(),
+        })
+    # Guarantee 3
+    while len(out) < 3:
+        out.append({"title": f"Invitation {len(out)+1}", "body": ""})
+    return out
+
+def _usable_invitations(data: dict) -> List[Dict[str, str]]:
+    """The normalized invitations; ValueError unless all 3 have a body, so a blank answer is never cached."""
+    invites = data.get("invitations")
+    if not isinstance(invites, list):
+        raise ValueError("invitations: expected an array")
+    out = _normalize_invitations([inv for inv in invites if isinstance(inv, dict)])
+    if not all(inv["body"] for inv in out):
+        raise ValueError("invitations: fewer than 3 with a body")
+    return out
+
+def _invitations_key(*fields) -> tuple:
+    return tuple(normalize_text(f) for f in fields)
+
+@spanned("invitations.prompt")
+def _invitations_prompt(event_type, organizing_group, event_date, event_time, venue, tone) -> Tuple[str, str]:
+    system = (
+        "You write concise community invitation messages. "
+        "Return ONLY JSON with key 'invitations' which is an array of exactly 3 objects. "
+        "Each object has 'title' and 'body' (plain text, no markdown)."
+    )
+    user = (
+        f"Generate 3 friendly, community-focused invitations for a {event_type}.\n"
+        f"Organized by: {organizing_group}\nDate: {event_date}\n"
+        f"Time: {event_time}\nLocation: {venue}\nTone: {tone}\n"
+        "Make them warm and inclusive, suitable for neighbors. Return JSON only."
+    )
+    return system, user
+
+@cached("invitations", _invitations_key)
+@coalesced("invitations", _invitations_key)
+def _invitations_from_llm(event_type, organizing_group, event_date, event_time, venue, tone) -> List[Dict[str, str]]:
+    system, user = _invitations_prompt(event_type, organizing_group, event_date, event_time, venue, tone)
+    return complete_json("invitations", system, user, temperature=0.7, model=MODEL, caps=INVITATION_CAPS,
+                         validate=_usable_invitations)
+
+@cached("invitations", _invitations_key)
+@coalesced("invitations", _invitations_key)
+async def _invitations_from_llm_async(event_type, organizing_group, event_date, event_time, venue, tone) -> List[Dict[str, str]]:
+    system, user = _invitations_prompt(event_type, organizing_group, event_date, event_time, venue, tone)
+    return await acomplete_json("invitations", system, user, temperature=0.7, model=MODEL, caps=INVITATION_CAPS,
+                                validate=_usable_invitations)
+
+@timed(SECTION_SECONDS, "invitations")
+@spanned("invitations")
 def generate_invitations(event_type, organizing_group, event_date, event_time, venue, tone) -> List[Dict[str, str]]:
     """
     Returns a list of 3 dicts: [{"title": "...", "body": "..."}, ...]
     Body should be plain text (no markdown).
     """
     try:
-        client = OpenAI()
-        system = (
-            "You write concise community invitation messages. "
-            "Return ONLY JSON with key 'invitations' which is an array of exactly 3 objects. "
-            "Each object has 'title' and 'body' (plain text, no markdown)."
-        )
-        user = (
-            f"Generate 3 friendly, community-focused invitations for a {event_type}.\n"
-            f"Organized by: {organizing_group}\nDate: {event_date}\n"
-            f"Time: {event_time}\nLocation: {venue}\nTone: {tone}\n"
-            "Make them warm and inclusive, suitable for neighbors. Return JSON only."
-        )
-        resp = client.chat.completions.create(
-            model=MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            temperature=0.7,
-        )
-        data = json.loads(resp.choices[0].message.content)
-        invites = data.get("invitations", [])
-        # Normalize
-        out = []
-        for i, inv in enumerate(invites[:3], start=1):
-            out.append({
-                "title": str(inv.get("title", f"Invitation {i}")).strip(),
-                "body": str(inv.get("body", "")).strip(),
-            })
-        # Guarantee 3
-        while len(out) < 3:
-            out.append({"title": f"Invitation {len(out)+1}", "body": ""})
-        return out
+        return _invitations_from_llm(event_type, organizing_group, event_date, event_time, venue, tone)
+    except Exception:
+        count_fallback("invitations")
+        return _fallback_invitations(event_type, organizing_group, event_date, event_time, venue, tone)
+
+@timed(SECTION_SECONDS, "invitations")
+@spanned("invitations")
+async def agenerate_invitations(event_type, organizing_group, event_date, event_time, venue, tone) -> List[Dict[str, str]]:
+    """Async twin of generate_invitations (AsyncOpenAI client), same shape and fallback."""
+    try:
+        return await _invitations_from_llm_async(event_type, organizing_group, event_date, event_time, venue, tone)
     except Exception:
+        count_fallback("invitations")
         return _fallback_invitations(event_type, organizing_group, event_date, event_time, venue, tone)
 
 
@@ -0,0 +1,245 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from core.plan import iter_plan
+from utils.admission import BULK, traffic
+from utils.cache import cache_bypass
+from utils.config import JOB_LEASE, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL, JOB_RETENTION, JOB_WORKERS, JOBS_DB
+
+SECTIONS = ("invitations", "ideas", "timeline")
+
+
+class JobStore:
+    """
+    Plan jobs persisted in SQLite, so queued work survives restarts and any worker process can run it.
+    A running job holds a lease that its worker renews while it runs; a job whose lease has
+    expired (its worker died) is picked up again and only generates the sections it is missing,
+    up to max_attempts claims in all, after which it is failed. Finished jobs are deleted once
+    they are older than the retention period.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        with self._init_lock:
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    " id TEXT PRIMARY KEY, status TEXT NOT NULL, spec TEXT NOT NULL,"
+                    " sections TEXT NOT NULL DEFAULT '{}', error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+                    " created REAL NOT NULL, updated REAL NOT NULL, lease_until REAL NOT NULL DEFAULT 0)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+                self._ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, spec: Dict, no_cache: bool = False) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        # The request's nocache travels with the spec, since the worker runs long after the request is gone
+        stored = {**spec, "no_cache": True} if no_cache else spec
+        self._conn().execute(
+            "INSERT INTO jobs (id, status, spec, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(stored, ensure_ascii=False), now, now),
+        )
+        return job_id
+
+    def claim(self, max_attempts: int = JOB_MAX_ATTEMPTS) -> Optional[sqlite3.Row]:
+        """
+        Atomically take the oldest queued job (or one whose lease ran out). A job that was
+        already claimed max_attempts times (its workers keep dying on it) is failed instead.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)"
+                    " ORDER BY created LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None or row["attempts"] < max_attempts:
+                    break
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                    (f"gave up after {row['attempts']} attempts", now, row["id"]),
+                )
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ?, lease_until = ?"
+                    " WHERE id = ?",
+                    (now, now + JOB_LEASE, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def renew(self, job_id: str) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'", (time.time() + JOB_LEASE, job_id)
+        )
+
+    def save_section(self, job_id: str, name: str, section) -> None:
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET sections = json_set(sections, '$.' || ?, json(?)), updated = ?, lease_until = ?"
+            " WHERE id = ?",
+            (name, json.dumps(section, ensure_ascii=False), now, now + JOB_LEASE, job_id),
+        )
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+            ("failed" if error else "done", error, time.time(), job_id),
+        )
+
+    def prune(self, older_than: float) -> int:
+        """Delete done and failed jobs last updated more than older_than seconds ago; returns how many."""
+        return self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (time.time() - older_than,)
+        ).rowcount
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        spec = json.loads(row["spec"])
+        spec.pop("no_cache", None)
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "spec": spec,
+            "sections": json.loads(row["sections"]),
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created": row["created"],
+            "updated": row["updated"],
+        }
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class JobWorkers:
+    """Local pool of threads draining the job table; started lazily once per process."""
+
+    def __init__(self, store: JobStore, size: int):
+        self.store = store
+        self.size = size
+        self._wake = threading.Event()
+        self._pruned_at = 0.0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.size):
+                threading.Thread(target=self._loop, name=f"plan-job-{i}", daemon=True).start()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                row = self.store.claim()
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                self._prune()
+                # Jobs enqueued by other processes are found on the next poll
+                self._wake.wait(JOB_POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            with self._heartbeat(row["id"]):
+                self.run(row["id"], json.loads(row["spec"]), json.loads(row["sections"]))
+
+    @contextmanager
+    def _heartbeat(self, job_id: str):
+        # A section can queue for a bulk slot for minutes before its call even starts, so the lease
+        # is renewed on a timer rather than only when a section is saved
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(JOB_LEASE / 3):
+                try:
+                    self.store.renew(job_id)
+                except sqlite3.Error:
+                    pass
+
+        thread = threading.Thread(target=beat, name=f"plan-job-lease-{job_id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def _prune(self) -> None:
+        # When idle, and at most every few minutes per process: other workers prune the same table
+        now = time.monotonic()
+        if JOB_RETENTION <= 0 or now - self._pruned_at < min(600.0, JOB_RETENTION):
+            return
+        self._pruned_at = now
+        try:
+            self.store.prune(JOB_RETENTION)
+        except sqlite3.Error:
+            pass
+
+    def run(self, job_id: str, spec: Dict, done: Dict) -> None:
+        no_cache = bool(spec.pop("no_cache", False))
+        missing = [name for name in SECTIONS if name not in done]
+        try:
+            # Nobody is waiting on the page, so job sections yield upstream slots to form requests
+            with cache_bypass(no_cache), traffic(BULK, spec.get("organizing_group", "")):
+                # A job picked up again after its worker died only generates what it was missing
+                for name, section in iter_plan(spec, only=None if len(missing) == len(SECTIONS) else missing):
+                    self.store.save_section(job_id, name, section)
+            self.store.finish(job_id)
+        except Exception as e:
+            self.store.finish(job_id, error=str(e))
+
+
+_store = JobStore(JOBS_DB)
+_workers = JobWorkers(_store, JOB_WORKERS)
+
+
+def enqueue_plan(spec: Dict, no_cache: bool = False) -> str:
+    """Queue a plan and return its job id right away; a local worker thread generates it."""
+    job_id = _store.enqueue(spec, no_cache)
+    _workers.ensure_started()
+    _workers.notify()
+    return job_id
+
+
+def get_plan_job(job_id: str) -> Optional[Dict]:
+    return _store.get(job_id)
+
+
+def start_job_workers() -> None:
+    """Begin draining the queue now (e.g. to resume jobs left over from before a restart)."""
+    _workers.ensure_started()
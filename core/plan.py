@@ -0,0 +1,292 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from typing import AsyncIterator, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+from core.ideas import IDEA_CAPS, MODEL, agenerate_event_ideas, generate_event_ideas, _fallback_ideas, _usable_ideas
+from core.invitation import (
+    INVITATION_CAPS, agenerate_invitations, generate_invitations, _fallback_invitations, _usable_invitations,
+)
+from core.timeline import amake_timeline, make_timeline, _fallback_timeline
+from utils.config import PLAN_CONCURRENT, PLAN_MODE, PLAN_WORKERS
+from utils.deadline import remaining
+from utils.llm import acomplete_json, complete_json
+from utils.metrics import FallbackOnce, enter_fallback_scope
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def read_event_spec(source: Mapping) -> Dict:
+    """Pull the event fields out of a form (or any mapping) with the same defaults as the HTML form."""
+    def text(key: str, default: str = "") -> str:
+        return str(source.get(key, default) or default).strip()
+
+    return {
+        "event_type": text("event_type", "Block Party"),
+        "guests": int(source.get("guests", "50") or 50),
+        "budget": text("budget", "Moderate"),
+        "location": text("location"),
+        "organizing_group": text("organizing_group"),
+        "event_date": text("event_date"),
+        "event_time": text("event_time"),
+        "venue": text("venue"),
+        "tone": text("tone", "casual"),
+    }
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Built lazily and rebuilt after a fork, so preloaded gunicorn workers don't share dead threads
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=PLAN_WORKERS, thread_name_prefix="plan")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _section_calls(spec: Dict) -> Dict:
+    """(generator, fallback, args) per section, keyed by the names results.html expects."""
+    return {
+        "invitations": (
+            generate_invitations,
+            _fallback_invitations,
+            (spec["event_type"], spec["organizing_group"], spec["event_date"],
+             spec["event_time"], spec["venue"], spec["tone"]),
+        ),
+        "ideas": (
+            generate_event_ideas,
+            _fallback_ideas,
+            (spec["event_type"], spec["guests"], spec["budget"], spec["location"], spec["event_date"]),
+        ),
+        "timeline": (
+            make_timeline,
+            _fallback_timeline,
+            (spec["event_type"], spec["event_date"], spec["guests"]),
+        ),
+    }
+
+
+def _run_sections(calls: Dict, concurrent: bool) -> Dict:
+    if not concurrent:
+        return {name: fn(*args) for name, (fn, _, args) in calls.items()}
+
+    pool = _get_executor()
+    tallies: Dict[str, FallbackOnce] = {}
+    futures = {name: _submit(pool, name, fn, args, tallies) for name, (fn, _, args) in calls.items()}
+    plan = {}
+    for name, future in futures.items():
+        fn, fallback, args = calls[name]
+        try:
+            plan[name] = future.result(timeout=_wait_left())
+        except FutureTimeout:
+            # Past the request budget: serve the fallback now, the call winds down on its own
+            # deadline (and counts the timeout there, but not the fallback again)
+            tallies[name].count(name)
+            plan[name] = fallback(*args)
+        except Exception:
+            # Generators already fall back on their own; this only guards pool failures
+            tallies[name].count(name)
+            plan[name] = fallback(*args)
+    return plan
+
+
+def _submit(pool: ThreadPoolExecutor, name: str, fn, args, tallies: Dict[str, FallbackOnce]):
+    # Each task runs in a copy of the caller's context so per-request settings (cache bypass etc.) follow it;
+    # the copy shares a fallback tally with the plan, which may serve the section's fallback before it ends
+    context = contextvars.copy_context()
+    tallies[name] = context.run(enter_fallback_scope)
+    return pool.submit(context.run, fn, *args)
+
+
+def _wait_left():
+    left = remaining()
+    return None if left is None else max(0.0, left)
+
+
+PLAN_CAPS = {
+    **{("ideas",) + path: cap for path, cap in IDEA_CAPS.items()},
+    **INVITATION_CAPS,
+}
+
+
+def _combined_prompt(spec: Dict):
+    system = (
+        "You are a neighborhood event planning assistant. "
+        "Return ONLY strict JSON with exactly two keys: ideas, invitations. "
+        "'ideas' is an object with keys Themes, Food, Activities, each an array of 3-6 short, practical, "
+        "family-friendly and affordable ideas. "
+        "'invitations' is an array of exactly 3 objects with 'title' and 'body' (plain text, no markdown), "
+        "warm and inclusive, written in the requested tone. "
+        "No prose, no markdown, no extra keys."
+    )
+    user = (
+        f"Event type: {spec['event_type']}\n"
+        f"Expected neighbors: {spec['guests']}\n"
+        f"Budget: {spec['budget']}\n"
+        f"Location: {spec['location']}\n"
+        f"Organized by: {spec['organizing_group']}\n"
+        f"Date: {spec['event_date']}\nTime: {spec['event_time']}\n"
+        f"Venue: {spec['venue']}\nTone: {spec['tone']}\n"
+        "Return JSON only."
+    )
+    return system, user
+
+
+def _parse_combined(data: dict) -> Dict:
+    """Normalize each section of a combined response; a malformed or blank section is left out."""
+    parsed = {}
+    try:
+        parsed["ideas"] = _usable_ideas(data["ideas"])
+    except Exception:
+        pass
+    try:
+        parsed["invitations"] = _usable_invitations(data)
+    except Exception:
+        pass
+    return parsed
+
+
+def _usable_combined(data: dict) -> Dict:
+    parsed = _parse_combined(data)
+    if not parsed:
+        raise ValueError("plan: no usable section in the combined response")
+    return parsed
+
+
+def iter_plan(spec: Dict, mode: str = PLAN_MODE, only: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, object]]:
+    """
+    Yields (section name, section) pairs as soon as each one is ready, fastest first.
+    Used by the streaming results page; every section still ends in its own fallback.
+    only limits it to those sections, each generated on its own even in combined mode.
+    """
+    if mode == "combined" and only is None:
+        yield from generate_full_plan(spec).items()
+        return
+
+    calls = _section_calls(spec)
+    if only is not None:
+        wanted = set(only)
+        calls = {name: call for name, call in calls.items() if name in wanted}
+    pool = _get_executor()
+    tallies: Dict[str, FallbackOnce] = {}
+    futures = {_submit(pool, name, fn, args, tallies): name for name, (fn, _, args) in calls.items()}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=_wait_left()):
+            pending.discard(future)
+            name = futures[future]
+            try:
+                yield name, future.result()
+            except Exception:
+                _, fallback, args = calls[name]
+                tallies[name].count(name)
+                yield name, fallback(*args)
+    except FutureTimeout:
+        for future in pending:
+            name = futures[future]
+            _, fallback, args = calls[name]
+            tallies[name].count(name)
+            yield name, fallback(*args)
+
+
+def generate_full_plan(spec: Dict, concurrent: bool = PLAN_CONCURRENT) -> Dict:
+    """
+    Ideas and invitations from a single JSON completion, sharing one copy of the event context;
+    the timeline is built locally (make_timeline). Any section missing or malformed in the
+    response is regenerated on its own (and so still ends in that section's fallback if the retry fails too).
+    """
+    calls = _section_calls(spec)
+    try:
+        system, user = _combined_prompt(spec)
+        plan = complete_json("plan", system, user, temperature=0.7, model=MODEL, caps=PLAN_CAPS,
+                             validate=_usable_combined)
+    except Exception:
+        plan = {}
+    missing = {name: call for name, call in calls.items() if name not in plan}
+    if missing:
+        plan.update(_run_sections(missing, concurrent))
+    return plan
+
+
+def generate_plan(spec: Dict, concurrent: bool = PLAN_CONCURRENT, mode: str = PLAN_MODE) -> Dict:
+    """
+    Returns: {"invitations": [...], "ideas": {...}, "timeline": [...]}
+    mode="sections" makes one completion per section; with concurrent=True they are fanned
+    out to a thread pool, so the wait is the slowest single section rather than the sum.
+    mode="combined" asks for the whole plan in one round trip (see generate_full_plan).
+    """
+    if mode == "combined":
+        return generate_full_plan(spec, concurrent)
+    return _run_sections(_section_calls(spec), concurrent)
+
+
+# ---- async twins for the ASGI app (asgi_app.py) ----
+
+_ASYNC_GENERATORS = {
+    "invitations": agenerate_invitations,
+    "ideas": agenerate_event_ideas,
+    "timeline": amake_timeline,
+}
+
+
+async def _bounded(coro):
+    # Backstop only: the upstream call has the same deadline and records the timeout itself
+    return await asyncio.wait_for(coro, _wait_left())
+
+
+async def _section_async(name: str, calls: Dict):
+    # Runs as its own task, so the fallback tally is the task's and its fallback is counted once
+    tally = enter_fallback_scope()
+    _, fallback, args = calls[name]
+    try:
+        return await _bounded(_ASYNC_GENERATORS[name](*args))
+    except Exception:
+        tally.count(name)
+        return fallback(*args)
+
+
+async def _run_sections_async(calls: Dict) -> Dict:
+    names = list(calls)
+    results = await asyncio.gather(*(_section_async(name, calls) for name in names))
+    return dict(zip(names, results))
+
+
+async def agenerate_full_plan(spec: Dict) -> Dict:
+    calls = _section_calls(spec)
+    try:
+        system, user = _combined_prompt(spec)
+        plan = await acomplete_json("plan", system, user, temperature=0.7, model=MODEL, caps=PLAN_CAPS,
+                                    validate=_usable_combined)
+    except Exception:
+        plan = {}
+    missing = {name: call for name, call in calls.items() if name not in plan}
+    if missing:
+        plan.update(await _run_sections_async(missing))
+    return plan
+
+
+async def agenerate_plan(spec: Dict, mode: str = PLAN_MODE) -> Dict:
+    """generate_plan on the event loop: the three sections are awaited together, no threads involved."""
+    if mode == "combined":
+        return await agenerate_full_plan(spec)
+    return await _run_sections_async(_section_calls(spec))
+
+
+async def aiter_plan(spec: Dict, mode: str = PLAN_MODE) -> AsyncIterator[Tuple[str, object]]:
+    """iter_plan on the event loop: (section name, section) pairs, fastest first."""
+    if mode == "combined":
+        for item in (await agenerate_full_plan(spec)).items():
+            yield item
+        return
+
+    calls = _section_calls(spec)
+
+    async def run(name):
+        return name, await _section_async(name, calls)
+
+    for next_done in asyncio.as_completed([run(name) for name in calls]):
+        yield await next_done
@@ -1,88 +1,105 @@
-import os
 import json
-from datetime import datetime, timedelta
-from typing import List, Dict
-from openai import OpenAI
-
-MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-
-def _fallback_timeline(event_type: str, event_date: str) -> List[Dict]:
-    return [
-        {"period": "6–4 Weeks Before", "tasks": [
-            "Form volunteer committee",
-            "Apply for permits if required",
-            "Set event budget & attendance goals"
-        ]},
-        {"period": "4–2 Weeks Before", "tasks": [
-            "Design and distribute flyers",
-            "Confirm potluck sign-ups or food vendors",
-            "Plan group activities and entertainment"
-        ]},
-        {"period": "1 Week Before", "tasks": [
-            "Finalize equipment rentals (tables, chairs)",
-            "Confirm volunteer roles",
-            "Purchase supplies"
-        ]},
-        {"period": "Event Day", "tasks": [
-            "Set up booths, tables, and greeting station",
-            "Coordinate food and activity areas",
-            "Enjoy the community gathering & cleanup"
-        ]},
-    ]
+import os
+from typing import List, Dict, Tuple
 
-def _date_window_labels(event_date: str) -> List[str]:
-    try:
-        d = datetime.strptime(event_date, "%Y-%m-%d")
-    except Exception:
-        return ["6–4 Weeks Before", "4–2 Weeks Before", "1 Week Before", "Event Day"]
-    return [
-        f"{(d - timedelta(days=42)).strftime('%b %d')} – {(d - timedelta(days=28)).strftime('%b %d')}",
-        f"{(d - timedelta(days=28)).strftime('%b %d')} – {(d - timedelta(days=14)).strftime('%b %d')}",
-        f"{(d - timedelta(days=7)).strftime('%b %d')} – {(d - timedelta(days=1)).strftime('%b %d')}",
-        d.strftime("%b %d (Event Day)"),
-    ]
+from core.timeline_rules import build_timeline
+from utils.cache import cached, normalize_text
+from utils.config import TIMELINE_LLM
+from utils.llm import acomplete_json, complete_json
+from utils.metrics import SECTION_SECONDS, count_fallback, timed
+from utils.singleflight import coalesced
+from utils.tracing import spanned
 
-def make_timeline(event_type: str, event_date: str) -> List[Dict]:
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+TIMELINE_CAPS = {("timeline",): 6}
+
+def _fallback_timeline(event_type: str, event_date: str, guests: int = 50) -> List[Dict]:
+    # The rule-based timeline is both the default and the fallback for the LLM enrichment
+    return build_timeline(event_type, event_date, guests)
+
+def _normalize_timeline(tl: list) -> List[Dict]:
+    out = []
+    for block in tl[:6]:
+        period = str(block.get("period", "")).strip()
+        tasks = [str(t).strip() for t in block.get("tasks", [])][:6]
+        if not period:
+            continue
+        if not tasks:
+            continue
+        out.append({"period": period, "tasks": tasks})
+    return out
+
+def _timeline_key(event_type, base) -> tuple:
+    # base already reflects the date, guest count and lead time, so it keys the enrichment exactly
+    return normalize_text(event_type), base
+
+@spanned("timeline.prompt")
+def _timeline_prompt(event_type: str, base: List[Dict]) -> Tuple[str, str]:
+    system = (
+        "You are a community event timeline planner. "
+        "You get a draft timeline and return ONLY JSON with key 'timeline': the same periods, "
+        "same 'period' labels in the same order, each with 'tasks' (array of 3-6 short items). "
+        "No extra text, no markdown."
+    )
+    user = (
+        f"Event: {event_type}.\n"
+        f"Draft timeline: {json.dumps(base, ensure_ascii=False)}\n"
+        "Make the tasks specific to this event, keep every deadline-critical task "
+        "(permits, venue, volunteers) and keep numbers as given. Return JSON only."
+    )
+    return system, user
+
+@spanned("timeline.normalize")
+def _usable_timeline(data: dict, base: List[Dict]) -> List[Dict]:
+    out = _normalize_timeline(data.get("timeline", []))
+    if len(out) != len(base):
+        raise ValueError("timeline: periods do not match the draft")
+    # Dates come from the rules, never from the model
+    return [{"period": b["period"], "tasks": o["tasks"]} for b, o in zip(base, out)]
+
+@cached("timeline", _timeline_key)
+@coalesced("timeline", _timeline_key)
+def _timeline_from_llm(event_type: str, base: List[Dict]) -> List[Dict]:
+    system, user = _timeline_prompt(event_type, base)
+    return complete_json("timeline", system, user, temperature=0.6, model=MODEL, caps=TIMELINE_CAPS,
+                         validate=lambda data: _usable_timeline(data, base))
+
+@cached("timeline", _timeline_key)
+@coalesced("timeline", _timeline_key)
+async def _timeline_from_llm_async(event_type: str, base: List[Dict]) -> List[Dict]:
+    system, user = _timeline_prompt(event_type, base)
+    return await acomplete_json("timeline", system, user, temperature=0.6, model=MODEL, caps=TIMELINE_CAPS,
+                                validate=lambda data: _usable_timeline(data, base))
+
+@timed(SECTION_SECONDS, "timeline")
+@spanned("timeline")
+def make_timeline(event_type: str, event_date: str, guests: int = 50) -> List[Dict]:
     """
-    Returns: [{ "period": "label", "tasks": ["...", "..."] }, ...]  (4–6 periods)
+    Returns: [{ "period": "label", "tasks": ["...", "..."] }, ...]  (up to 6 periods)
+    Built locally from the task catalog (core/timeline_rules.py); with TIMELINE_LLM on,
+    the model rewrites the tasks for the event and the local timeline is the fallback.
     """
+    base = build_timeline(event_type, event_date, guests)
+    if not TIMELINE_LLM:
+        return base
     try:
-        labels = _date_window_labels(event_date)
-        client = OpenAI()
-        system = (
-            "You are a community event timeline planner. "
-            "Return ONLY JSON with key 'timeline' which is an array of 4-6 objects. "
-            "Each object has 'period' (string label) and 'tasks' (array of 3-6 short items). "
-            "No extra text, no markdown."
-        )
-        user = (
-            f"Generate a planning timeline for a neighborhood/community event: {event_type}, on {event_date}.\n"
-            f"Include early tasks (permissions, flyers, volunteer committees), mid-term tasks (confirm food, activities, vendors), and event-day setup.\n"
-            f"Suggested period labels: {labels}\nReturn JSON only."
-        )
-        resp = client.chat.completions.create(
-            model=MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            temperature=0.6,
-        )
-        data = json.loads(resp.choices[0].message.content)
-        tl = data.get("timeline", [])
-        out = []
-        for block in tl[:6]:
-            period = str(block.get("period", "")).strip()
-            tasks = [str(t).strip() for t in block.get("tasks", [])][:6]
-            if not period:
-                continue
-            if not tasks:
-                continue
-            out.append({"period": period, "tasks": tasks})
-        return out or _fallback_timeline(event_type, event_date)
+        return _timeline_from_llm(event_type, base)
     except Exception:
-        return _fallback_timeline(event_type, event_date)
+        count_fallback("timeline")
+        return base
+
+@timed(SECTION_SECONDS, "timeline")
+@spanned("timeline")
+async def amake_timeline(event_type: str, event_date: str, guests: int = 50) -> List[Dict]:
+    """Async twin of make_timeline (AsyncOpenAI client), same shape and fallback."""
+    base = build_timeline(event_type, event_date, guests)
+    if not TIMELINE_LLM:
+        return base
+    try:
+        return await _timeline_from_llm_async(event_type, base)
+    except Exception:
+        count_fallback("timeline")
+        return base
 
 
 
@@ -0,0 +1,203 @@
+import math
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class Task(NamedTuple):
+    due: int                    # ideal number of days before the event (negative = after it)
+    latest: int                 # last day before the event it can still be done
+    priority: int               # 1 = must do ... 4 = nice to have
+    text: str                   # may use the quantities from _quantities()
+    kinds: Tuple[str, ...] = ()  # event kinds it applies to, empty = every event
+    min_guests: int = 0
+    rush: Optional[str] = None   # what to do instead once it is too late for `text`
+
+
+# Task catalog, kept in rough due order. Kinds come from _event_kind().
+TASK_CATALOG: Tuple[Task, ...] = (
+    # early
+    Task(42, 14, 1, "Form a volunteer committee and pick a lead organizer",
+         rush="Pick a lead organizer today and ask a few neighbors to help"),
+    Task(42, 21, 1, "Apply for a street-closure permit", ("block",),
+         rush="Hold it in a park, driveway or cul-de-sac – closure permits take about 3 weeks"),
+    Task(42, 14, 1, "Invite community groups and performers to host booths", ("fair",),
+         rush="Personally ask 3–4 groups that already run stalls nearby"),
+    Task(42, 10, 1, "Open performer sign-ups", ("show",),
+         rush="Personally invite 6–8 performers you know"),
+    Task(42, 3, 2, "Set the budget and an attendance goal of about {guests} neighbors"),
+    Task(35, 7, 1, "Reserve the venue or park space",
+         rush="Confirm the venue today and keep a backup spot in mind"),
+    Task(35, 14, 1, "Check whether a permit is needed and apply", ("fair", "show", "potluck", "general"),
+         rush="Call the city today about short-notice permits, or keep it on private property"),
+    Task(35, 7, 1, "Coordinate trash pickup with the city", ("cleanup",),
+         rush="Plan to haul bags to the nearest drop-off site"),
+    # mid-term
+    Task(28, 14, 2, "Book {restrooms} portable restroom(s)", min_guests=100,
+         rush="Arrange access to restrooms in a nearby building"),
+    Task(28, 5, 2, "Design and post {flyers} flyers plus a neighborhood group post",
+         rush="Post in neighborhood chats and knock on doors nearby"),
+    Task(28, 3, 2, "Notify everyone on the closed block in writing", ("block",)),
+    Task(28, 3, 2, "Map the booth layout and assign spots", ("fair",)),
+    Task(21, 3, 2, "Recruit {volunteers} volunteers (about 1 per 15 guests)"),
+    Task(21, 3, 2, "Borrow or rent {tables} tables and {chairs} chairs", ("block", "fair", "show", "potluck", "general")),
+    Task(21, 7, 2, "Check health permits for food vendors", ("fair",),
+         rush="Limit food to pre-packaged snacks and potluck dishes"),
+    Task(21, 3, 1, "Book a sound system and a stage area", ("show",)),
+    Task(21, 3, 2, "Line up a sound system and a microphone for announcements", ("block", "fair"), min_guests=100),
+    Task(21, 3, 1, "Open a dish sign-up sheet (mains, sides, desserts, drinks)", ("potluck",)),
+    Task(21, 2, 1, "Borrow gloves, grabbers and {trash_bags} trash bags", ("cleanup",)),
+    Task(21, 7, 3, "Arrange a first-aid volunteer or EMT standby", min_guests=150),
+    Task(14, 2, 3, "Plan kids' games: chalk zone, bubbles, relay races", ("block", "potluck")),
+    Task(14, 2, 3, "Borrow barricades and cones from the city", ("block",)),
+    Task(14, 2, 2, "Finalize the running order and the MC script", ("show",)),
+    Task(14, 2, 3, "Print booth signs and a map of the fair", ("fair",)),
+    Task(14, 1, 2, "Map cleanup zones and assign team leaders", ("cleanup",)),
+    Task(14, 2, 3, "Plan the activity schedule and who runs each part", ("fair", "potluck", "general")),
+    Task(14, 2, 3, "Plan parking and assign a traffic volunteer", min_guests=75),
+    # final week
+    Task(7, 1, 1, "Confirm volunteer roles and shift times"),
+    Task(7, 1, 2, "Collect allergy info and print dish labels", ("potluck",)),
+    Task(7, 1, 2, "Hold a rehearsal with the performers", ("show",)),
+    Task(5, 1, 2, "Buy supplies: plates, cups, napkins and {trash_bags} trash bags",
+         ("block", "fair", "show", "potluck", "general")),
+    Task(5, 1, 3, "Order {water} gallons of water and some ice"),
+    Task(3, 1, 2, "Check the weather forecast and settle a rain plan"),
+    Task(2, 1, 3, "Send a reminder to everyone who RSVP'd"),
+    Task(1, 0, 2, "Pack the kit: first aid, tape, markers, extension cords"),
+    # event day
+    Task(0, 0, 1, "Place barricades before guests arrive", ("block",)),
+    Task(0, 0, 1, "Sound check one hour before doors", ("show",)),
+    Task(0, 0, 1, "Check in booth hosts and walk the layout", ("fair",)),
+    Task(0, 0, 1, "Set up the serving line and dish labels", ("potluck",)),
+    Task(0, 0, 1, "Hand out vests and gloves; go over sharps safety", ("cleanup",)),
+    Task(0, 0, 1, "Brief volunteers 30 minutes before the start"),
+    Task(0, 0, 2, "Set up the welcome table and {stations} trash & recycling station(s)"),
+    Task(0, 0, 3, "Count the bags collected for the recap", ("cleanup",)),
+    Task(0, 0, 4, "Take photos and collect contacts for next time"),
+    # after
+    Task(-1, -1, 2, "Return borrowed and rented equipment"),
+    Task(-1, -1, 2, "Send thank-you notes to volunteers and sponsors"),
+    Task(-1, -1, 3, "Settle expenses and reimburse volunteers"),
+    Task(-1, -1, 4, "Share photos and a quick feedback survey"),
+)
+
+# (first day, last day) before the event, latest window last; together they cover every `due` above
+WINDOWS: Tuple[Tuple[int, int], ...] = ((42, 29), (28, 15), (14, 8), (7, 1), (0, 0), (-1, -1))
+RELATIVE_LABELS = (
+    "6–4 Weeks Before", "4–2 Weeks Before", "2–1 Weeks Before", "Final Week", "Event Day", "Day After",
+)
+MAX_TASKS = 6
+
+_KIND_WORDS = (
+    ("block", ("block", "street")),
+    ("fair", ("fair", "festival", "market", "cultural", "heritage")),
+    ("show", ("talent", "show", "concert", "open mic", "performance")),
+    ("potluck", ("potluck", "picnic", "bbq", "barbecue", "dinner", "brunch")),
+    ("cleanup", ("cleanup", "clean-up", "clean up", "litter", "garden")),
+)
+
+
+def _event_kind(event_type: str) -> str:
+    name = str(event_type or "").lower()
+    for kind, words in _KIND_WORDS:
+        if any(w in name for w in words):
+            return kind
+    return "general"
+
+
+def _quantities(guests: int) -> Dict[str, int]:
+    return {
+        "guests": guests,
+        "volunteers": max(3, math.ceil(guests / 15)),
+        "tables": max(2, math.ceil(guests / 8)),
+        "chairs": max(10, math.ceil(guests * 0.6 / 5) * 5),
+        "trash_bags": max(10, math.ceil(guests / 5)),
+        "stations": max(1, math.ceil(guests / 75)),
+        "restrooms": max(1, math.ceil(guests / 100)),
+        "water": max(2, math.ceil(guests / 4)),
+        "flyers": max(25, math.ceil(guests * 1.5 / 25) * 25),
+    }
+
+
+def _parse_date(event_date: str) -> Optional[date]:
+    try:
+        return datetime.strptime(str(event_date).strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _window_label(event_day: date, first: int, last: int, today: date) -> str:
+    if first == last == 0:
+        return event_day.strftime("%b %d (Event Day)")
+    if first == last == -1:
+        return (event_day + timedelta(days=1)).strftime("%b %d (Day After)")
+    start = "Today" if event_day - timedelta(days=first) == today else (event_day - timedelta(days=first)).strftime("%b %d")
+    end = (event_day - timedelta(days=last)).strftime("%b %d")
+    return start if first == last else f"{start} – {end}"
+
+
+def _windows(lead: int) -> List[Tuple[int, int, int]]:
+    """(first day, last day, index into RELATIVE_LABELS) for the windows still ahead."""
+    if lead >= WINDOWS[0][1]:
+        return [(min(first, lead), last, i) for i, (first, last) in enumerate(WINDOWS) if last <= lead]
+    # Under four weeks the 6-week grid no longer fits: split the days left into up to four windows
+    parts = min(4, lead)
+    before = [
+        (lead - lead * k // parts, lead - lead * (k + 1) // parts + 1, 3)
+        for k in range(parts)
+    ]
+    return before + [(0, 0, 4), (-1, -1, 5)]
+
+
+def build_timeline(event_type: str, event_date: str, guests: int = 50, today: Optional[date] = None) -> List[Dict]:
+    """
+    Deterministic timeline from TASK_CATALOG: [{ "period": "label", "tasks": [...] }, ...]
+    Tasks are picked by event kind and guest count and placed by days left until event_date.
+    With a short lead time the remaining days are split into fewer, shorter windows; overdue
+    tasks move up to today if there is still time, or are swapped for their rush alternative.
+    A missing, malformed or past date gives the relative 6-week schedule.
+    """
+    try:
+        guests = max(1, int(guests))
+    except (TypeError, ValueError):
+        guests = 50
+    kind = _event_kind(event_type)
+    qty = _quantities(guests)
+    today = today or date.today()
+    event_day = _parse_date(event_date)
+    lead = (event_day - today).days if event_day else -1
+    dated = lead >= 0
+    if not dated:
+        lead = WINDOWS[0][0]
+
+    windows = _windows(lead)
+    slots: List[List[Tuple[Task, str]]] = [[] for _ in windows]
+    for task in TASK_CATALOG:
+        if guests < task.min_guests or (task.kinds and kind not in task.kinds):
+            continue
+        text = task.text
+        if task.due > lead:
+            if lead < task.latest:
+                if not task.rush:
+                    continue
+                text = task.rush
+                task = task._replace(latest=0)  # the workaround has no deadline of its own
+            slot = 0
+        else:
+            slot = next(n for n, (first, last, _) in enumerate(windows) if last <= task.due <= first)
+        slots[slot].append((task, text.format(**qty)))
+
+    # Keep the most important tasks per window; the rest spill into the next window while still in time
+    timeline = []
+    for n, (first, last, i) in enumerate(windows):
+        tasks = sorted(slots[n], key=lambda item: (item[0].priority, -item[0].due))
+        keep, spill = tasks[:MAX_TASKS], tasks[MAX_TASKS:]
+        if n + 1 < len(windows):
+            next_first = windows[n + 1][0]
+            slots[n + 1].extend(item for item in spill if item[0].latest <= next_first)
+        if not keep:
+            continue
+        keep.sort(key=lambda item: -item[0].due)
+        label = _window_label(event_day, first, last, today) if dated else RELATIVE_LABELS[i]
+        timeline.append({"period": label, "tasks": [text for _, text in keep]})
+    return timeline
@@ -0,0 +1,105 @@
+"""
+Pre-generate ideas for every event type x budget x guest bucket on the web form and
+write them to the memory-mapped warm store that app.py and asgi_app.py read first.
+
+    python prebuild.py --locations "Elm Street, Springfield" "Riverside Park" --concurrency 8
+
+Event types and budget tiers are read from templates/index.html. Each cell is generated
+once without a location and once per --locations entry. Cells whose generation fails are
+left out (they keep going to the model at request time), so a fallback is never stored.
+"""
+import argparse
+import contextvars
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()  # Loads OPENAI_API_KEY from .env
+
+from core.ideas import _ideas_from_llm, _ideas_key  # noqa: E402
+from utils.admission import BULK, traffic  # noqa: E402
+from utils.cache import GUEST_BUCKETS, cache_bypass  # noqa: E402
+from utils.config import MODEL, WARM_STORE  # noqa: E402
+from utils.warmstore import write_store  # noqa: E402
+
+FORM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "index.html")
+
+
+def form_options(name: str, path: str = FORM) -> list:
+    """Option labels of <select name=...> in the form template."""
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    select = re.search(rf'<select name="{name}"[^>]*>(.*?)</select>', html, re.S)
+    if not select:
+        raise SystemExit(f"no <select name=\"{name}\"> in {path}")
+    return [label.strip() for label in re.findall(r"<option[^>]*>(.*?)</option>", select.group(1), re.S)]
+
+
+def grid(locations: list) -> list:
+    # One representative guest count per bucket: the bucket's upper edge, plus one above the last edge
+    guest_counts = list(GUEST_BUCKETS) + [GUEST_BUCKETS[-1] * 2]
+    return [
+        (event_type, guests, budget, location)
+        for event_type in form_options("event_type")
+        for budget in form_options("budget")
+        for guests in guest_counts
+        for location in [""] + locations
+    ]
+
+
+def _generate(cell, fresh: bool):
+    with cache_bypass(fresh), traffic(BULK, "prebuild"):
+        return _ideas_from_llm(*cell)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-generate the warm store of ideas")
+    parser.add_argument("-o", "--output", default=WARM_STORE, help="store file (default WARM_STORE)")
+    parser.add_argument("--locations", nargs="*", default=[], help="locations to prebuild besides the generic one")
+    parser.add_argument("--locations-file", help="file with one location per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="generations at once")
+    parser.add_argument("--fresh", action="store_true", help="don't reuse cached responses")
+    args = parser.parse_args()
+    if not args.output:
+        raise SystemExit("WARM_STORE is disabled; pass -o")
+
+    locations = list(args.locations)
+    if args.locations_file:
+        with open(args.locations_file, encoding="utf-8") as f:
+            locations += [line.strip() for line in f if line.strip()]
+    cells = grid(locations)
+    print(f"{len(cells)} cells", file=sys.stderr)
+
+    entries, failed = [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, _generate, cell, args.fresh): cell for cell in cells
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            cell = futures[future]
+            try:
+                entries.append(("ideas", _ideas_key(*cell), future.result()))
+            except Exception as e:
+                failed += 1
+                print(f"failed {cell}: {e!r}", file=sys.stderr)
+            if done % 25 == 0:
+                print(f"{done}/{len(cells)} done, {failed} failed", file=sys.stderr)
+
+    if not entries:
+        raise SystemExit("nothing generated; store left unchanged")
+    count = write_store(args.output, entries, meta={"model": MODEL, "cells": len(cells), "failed": failed})
+    size = os.path.getsize(args.output)
+    print(
+        f"wrote {count} entries ({size / 1024:.0f} KiB) to {args.output} in {time.perf_counter() - start:.1f}s, "
+        f"{failed} failed",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+
+from utils.config import (
+    ADMISSION_BULK_MAX_WAIT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT, ADMISSION_OUTPUT_TOKENS, OPENAI_MAX_INFLIGHT,
+    OPENAI_RPM, OPENAI_TPM, SCHED_BULK_WEIGHT, SCHED_INTERACTIVE_RESERVE, SCHED_INTERACTIVE_WEIGHT,
+)
+from utils.deadline import DeadlineExceeded, record_timeout, remaining
+from utils.metrics import ADMISSION_WAIT, add_collector
+from utils.tracing import span
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 8  # tokens the chat format adds per message
+
+INTERACTIVE, BULK = "interactive", "bulk"
+_traffic = contextvars.ContextVar("traffic", default=(INTERACTIVE, ""))
+
+
+@contextmanager
+def traffic(priority: Optional[str] = None, group: Optional[str] = None):
+    """
+    Schedule the completions made inside the block as `priority` (INTERACTIVE or BULK) on
+    behalf of `group` (the organizing group); None keeps the surrounding value.
+    """
+    current_priority, current_group = _traffic.get()
+    group = current_group if group is None else " ".join(str(group).split()).casefold()
+    token = _traffic.set((priority or current_priority, group))
+    try:
+        yield
+    finally:
+        _traffic.reset(token)
+
+
+def current_priority() -> str:
+    """The admission class (INTERACTIVE or BULK) completions made here are scheduled as."""
+    return _traffic.get()[0]
+
+
+class AdmissionTimeout(RuntimeError):
+    """No upstream slot became free within the allowed wait (or the queue was already full)."""
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second up to per_minute; per_minute <= 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def eta(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 = now). Costs above capacity wait for a full bucket."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        short = min(amount, self.capacity) - self.level
+        return max(0.0, short / self.rate)
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level -= amount
+
+    def give(self, amount: float) -> None:
+        """Return (or, negative, charge more of) an earlier take; the level may go below zero."""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, now: float) -> None:
+        if not self.unlimited:
+            self._refill(now)
+            self.level = min(self.level, 0.0)
+
+
+class _Ticket:
+    __slots__ = ("cost", "section", "priority", "group", "tag", "granted", "dropped", "event", "loop", "future")
+
+    def __init__(self, cost: int, section: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.cost = cost
+        self.section = section
+        self.priority, self.group = _traffic.get()
+        self.tag = 0.0
+        self.granted = False
+        self.dropped = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class FairQueue:
+    """
+    Two-level weighted fair queue of waiting tickets, charged in estimated tokens.
+    Between classes: each class's pass advances by cost / weight when one of its tickets is
+    served and the backlogged class with the lowest pass goes next, so with weights 8:1 bulk
+    still gets a ninth of the tokens while both are waiting. Within a class: start-time fair
+    queueing across groups, so a group with a hundred queued calls can't push ahead of the
+    one call of another group.
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = weights
+        self._heaps: Dict[str, list] = {c: [] for c in weights}
+        self._depth = {c: 0 for c in weights}
+        self._pass = {c: 0.0 for c in weights}
+        self._vtime = {c: 0.0 for c in weights}
+        self._finish: Dict[str, Dict[str, float]] = {c: {} for c in weights}
+        self._seq = itertools.count()
+
+    def push(self, ticket: _Ticket) -> None:
+        c = ticket.priority
+        if not self._depth[c]:
+            # A class coming back from idle starts level with the others instead of cashing in the gap
+            active = [self._pass[o] for o in self.weights if self._depth[o]]
+            if active:
+                self._pass[c] = max(self._pass[c], min(active))
+        finish = self._finish[c]
+        ticket.tag = max(self._vtime[c], finish.get(ticket.group, 0.0))
+        finish[ticket.group] = ticket.tag + ticket.cost
+        heapq.heappush(self._heaps[c], (ticket.tag, next(self._seq), ticket))
+        self._depth[c] += 1
+
+    def heads(self) -> List[_Ticket]:
+        """The next ticket of each backlogged class, in the order the classes are due."""
+        heads = []
+        for c, heap in self._heaps.items():
+            while heap and heap[0][2].dropped:
+                heapq.heappop(heap)
+            if heap:
+                heads.append(heap[0][2])
+        return sorted(heads, key=lambda t: self._pass[t.priority])
+
+    def pop(self, ticket: _Ticket) -> None:
+        """Take `ticket` (a class head from heads()) off the queue as served."""
+        c = ticket.priority
+        heapq.heappop(self._heaps[c])
+        self._depth[c] -= 1
+        self._vtime[c] = ticket.tag
+        self._pass[c] += ticket.cost / self.weights[c]
+        finish = self._finish[c]
+        if len(finish) > 1024:
+            # Groups whose last call is already behind the virtual clock carry no state worth keeping
+            for group in [g for g, tag in finish.items() if tag <= ticket.tag]:
+                del finish[group]
+
+    def remove(self, ticket: _Ticket) -> None:
+        ticket.dropped = True
+        self._depth[ticket.priority] -= 1
+
+    def depth(self, priority: str) -> int:
+        return self._depth[priority]
+
+    def __len__(self) -> int:
+        return sum(self._depth.values())
+
+
+class Permit:
+    """Held while a call is in flight; settle() corrects the token estimate once usage is known."""
+
+    def __init__(self, controller: "AdmissionController", section: str, cost: int):
+        self.controller = controller
+        self.section = section
+        self.cost = cost
+        self.settled = False
+
+    def settle(self, tokens: Optional[int]) -> None:
+        if self.settled or tokens is None:
+            return
+        self.settled = True
+        self.controller._settle(self.cost, tokens)
+
+
+class AdmissionController:
+    """
+    Gate for outbound completions: at most max_inflight at once (bulk calls leave `reserve`
+    slots to interactive ones), and no faster than the requests-per-minute and
+    tokens-per-minute buckets refill. Waiting calls are served in FairQueue order and give
+    up after their class's max wait (or when the request deadline runs out).
+    """
+
+    def __init__(self, max_inflight: int, rpm: float, tpm: float, max_wait: Dict[str, float], max_queue: int,
+                 weights: Dict[str, float], reserve: int = 0):
+        self.max_inflight = max_inflight
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.reserve = reserve
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.inflight = 0
+        self._queue = FairQueue(weights)
+        self._lock = threading.Lock()
+        self._stats = {"throttled": 0, "rejected": 0}
+        self._classes = {
+            c: {"admitted": 0, "queued": 0, "timed_out": 0, "max_queue_depth": 0, "waits": deque(maxlen=1000)}
+            for c in weights
+        }
+
+    def _blocked_for(self, ticket: _Ticket, now: float) -> float:
+        """0 when the ticket may start now, else seconds to wait (inf = until a slot is released)."""
+        if self.max_inflight > 0:
+            slots = self.max_inflight - (self.reserve if ticket.priority == BULK else 0)
+            if self.inflight >= max(1, slots):
+                return float("inf")
+        return max(self.requests.eta(1, now), self.tokens.eta(ticket.cost, now))
+
+    def _dispatch(self) -> float:
+        """Admit queued tickets while they fit (lock held); returns how long the next one must wait."""
+        now = time.monotonic()
+        while True:
+            heads = self._queue.heads()
+            if not heads:
+                return 0.0
+            for ticket in heads:
+                wait = self._blocked_for(ticket, now)
+                if wait == 0:
+                    self._queue.pop(ticket)
+                    self._grant(ticket)
+                    ticket.granted = True
+                    ticket.wake()
+                    break
+                if wait != float("inf"):
+                    return wait  # short on request/token budget: nobody jumps ahead of the class that is due
+            else:
+                return float("inf")
+
+    def _grant(self, ticket: _Ticket) -> None:
+        self.inflight += 1
+        self.requests.take(1)
+        self.tokens.take(ticket.cost)
+        self._classes[ticket.priority]["admitted"] += 1
+
+    def _enter(self, ticket: _Ticket) -> bool:
+        """Admit at once when nobody is waiting and there is room, else queue. True if admitted."""
+        with self._lock:
+            tally = self._classes[ticket.priority]
+            if not len(self._queue) and self._blocked_for(ticket, time.monotonic()) == 0:
+                self._grant(ticket)
+                tally["waits"].append(0.0)
+                ADMISSION_WAIT.observe(0.0, ticket.priority)
+                return True
+            if self.max_queue > 0 and len(self._queue) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise AdmissionTimeout(f"{ticket.section}: admission queue full ({len(self._queue)} waiting)")
+            self._queue.push(ticket)
+            tally["queued"] += 1
+            tally["max_queue_depth"] = max(tally["max_queue_depth"], self._queue.depth(ticket.priority))
+            self._dispatch()
+            return ticket.granted
+
+    def _limit(self, ticket: _Ticket) -> tuple:
+        max_wait = self.max_wait[ticket.priority]
+        left = remaining()
+        if left is not None and left < max_wait:
+            return max(0.0, left), True
+        return max_wait, False
+
+    def _next_wait(self, ticket: _Ticket, started: float, limit: float) -> Optional[float]:
+        """Re-check the queue after a wake-up; seconds to sleep next, or None when out of time (lock held)."""
+        head_wait = self._dispatch()
+        if ticket.granted:
+            return 0.0
+        left = limit - (time.monotonic() - started)
+        if left <= 0:
+            return None
+        return min(left, head_wait) if head_wait > 0 else left
+
+    def _give_up(self, ticket: _Ticket, by_deadline: bool) -> None:
+        """Leave the queue (lock held); raises unless the ticket was granted in the meantime."""
+        if ticket.granted:
+            return
+        self._queue.remove(ticket)
+        self._dispatch()  # the tickets behind may fit now
+        if by_deadline:
+            record_timeout(ticket.section)
+            raise DeadlineExceeded(f"{ticket.section}: request time budget ran out waiting for admission")
+        self._classes[ticket.priority]["timed_out"] += 1
+        raise AdmissionTimeout(f"{ticket.section}: no upstream slot within {self.max_wait[ticket.priority]:g}s")
+
+    def _waited(self, ticket: _Ticket, started: float) -> None:
+        waited = time.monotonic() - started
+        with self._lock:
+            self._classes[ticket.priority]["waits"].append(waited)
+        ADMISSION_WAIT.observe(waited, ticket.priority)
+
+    def _abandon(self, ticket: _Ticket) -> None:
+        """The waiter was interrupted: drop the ticket, or hand back a slot granted meanwhile."""
+        with self._lock:
+            if ticket.granted:
+                self.inflight -= 1
+                self.requests.give(1)
+                self.tokens.give(ticket.cost)
+            else:
+                self._queue.remove(ticket)
+            self._dispatch()
+
+    def acquire(self, section: str, cost: int) -> Permit:
+        ticket = _Ticket(cost, section)
+        if self._enter(ticket):
+            return Permit(self, section, cost)
+        started = time.monotonic()
+        limit, by_deadline = self._limit(ticket)
+        try:
+            while True:
+                with self._lock:
+                    sleep = self._next_wait(ticket, started, limit)
+                    if sleep is None:
+                        self._give_up(ticket, by_deadline)
+                    if ticket.granted:
+                        break
+                ticket.event.wait(sleep)
+        except (AdmissionTimeout, DeadlineExceeded):
+            raise
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._waited(ticket, started)
+        return Permit(self, section, cost)
+
+    async def aacquire(self, section: str, cost: int) -> Permit:
+        ticket = _Ticket(cost, section, asyncio.get_running_loop())
+        if self._enter(ticket):
+            return Permit(self, section, cost)
+        started = time.monotonic()
+        limit, by_deadline = self._limit(ticket)
+        try:
+            while True:
+                with self._lock:
+                    sleep = self._next_wait(ticket, started, limit)
+                    if sleep is None:
+                        self._give_up(ticket, by_deadline)
+                    if ticket.granted:
+                        break
+                await asyncio.wait({ticket.future}, timeout=sleep)
+        except (AdmissionTimeout, DeadlineExceeded):
+            raise
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._waited(ticket, started)
+        return Permit(self, section, cost)
+
+    def release(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+            self._dispatch()
+
+    def _settle(self, estimated: int, actual: int) -> None:
+        with self._lock:
+            self.tokens.give(estimated - actual)
+            self._dispatch()
+
+    def throttle(self) -> None:
+        """Upstream said 429: empty both buckets so queued calls wait for a refill instead of piling on."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.drain(now)
+            self.tokens.drain(now)
+            self._stats["throttled"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tally = dict(self._stats)
+            tally["queue_depth"] = len(self._queue)
+            tally["inflight"] = self.inflight
+            now = time.monotonic()
+            self.requests.eta(0, now)
+            self.tokens.eta(0, now)
+            tally["requests_available"] = None if self.requests.unlimited else round(self.requests.level, 1)
+            tally["tokens_available"] = None if self.tokens.unlimited else round(self.tokens.level)
+            classes = {}
+            for c, counts in self._classes.items():
+                classes[c] = {k: v for k, v in counts.items() if k != "waits"}
+                classes[c]["queue_depth"] = self._queue.depth(c)
+                classes[c]["waits"] = sorted(counts["waits"])
+        for c, counts in classes.items():
+            waits = counts.pop("waits")
+            if waits:
+                counts["wait_ms_p50"] = round(waits[len(waits) // 2] * 1000, 2)
+                counts["wait_ms_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2)
+                counts["wait_ms_max"] = round(waits[-1] * 1000, 2)
+        tally["admitted"] = sum(counts["admitted"] for counts in classes.values())
+        tally["classes"] = classes
+        return tally
+
+
+_controller = AdmissionController(
+    OPENAI_MAX_INFLIGHT, OPENAI_RPM, OPENAI_TPM,
+    max_wait={INTERACTIVE: ADMISSION_MAX_WAIT, BULK: ADMISSION_BULK_MAX_WAIT},
+    max_queue=ADMISSION_MAX_QUEUE,
+    weights={INTERACTIVE: SCHED_INTERACTIVE_WEIGHT, BULK: SCHED_BULK_WEIGHT},
+    reserve=SCHED_INTERACTIVE_RESERVE,
+)
+
+# Running average of completion tokens per section, so the estimate tracks what each prompt really produces
+_output_tokens: Dict[str, float] = {}
+_output_lock = threading.Lock()
+
+
+def estimate_tokens(section: str, system: str, user: str) -> int:
+    """Prompt tokens (~4 characters each) plus the section's typical completion."""
+    prompt = (len(system) + len(user)) // CHARS_PER_TOKEN + 2 * MESSAGE_OVERHEAD
+    with _output_lock:
+        output = _output_tokens.get(section, ADMISSION_OUTPUT_TOKENS)
+    return int(prompt + output)
+
+
+def observe_output(section: str, completion_tokens: int) -> None:
+    with _output_lock:
+        seen = _output_tokens.get(section)
+        _output_tokens[section] = completion_tokens if seen is None else 0.8 * seen + 0.2 * completion_tokens
+
+
+@contextmanager
+def admitted(section: str, cost: int):
+    """Wait for an upstream slot; yields a Permit and frees the slot on exit."""
+    with span(f"{section}.queue"):
+        permit = _controller.acquire(section, cost)
+    try:
+        yield permit
+    finally:
+        _controller.release()
+
+
+@asynccontextmanager
+async def aadmitted(section: str, cost: int):
+    with span(f"{section}.queue"):
+        permit = await _controller.aacquire(section, cost)
+    try:
+        yield permit
+    finally:
+        _controller.release()
+
+
+def throttle() -> None:
+    _controller.throttle()
+
+
+def admission_stats() -> Dict:
+    return _controller.stats()
+
+
+def _admission_metrics():
+    stats = _controller.stats()
+    classes = stats["classes"]
+    yield ("admission_queue_depth", "gauge", "Completions waiting for an upstream slot",
+           [({"class": c}, counts["queue_depth"]) for c, counts in classes.items()])
+    yield ("admission_inflight", "gauge", "Completions holding an upstream slot", [({}, stats["inflight"])])
+    yield ("admission_timeouts_total", "counter", "Completions that gave up waiting for a slot",
+           [({"class": c}, counts["timed_out"]) for c, counts in classes.items()])
+
+
+add_collector(_admission_metrics)
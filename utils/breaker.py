@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from utils.config import (
+    BREAKER_ENABLED, BREAKER_ERROR_RATE, BREAKER_MIN_CALLS, BREAKER_OPEN_SECONDS, BREAKER_PROBE,
+    BREAKER_SLOW_CALL_SECONDS, BREAKER_SLOW_RATE, BREAKER_WINDOW, get_openai_client,
+)
+from utils.metrics import add_collector
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# allow() hands out (generation, is_probe); record() only trusts calls let through since the last trip
+Ticket = Tuple[int, bool]
+
+
+class CircuitOpen(RuntimeError):
+    """The backend is considered down; callers should serve their fallback right away."""
+
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker: opens when the error rate (or the share of calls slower than
+    slow_call_seconds) over the last `window` calls crosses its threshold. While open, allow()
+    returns None. After open_seconds one real request is let through as a probe (half-open);
+    success closes the circuit, failure re-opens it for another open_seconds. Only the call
+    holding the probe ticket decides that: calls still in flight from before the trip are
+    ignored when they finish.
+    """
+
+    def __init__(self, name: str, window: int, min_calls: int, error_rate: float,
+                 slow_call_seconds: float, slow_rate: float, open_seconds: float):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self._calls: deque = deque(maxlen=window)  # (ok, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._generation = 0
+        self._probe_in_flight = False
+        self._rejected = 0
+        self._opened_count = 0
+        self._lock = threading.Lock()
+        self.on_open = None  # called (outside the lock) each time the circuit trips
+
+    def allow(self) -> Optional[Ticket]:
+        """A ticket to pass to record() or release() once the call is over; None to reject it."""
+        with self._lock:
+            if self._state == CLOSED:
+                return (self._generation, False)
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return (self._generation, True)
+            self._rejected += 1
+            return None
+
+    def _is_probe(self, ticket: Ticket) -> bool:
+        return self._state == HALF_OPEN and ticket == (self._generation, True)
+
+    def record(self, ticket: Ticket, ok: bool, elapsed: float) -> None:
+        slow = elapsed >= self.slow_call_seconds
+        tripped = False
+        with self._lock:
+            if self._is_probe(ticket):
+                self._probe_in_flight = False
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    tripped = self._trip()
+            elif self._state == CLOSED and ticket[0] == self._generation:
+                self._calls.append((ok, slow))
+                if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                    failures = sum(1 for c_ok, _ in self._calls if not c_ok)
+                    slow_calls = sum(1 for _, c_slow in self._calls if c_slow)
+                    n = len(self._calls)
+                    if failures / n >= self.error_rate or slow_calls / n >= self.slow_rate:
+                        tripped = self._trip()
+        if tripped and self.on_open is not None:
+            self.on_open(self)
+
+    def release(self, ticket: Ticket) -> None:
+        """The call ended without saying anything about the backend; a probe makes way for the next one."""
+        with self._lock:
+            if self._is_probe(ticket):
+                self._probe_in_flight = False
+
+    def _trip(self) -> bool:
+        self._state = OPEN
+        self._generation += 1
+        self._opened_at = time.monotonic()
+        self._opened_count += 1
+        return True
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def snapshot(self) -> Dict:
+        state = self.state
+        with self._lock:
+            calls = len(self._calls)
+            failures = sum(1 for ok, _ in self._calls if not ok)
+            slow_calls = sum(1 for _, slow in self._calls if slow)
+            retry_in = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)) if state == OPEN else 0.0
+            return {
+                "name": self.name,
+                "state": state,
+                "window_calls": calls,
+                "window_error_rate": failures / calls if calls else 0.0,
+                "window_slow_rate": slow_calls / calls if calls else 0.0,
+                "rejected": self._rejected,
+                "times_opened": self._opened_count,
+                "probe_in": round(retry_in, 3),
+            }
+
+
+openai_breaker = CircuitBreaker(
+    "openai",
+    window=BREAKER_WINDOW,
+    min_calls=BREAKER_MIN_CALLS,
+    error_rate=BREAKER_ERROR_RATE,
+    slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+    slow_rate=BREAKER_SLOW_RATE,
+    open_seconds=BREAKER_OPEN_SECONDS,
+)
+
+
+_prober_lock = threading.Lock()
+_prober_running = False
+
+
+def _probe_until_closed(breaker: CircuitBreaker) -> None:
+    """Background probe: a cheap models.list() each time the breaker is ready to test the backend."""
+    global _prober_running
+    try:
+        while breaker.state != CLOSED:
+            time.sleep(min(1.0, breaker.open_seconds))
+            client = get_openai_client()
+            if client is None or breaker.state != HALF_OPEN:
+                continue
+            ticket = breaker.allow()
+            if ticket is None:
+                continue
+            start = time.monotonic()
+            try:
+                client.with_options(timeout=min(5.0, breaker.slow_call_seconds), max_retries=0).models.list()
+                breaker.record(ticket, True, time.monotonic() - start)
+            except Exception:
+                breaker.record(ticket, False, time.monotonic() - start)
+    finally:
+        with _prober_lock:
+            _prober_running = False
+
+
+def _start_prober(breaker: CircuitBreaker) -> None:
+    global _prober_running
+    with _prober_lock:
+        if _prober_running:
+            return
+        _prober_running = True
+    threading.Thread(target=_probe_until_closed, args=(breaker,), name="breaker-probe", daemon=True).start()
+
+
+if BREAKER_PROBE:
+    openai_breaker.on_open = _start_prober
+
+
+def breaker_guard(section: str) -> Optional[Ticket]:
+    """
+    Raise CircuitOpen instead of letting a call through to a backend that is down; otherwise
+    the call's ticket for breaker_record/breaker_release (None with the breaker off).
+    """
+    if not BREAKER_ENABLED:
+        return None
+    ticket = openai_breaker.allow()
+    if ticket is None:
+        raise CircuitOpen(f"{section}: OpenAI circuit is open")
+    return ticket
+
+
+def breaker_record(ticket: Optional[Ticket], ok: bool, elapsed: float) -> None:
+    if ticket is not None:
+        openai_breaker.record(ticket, ok, elapsed)
+
+
+def breaker_release(ticket: Optional[Ticket]) -> None:
+    if ticket is not None:
+        openai_breaker.release(ticket)
+
+
+def breaker_status() -> Dict:
+    return openai_breaker.snapshot()
+
+
+def _breaker_metrics():
+    state = openai_breaker.state
+    yield ("openai_circuit_state", "gauge", "1 for the breaker's current state (closed, open, half_open)",
+           [({"state": s}, int(s == state)) for s in (CLOSED, OPEN, HALF_OPEN)])
+
+
+add_collector(_breaker_metrics)
@@ -0,0 +1,264 @@
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from utils.config import (
+    CACHE_DB, CACHE_DB_MAX_ROWS, CACHE_DB_PURGE_EVERY, CACHE_ENABLED, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_TTL,
+)
+
+# Guest counts are bucketed so "45 neighbors" and "50 neighbors" share an entry
+GUEST_BUCKETS = (10, 25, 50, 100, 200, 500)
+
+_bypass = contextvars.ContextVar("cache_bypass", default=False)
+
+
+def normalize_text(value) -> str:
+    return " ".join(str(value or "").split()).casefold()
+
+
+def guest_bucket(guests) -> str:
+    try:
+        n = int(guests)
+    except (TypeError, ValueError):
+        return normalize_text(guests)
+    for edge in GUEST_BUCKETS:
+        if n <= edge:
+            return f"<={edge}"
+    return f">{GUEST_BUCKETS[-1]}"
+
+
+def make_key(section: str, *parts) -> str:
+    raw = json.dumps([section, *parts], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def cache_bypass(enabled: bool = True):
+    """Skip cache reads (results are still stored) for everything generated inside the block."""
+    token = _bypass.set(bool(enabled))
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class LRUCache:
+    """In-process LRU of JSON strings, bounded by entry count and total bytes, with per-entry TTL."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.time():
+                self._drop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires: Optional[float] = None) -> None:
+        size = len(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if size > self.max_bytes:
+                return  # too big to keep, and the old value must not outlive it
+            self._data[key] = (value, expires or time.time() + self.ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key: str) -> None:
+        value, _ = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk tier shared by every worker process; survives restarts. Each process purges
+    expired rows on its first write and every purge_every writes after that, and trims the
+    table to max_rows, the rows closest to expiry (the oldest, as they share one TTL) first.
+    """
+
+    def __init__(self, path: str, max_rows: int = 0, purge_every: int = 500):
+        self.path = path
+        self.max_rows = max_rows
+        self.purge_every = max(1, purge_every)
+        self._writes = 0
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._init_lock:
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    " key TEXT PRIMARY KEY, section TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+                self._ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[tuple]:
+        row = self._conn().execute(
+            "SELECT value, expires FROM cache WHERE key = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return row
+
+    def set(self, key: str, section: str, value: str, expires: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, section, value, expires) VALUES (?, ?, ?, ?)",
+            (key, section, value, expires),
+        )
+        if self._writes % self.purge_every == 0:
+            self.purge()
+        self._writes += 1  # a lost update under a race only shifts the next purge
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM cache WHERE expires < ?", (time.time(),)).rowcount
+
+    def purge(self) -> int:
+        """Drop expired rows, then the oldest ones past max_rows; returns how many went."""
+        removed = self.purge_expired()
+        if self.max_rows > 0:
+            conn = self._conn()
+            excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_rows
+            if excess > 0:
+                removed += conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires LIMIT ?)", (excess,)
+                ).rowcount
+        return removed
+
+
+class SectionCache:
+    """Memory LRU in front of SQLite, with hit/miss counters per section."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache]):
+        self.memory = memory
+        self.disk = disk
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, section: str, what: str) -> None:
+        with self._stats_lock:
+            tally = self._stats.setdefault(
+                section, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "disk_errors": 0}
+            )
+            tally[what] += 1
+
+    def get(self, section: str, key: str) -> Optional[str]:
+        if _bypass.get():
+            self._count(section, "bypassed")
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(section, "memory_hits")
+            return value
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except sqlite3.Error:
+                row = None
+                self._count(section, "disk_errors")
+            if row is not None:
+                value, expires = row
+                self.memory.set(key, value, expires)
+                self._count(section, "disk_hits")
+                return value
+        self._count(section, "misses")
+        return None
+
+    def set(self, section: str, key: str, value: str) -> None:
+        expires = time.time() + self.memory.ttl
+        self.memory.set(key, value, expires)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, section, value, expires)
+            except sqlite3.Error:
+                self._count(section, "disk_errors")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._stats_lock:
+            return {section: dict(tally) for section, tally in self._stats.items()}
+
+
+_cache = SectionCache(
+    LRUCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL),
+    SQLiteCache(CACHE_DB, CACHE_DB_MAX_ROWS, CACHE_DB_PURGE_EVERY) if CACHE_DB else None,
+)
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    return _cache.stats()
+
+
+def cached(section: str, key_fn: Callable[..., tuple]):
+    """
+    Cache a generator's LLM step. key_fn maps the call arguments to the normalized key parts.
+    Only returned values are stored; exceptions pass through untouched, so fallbacks are never cached.
+    """
+    def decorator(fn):
+        if not CACHE_ENABLED:
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(section, *key_fn(*args, **kwargs))
+                hit = _cache.get(section, key)
+                if hit is not None:
+                    return json.loads(hit)
+                result = await fn(*args, **kwargs)
+                _cache.set(section, key, json.dumps(result, ensure_ascii=False))
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = make_key(section, *key_fn(*args, **kwargs))
+            hit = _cache.get(section, key)
+            if hit is not None:
+                return json.loads(hit)
+            result = fn(*args, **kwargs)
+            _cache.set(section, key, json.dumps(result, ensure_ascii=False))
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,428 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from utils.config import CASSETTE_FILE, CASSETTE_LATENCY, CASSETTE_MODE
+
+# Response headers worth keeping; the body is stored exactly as it came off the wire
+_KEPT_HEADERS = ("content-type", "content-encoding", "retry-after", "retry-after-ms")
+
+_section = contextvars.ContextVar("cassette_section", default="")
+
+
+class _Label:
+    __slots__ = ("section", "token")
+
+    def __init__(self, section: str):
+        self.section = section
+
+    def __enter__(self):
+        self.token = _section.set(self.section)
+        return self
+
+    def __exit__(self, *exc):
+        _section.reset(self.token)
+        return False
+
+
+class _NoLabel:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_LABEL = _NoLabel()
+
+
+def labelled(section: str):
+    """Tag the completions made inside the block with their section (a no-op unless recording or replaying)."""
+    return _Label(section) if CASSETTE_MODE else _NO_LABEL
+
+
+def request_key(request: httpx.Request) -> str:
+    """Method, path and the JSON body with sorted keys; auth, retry and idempotency headers don't count."""
+    body = request.content
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha1(request.method.encode() + b" " + request.url.path.encode() + b"\n" + body).hexdigest()
+
+
+class CassetteStore:
+    """
+    The cassette: an SQLite file any number of recording workers can append to.
+    completions holds one row per upstream call: the response body zlib-compressed with the
+    arrival time and size of each chunk, so replay can cut and pace it the same way;
+    submissions holds the plan forms posted meanwhile, for bench/replay.py to post again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._init_lock:
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    " id INTEGER PRIMARY KEY, key TEXT NOT NULL, section TEXT NOT NULL, started REAL NOT NULL,"
+                    " status INTEGER NOT NULL, headers TEXT NOT NULL, header_ms REAL NOT NULL,"
+                    " chunks BLOB NOT NULL, body BLOB NOT NULL, error TEXT, request BLOB NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS submissions ("
+                    " id INTEGER PRIMARY KEY, started REAL NOT NULL, path TEXT NOT NULL,"
+                    " query TEXT NOT NULL, headers TEXT NOT NULL, form TEXT NOT NULL)"
+                )
+                self._ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def add_completion(self, key: str, section: str, started: float, status: int, headers: Dict[str, str],
+                       header_ms: float, chunks: List[list], body: bytes, error: Optional[str],
+                       request: bytes) -> None:
+        self._conn().execute(
+            "INSERT INTO completions (key, section, started, status, headers, header_ms, chunks, body, error, request)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, section, started, status, json.dumps(headers), header_ms,
+             zlib.compress(json.dumps(chunks, separators=(",", ":")).encode()), zlib.compress(body), error,
+             zlib.compress(request)),
+        )
+
+    def add_submission(self, path: str, query: str, headers: Dict[str, str], form: Dict[str, str]) -> None:
+        self._conn().execute(
+            "INSERT INTO submissions (started, path, query, headers, form) VALUES (?, ?, ?, ?, ?)",
+            (time.time(), path, query, json.dumps(headers), json.dumps(form, ensure_ascii=False)),
+        )
+
+    def completions(self) -> Dict[str, List[tuple]]:
+        """Recorded calls by request key, oldest first: (section, status, headers, header_ms, chunks, body, error)."""
+        by_key: Dict[str, List[tuple]] = {}
+        rows = self._conn().execute(
+            "SELECT key, section, status, headers, header_ms, chunks, body, error FROM completions ORDER BY id"
+        )
+        for key, section, status, headers, header_ms, chunks, body, error in rows:
+            by_key.setdefault(key, []).append(
+                (section, status, json.loads(headers), header_ms, json.loads(zlib.decompress(chunks)), body, error)
+            )
+        return by_key
+
+    def submissions(self) -> List[dict]:
+        rows = self._conn().execute("SELECT started, path, query, headers, form FROM submissions ORDER BY id")
+        return [
+            {"started": started, "path": path, "query": query, "headers": json.loads(headers),
+             "form": json.loads(form)}
+            for started, path, query, headers, form in rows
+        ]
+
+
+class _Tape:
+    """What one recorded call is made of while it is being recorded."""
+
+    def __init__(self, store: CassetteStore, request: httpx.Request):
+        self.store = store
+        self.key = request_key(request)
+        self.section = _section.get()
+        self.request = request.content
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        self.status = 0
+        self.headers: Dict[str, str] = {}
+        self.header_ms = 0.0
+        self.chunks: List[list] = []
+        self.parts: List[bytes] = []
+        self.saved = False
+
+    def _ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    def response(self, response: httpx.Response) -> None:
+        self.status = response.status_code
+        self.headers = {k: response.headers[k] for k in _KEPT_HEADERS if k in response.headers}
+        self.header_ms = self._ms()
+
+    def chunk(self, data: bytes) -> None:
+        self.chunks.append([self._ms(), len(data)])
+        self.parts.append(data)
+
+    def save(self, error: Optional[BaseException] = None) -> None:
+        if self.saved:
+            return
+        self.saved = True
+        if error is not None and not self.header_ms:
+            self.header_ms = self._ms()  # failed before any response: header_ms is when it failed
+        try:
+            self.store.add_completion(
+                self.key, self.section, self.wall, self.status, self.headers, self.header_ms, self.chunks,
+                b"".join(self.parts), type(error).__name__ if error is not None else None, self.request,
+            )
+            _count("recorded")
+        except sqlite3.Error:
+            _count("errors")
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, inner, tape: _Tape):
+        self.inner = inner
+        self.tape = tape
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            for data in self.inner:
+                self.tape.chunk(data)
+                yield data
+        except Exception as e:
+            self.tape.save(e)
+            raise
+
+    def close(self) -> None:
+        try:
+            self.inner.close()
+        finally:
+            self.tape.save()  # also when the caller hung up early: replay serves the same prefix
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner, tape: _Tape):
+        self.inner = inner
+        self.tape = tape
+
+    async def __aiter__(self):
+        try:
+            async for data in self.inner:
+                self.tape.chunk(data)
+                yield data
+        except Exception as e:
+            self.tape.save(e)
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self.inner.aclose()
+        finally:
+            self.tape.save()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Passes every request to the real transport and writes the exchange to the cassette."""
+
+    def __init__(self, inner: httpx.BaseTransport, store: CassetteStore):
+        self.inner = inner
+        self.store = store
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        tape = _Tape(self.store, request)
+        try:
+            response = self.inner.handle_request(request)
+        except Exception as e:
+            tape.save(e)
+            raise
+        tape.response(response)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_RecordingStream(response.stream, tape), extensions=response.extensions)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, store: CassetteStore):
+        self.inner = inner
+        self.store = store
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tape = _Tape(self.store, request)
+        try:
+            response = await self.inner.handle_async_request(request)
+        except Exception as e:
+            tape.save(e)
+            raise
+        tape.response(response)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_AsyncRecordingStream(response.stream, tape), extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class Player:
+    """
+    Serves recorded calls by request key. The n-th identical request gets the n-th recording
+    (retries replay their original failures); once a key's recordings run out its last one is
+    repeated. A request that was never recorded gets a 404, so its section falls back.
+    """
+
+    def __init__(self, store: CassetteStore, latency: bool):
+        self.store = store
+        self.latency = latency
+        self._tapes: Optional[Dict[str, List[tuple]]] = None
+        self._played: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def next(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            if self._tapes is None:
+                self._tapes = self.store.completions()
+            tapes = self._tapes.get(key)
+            if not tapes:
+                _count("misses")
+                return None
+            n = self._played[key] = self._played.get(key, -1) + 1
+        _count("served" if n < len(tapes) else "repeated")
+        return tapes[min(n, len(tapes) - 1)]
+
+    def plan(self, tape: tuple):
+        """(status, headers, header_ms, [(offset_ms, bytes)], error) with the body cut where it arrived cut."""
+        _, status, headers, header_ms, chunks, body, error = tape
+        body = zlib.decompress(body)
+        parts, at = [], 0
+        for offset, size in chunks:
+            parts.append((offset if self.latency else 0.0, body[at:at + size]))
+            at += size
+        return status, headers, header_ms if self.latency else 0.0, parts, error
+
+
+_MISSING = {"error": {"message": "no recorded completion for this request", "type": "cassette_miss"}}
+
+
+def _replay_error(name: str, request: httpx.Request) -> Exception:
+    cls = getattr(httpx, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, httpx.TransportError)):
+        cls = httpx.TransportError
+    return cls(f"replayed {name}", request=request)
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, start: float, parts: list, error: Optional[str], request: httpx.Request):
+        self.start, self.parts, self.error, self.request = start, parts, error, request
+
+    def __iter__(self) -> Iterator[bytes]:
+        for offset, data in self.parts:
+            wait = self.start + offset / 1000 - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            yield data
+        if self.error:
+            raise _replay_error(self.error, self.request)
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, start: float, parts: list, error: Optional[str], request: httpx.Request):
+        self.start, self.parts, self.error, self.request = start, parts, error, request
+
+    async def __aiter__(self):
+        for offset, data in self.parts:
+            wait = self.start + offset / 1000 - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield data
+        if self.error:
+            raise _replay_error(self.error, self.request)
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Answers from the cassette, never touching the network."""
+
+    def __init__(self, player: Player):
+        self.player = player
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        tape = self.player.next(request_key(request))
+        if tape is None:
+            return httpx.Response(404, json=_MISSING)
+        status, headers, header_ms, parts, error = self.player.plan(tape)
+        wait = start + header_ms / 1000 - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        if not status:
+            raise _replay_error(error, request)
+        return httpx.Response(status, headers=headers, stream=_ReplayStream(start, parts, error, request))
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, player: Player):
+        self.player = player
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        tape = self.player.next(request_key(request))
+        if tape is None:
+            return httpx.Response(404, json=_MISSING)
+        status, headers, header_ms, parts, error = self.player.plan(tape)
+        wait = start + header_ms / 1000 - time.perf_counter()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        if not status:
+            raise _replay_error(error, request)
+        return httpx.Response(status, headers=headers, stream=_AsyncReplayStream(start, parts, error, request))
+
+
+_store = CassetteStore(CASSETTE_FILE) if CASSETTE_MODE in ("record", "replay") else None
+_player = Player(_store, CASSETTE_LATENCY) if CASSETTE_MODE == "replay" else None
+_stats = {"recorded": 0, "submissions": 0, "served": 0, "repeated": 0, "misses": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(what: str) -> None:
+    with _stats_lock:
+        _stats[what] += 1
+
+
+def wrap_transport(inner: httpx.BaseTransport) -> httpx.BaseTransport:
+    """The OpenAI client's transport for CASSETTE_MODE (inner is the real one; unused when replaying)."""
+    if CASSETTE_MODE == "record":
+        return RecordingTransport(inner, _store)
+    if CASSETTE_MODE == "replay":
+        return ReplayTransport(_player)
+    return inner
+
+
+def wrap_async_transport(inner: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    if CASSETTE_MODE == "record":
+        return AsyncRecordingTransport(inner, _store)
+    if CASSETTE_MODE == "replay":
+        return AsyncReplayTransport(_player)
+    return inner
+
+
+def record_submission(path: str, query: str, headers: Dict[str, str], form: Dict[str, str]) -> None:
+    """Keep a plan form posted while recording, so bench/replay.py can post the day again."""
+    if CASSETTE_MODE != "record":
+        return
+    try:
+        _store.add_submission(path, query, headers, form)
+        _count("submissions")
+    except sqlite3.Error:
+        _count("errors")
+
+
+def cassette_stats() -> Optional[Dict]:
+    if _store is None:
+        return None
+    with _stats_lock:
+        stats = dict(_stats)
+    return {"mode": CASSETTE_MODE, "file": CASSETTE_FILE, "latency": CASSETTE_LATENCY, **stats}
@@ -1,20 +1,349 @@
+import asyncio
 import os
+import threading
+import time
+import weakref
+from typing import Dict
+
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 load_dotenv()
 
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # change if you prefer
 USE_OPENAI = os.getenv("USE_OPENAI", "1").lower() in {"1", "true", "yes"}
 
+# Run the ideas / invitations / timeline generators side by side instead of one after another
+PLAN_CONCURRENT = os.getenv("PLAN_CONCURRENT", "1").lower() in {"1", "true", "yes"}
+PLAN_WORKERS = int(os.getenv("PLAN_WORKERS", "16"))
+# "sections" = one completion per section, "combined" = whole plan in a single completion
+PLAN_MODE = os.getenv("PLAN_MODE", "sections").strip().lower()
+# Total seconds an interactive plan request may spend; each upstream call gets what is left (0 = no budget)
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET", "20"))
+# Send the results page shell immediately and stream each section in as it finishes
+PLAN_STREAMING = os.getenv("PLAN_STREAMING", "0").lower() in {"1", "true", "yes"}
+# Budget tiers whose ideas come straight from the local idea corpus, no model call (comma-separated, lowercase)
+IDEAS_LOCAL_BUDGETS = {
+    b.strip().lower() for b in os.getenv("IDEAS_LOCAL_BUDGETS", "shoestring").split(",") if b.strip()
+}
+# Timelines are built locally from a task catalog; set to 1 to have the model tailor the tasks on top
+TIMELINE_LLM = os.getenv("TIMELINE_LLM", "0").lower() in {"1", "true", "yes"}
+
+# Bulk planning (batch.py and /api/batch): plans generated at once per batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# Background plan jobs: POST / can enqueue and return a job id; jobs live in SQLite
+PLAN_JOBS = os.getenv("PLAN_JOBS", "0").lower() in {"1", "true", "yes"}
+JOBS_DB = os.getenv(
+    "JOBS_DB", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plan_jobs.sqlite3")
+)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))  # seconds before a running job whose worker went silent is retried
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # a job is failed instead of claimed a further time
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))  # finished jobs older than this are deleted
+
+# Response cache: in-process LRU in front of a SQLite file shared by all workers (CACHE_DB= disables the disk tier)
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1").lower() in {"1", "true", "yes"}
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_DB = os.getenv(
+    "CACHE_DB", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plan_cache.sqlite3")
+)
+CACHE_DB_MAX_ROWS = int(os.getenv("CACHE_DB_MAX_ROWS", "100000"))  # oldest rows go first past this (0: no cap)
+CACHE_DB_PURGE_EVERY = int(os.getenv("CACHE_DB_PURGE_EVERY", "500"))  # writes per process between purges
+# Prebuilt ideas for the event type x budget x guest bucket grid (python prebuild.py), memory-mapped at startup
+WARM_STORE = os.getenv(
+    "WARM_STORE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plan_warm.bin")
+)
+# Serve the location-less entry for locations that were not prebuilt
+WARM_STORE_GENERIC = os.getenv("WARM_STORE_GENERIC", "1").lower() in {"1", "true", "yes"}
+
+# Near-duplicate cache for ideas: reuse a result whose inputs are this similar (cosine of hashed n-gram vectors)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1").lower() in {"1", "true", "yes"}
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+SEMANTIC_CACHE_GUEST_RATIO = float(os.getenv("SEMANTIC_CACHE_GUEST_RATIO", "1.25"))  # 40 and 50 guests match
+
+# GET /metrics in the Prometheus text format (per worker process)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in {"1", "true", "yes"}
+
+# Per-request spans (prompt, queue, upstream, parse, normalize, render) sent back as a Server-Timing header;
+# TRACE_FILE also appends one JSONL record per traced request
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1").lower() in {"1", "true", "yes"}
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+# On-demand profiling of single requests (?profile=1 or X-Profile: 1 plus the admin token); off without ADMIN_TOKEN
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
+)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.002"))  # seconds between stack samples
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))  # newest profiles kept on disk
+
+# Circuit breaker around OpenAI: while open, generators serve their fallback without calling out
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "1").lower() in {"1", "true", "yes"}
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # most recent calls considered
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "15"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))  # wait before sending a probe
+BREAKER_PROBE = os.getenv("BREAKER_PROBE", "1").lower() in {"1", "true", "yes"}  # probe in the background too
+
+# Hedged requests: duplicate a call that is slower than the recent HEDGE_PERCENTILE latency
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0").lower() in {"1", "true", "yes"}
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+HEDGE_MAX_EXTRA = float(os.getenv("HEDGE_MAX_EXTRA", "0.1"))  # hedges per call, i.e. at most 10% extra upstream calls
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # latencies seen before hedging kicks in
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.25"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "32"))
+
+# Retries of transient OpenAI errors (429, 5xx, connection drops): exponential backoff with full jitter,
+# Retry-After honored, never past the request budget, and at most RETRY_BUDGET_RATIO retries per call overall
+RETRY_ENABLED = os.getenv("RETRY_ENABLED", "1").lower() in {"1", "true", "yes"}
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # including the first
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.3"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "5"))  # a longer Retry-After means give up and fall back
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_BURST = float(os.getenv("RETRY_BUDGET_BURST", "10"))  # retries banked for a quiet start
+
+# Admission control for outbound completions: calls queue (bounded wait) until a slot is free
+# and the per-minute request/token budgets allow them; 0 disables a limit
+OPENAI_MAX_INFLIGHT = int(os.getenv("OPENAI_MAX_INFLIGHT", "32"))
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))  # seconds in the queue before falling back
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))  # waiters beyond this fall back at once
+ADMISSION_OUTPUT_TOKENS = int(os.getenv("ADMISSION_OUTPUT_TOKENS", "500"))  # output estimate until usage is seen
+# Queued calls are scheduled by class (form requests are interactive; batch, jobs and prebuild are bulk),
+# weighted fairly between the classes and, within a class, between organizing groups
+SCHED_INTERACTIVE_WEIGHT = float(os.getenv("SCHED_INTERACTIVE_WEIGHT", "8"))
+SCHED_BULK_WEIGHT = float(os.getenv("SCHED_BULK_WEIGHT", "1"))
+SCHED_INTERACTIVE_RESERVE = int(os.getenv("SCHED_INTERACTIVE_RESERVE", "4"))  # in-flight slots bulk calls can't take
+ADMISSION_BULK_MAX_WAIT = float(os.getenv("ADMISSION_BULK_MAX_WAIT", "300"))
+
+# Stream completions and stop reading once the section's item caps are reached
+OPENAI_STREAMING = os.getenv("OPENAI_STREAMING", "1").lower() in {"1", "true", "yes"}
+# Seconds to keep reading past the caps for the usage chunk and a clean end (the connection goes back to the pool)
+OPENAI_STREAM_DRAIN = float(os.getenv("OPENAI_STREAM_DRAIN", "2"))
+
+# Connection pool for the shared OpenAI client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1").lower() in {"1", "true", "yes"}
+
+# Record/replay of completions: "record" stores every OpenAI call (request, response bytes, chunk timings)
+# and every plan form posted in CASSETTE_FILE; "replay" answers the calls from it without the network
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").strip().lower()
+CASSETTE_FILE = os.getenv(
+    "CASSETTE_FILE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plan_cassette.sqlite3")
+)
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "1").lower() in {"1", "true", "yes"}  # replay at recorded pace
+
+_clients: Dict[tuple, OpenAI] = {}
+# event loop -> {key: AsyncOpenAI}; weak, so a loop's id being reused can't hand out a dead loop's client
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_pid = None
+_clients_lock = threading.Lock()
+_pool_stats = {"requests": 0, "new_connections": 0, "tls_handshakes": 0}
+_stats_lock = threading.Lock()
+
+
+def _bump(key: str) -> None:
+    with _stats_lock:
+        _pool_stats[key] += 1
+
+
+def _trace(event_name: str, info: dict) -> None:
+    # httpcore reports connection setup through the "trace" request extension
+    if event_name.endswith(".send_request_headers.started"):
+        _bump("requests")
+    elif event_name == "connection.connect_tcp.complete":
+        _bump("new_connections")
+    elif event_name == "connection.start_tls.complete":
+        _bump("tls_handshakes")
+
+
+def _on_request(req: httpx.Request) -> None:
+    req.extensions["trace"] = _trace
+
+
+async def _atrace(event_name: str, info: dict) -> None:
+    _trace(event_name, info)
+
+
+async def _on_request_async(req: httpx.Request) -> None:
+    req.extensions["trace"] = _atrace
+
+
+def _http2_available() -> bool:
+    if not OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    except ImportError:
+        return False
+    return True
+
+
+def _pool_options() -> dict:
+    return dict(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        http2=_http2_available(),
+    )
+
+
+# What is left after [DONE] is a few bytes already on their way; a body closed mid-answer is let go quickly
+CLOSE_DRAIN_SECONDS = 0.25
+
+
+class _DrainOnClose(httpx.SyncByteStream):
+    """
+    A response body that, closed before its end, first reads what is left for a moment: an
+    HTTP/1.1 connection only goes back to the pool once its response has been read to the end,
+    and the sync SDK closes a stream right after [DONE], before the final empty chunk arrives.
+    (Reading past the caps of a streamed answer is _stream_json's job, see OPENAI_STREAM_DRAIN.)
+    """
+
+    def __init__(self, inner: httpx.SyncByteStream):
+        self.inner = inner
+        self._parts = iter(inner)
+
+    def __iter__(self):
+        yield from self._parts
+
+    def close(self) -> None:
+        stop = time.monotonic() + CLOSE_DRAIN_SECONDS
+        try:
+            for _ in self._parts:
+                if time.monotonic() > stop:
+                    break
+        except Exception:
+            pass  # whatever the body had left, the caller is done with it
+        finally:
+            self.inner.close()
+
+
+class _DrainingTransport(httpx.BaseTransport):
+    def __init__(self, inner: httpx.BaseTransport):
+        self.inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self.inner.handle_request(request)
+        if response.extensions.get("http_version") != b"HTTP/1.1":
+            return response  # HTTP/2 can drop one stream and keep the connection
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_DrainOnClose(response.stream), extensions=response.extensions)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+def _client_options() -> dict:
+    return dict(timeout=httpx.Timeout(600.0, connect=5.0), follow_redirects=True)
+
+
+def _build_client(api_key: str) -> OpenAI:
+    from utils.cassette import wrap_transport  # utils.cassette imports this module
+
+    transport = wrap_transport(_DrainingTransport(httpx.HTTPTransport(**_pool_options())))
+    http_client = httpx.Client(event_hooks={"request": [_on_request]}, transport=transport, **_client_options())
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)  # utils/retry.py retries
+
+
+def _build_async_client(api_key: str) -> AsyncOpenAI:
+    from utils.cassette import wrap_async_transport
+
+    transport = wrap_async_transport(httpx.AsyncHTTPTransport(**_pool_options()))
+    http_client = httpx.AsyncClient(
+        event_hooks={"request": [_on_request_async]}, transport=transport, **_client_options()
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def _api_key():
+    # Replaying needs no real key: nothing leaves the process
+    return os.getenv("OPENAI_API_KEY") or ("replay" if CASSETTE_MODE == "replay" else None)
+
+
 def get_openai_client():
-    """Create the OpenAI client only when needed. Returns None if key missing or disabled."""
+    """
+    Return the process-wide OpenAI client, building it on first use.
+    Returns None if key missing or disabled.
+    The client (and its keep-alive pool) is shared by every thread and rebuilt after a fork.
+    """
+    global _clients_pid
     if not USE_OPENAI:
         return None
-    api_key = os.getenv("OPENAI_API_KEY")
+    api_key = _api_key()
     if not api_key:
         return None
-    return OpenAI(api_key=api_key)
+    key = (api_key, os.getenv("OPENAI_BASE_URL", ""))
+    pid = os.getpid()
+    client = _clients.get(key)
+    if client is not None and _clients_pid == pid:
+        return client
+    with _clients_lock:
+        if _clients_pid != pid:
+            # Sockets inherited from the parent must not be reused in a forked worker
+            _clients.clear()
+            _async_clients.clear()
+            _clients_pid = pid
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _build_client(api_key)
+        return client
+
+
+def get_async_openai_client():
+    """
+    AsyncOpenAI counterpart of get_openai_client for the ASGI app.
+    Async connection pools belong to one event loop, so there is one client per running loop.
+    """
+    global _clients_pid
+    if not USE_OPENAI:
+        return None
+    api_key = _api_key()
+    if not api_key:
+        return None
+    loop = asyncio.get_running_loop()
+    key = (api_key, os.getenv("OPENAI_BASE_URL", ""))
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _async_clients.clear()
+            _clients_pid = os.getpid()
+        loop_clients = _async_clients.get(loop)
+        if loop_clients is None:
+            # Open connections keep a closed loop alive, so its clients are let go here, not by the weakref
+            for dead in [other for other in _async_clients if other.is_closed()]:
+                del _async_clients[dead]
+            loop_clients = _async_clients[loop] = {}
+        client = loop_clients.get(key)
+        if client is None:
+            client = loop_clients[key] = _build_async_client(api_key)
+        return client
+
+
+def client_pool_stats() -> Dict[str, int]:
+    """Counters for the shared client: requests written to the wire, connections opened, and how many requests reused one."""
+    with _stats_lock:
+        stats = dict(_pool_stats)
+    stats["reused_connections"] = max(0, stats["requests"] - stats["new_connections"])
+    return stats
 
 
 
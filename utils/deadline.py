@@ -0,0 +1,66 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+_timeouts: Dict[str, int] = {}
+_timeouts_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before this step could finish."""
+
+
+@contextmanager
+def request_deadline(budget: Optional[float]):
+    """
+    Give everything inside the block `budget` seconds in total. Nested blocks can only
+    shorten the deadline. None or <= 0 means no budget.
+    """
+    if not budget or budget <= 0:
+        yield
+        return
+    deadline = time.monotonic() + budget
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None when there is no budget."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """True once the current budget is spent (False without a budget)."""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check_deadline(section: str) -> Optional[float]:
+    """Seconds left, raising DeadlineExceeded (and counting it) once the budget is gone."""
+    left = remaining()
+    if left is not None and left <= 0:
+        record_timeout(section)
+        raise DeadlineExceeded(f"{section}: request time budget exhausted")
+    return left
+
+
+def record_timeout(section: str) -> None:
+    with _timeouts_lock:
+        _timeouts[section] = _timeouts.get(section, 0) + 1
+
+
+def timeout_stats() -> Dict[str, int]:
+    """Timeouts per section since startup; a section falls back each time."""
+    with _timeouts_lock:
+        return dict(_timeouts)
@@ -0,0 +1,186 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+from utils.config import (
+    HEDGE_ENABLED, HEDGE_MAX_EXTRA, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES, HEDGE_PERCENTILE, HEDGE_WINDOW, HEDGE_WORKERS,
+)
+from utils.deadline import remaining
+
+
+class HedgeCancelled(Exception):
+    """Raised inside the losing attempt once the other one has answered."""
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per section."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, section: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(section, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, section: str, pct: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(section, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(pct / 100 * len(samples)))]
+
+
+class HedgeBudget:
+    """Allow at most `max_extra` hedges per primary call (e.g. 0.1 = never more than 10% extra calls)."""
+
+    def __init__(self, max_extra: float):
+        self.max_extra = max_extra
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def count_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_extra * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def count_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+
+_latency = LatencyTracker(HEDGE_WINDOW)
+_budget = HedgeBudget(HEDGE_MAX_EXTRA)
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _hedge_delay(section: str) -> Optional[float]:
+    """How long to wait before hedging: the observed percentile, or None to not hedge this call."""
+    if not HEDGE_ENABLED:
+        return None
+    delay = _latency.percentile(section, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    if delay is None:
+        return None
+    delay = max(delay, HEDGE_MIN_DELAY)
+    left = remaining()
+    if left is not None and left <= delay:
+        return None  # a hedge couldn't finish inside the request budget anyway
+    return delay
+
+
+def _timed(section: str, attempt: Callable, *args):
+    start = time.monotonic()
+    result = attempt(*args)
+    _latency.add(section, time.monotonic() - start)
+    return result
+
+
+def hedged(section: str, attempt: Callable[[Optional[threading.Event]], object]):
+    """
+    Run attempt(cancel_event). If it hasn't answered after the section's recent p{HEDGE_PERCENTILE}
+    latency, start a duplicate and return whichever answers first; the other one's cancel event
+    is set so a streaming call hangs up (a non-streaming one finishes in the background, ignored).
+    """
+    _budget.count_call()
+    delay = _hedge_delay(section)
+    if delay is None:
+        return _timed(section, attempt, None)
+
+    pool = _get_executor()
+    cancels = [threading.Event()]
+    futures = [pool.submit(contextvars.copy_context().run, _timed, section, attempt, cancels[0])]
+    done, _ = wait(futures, timeout=delay)
+    if not done and _budget.try_spend():
+        cancels.append(threading.Event())
+        futures.append(pool.submit(contextvars.copy_context().run, _timed, section, attempt, cancels[1]))
+
+    pending = set(futures)
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for i, other in enumerate(futures):
+                    if other is not future:
+                        cancels[i].set()
+                if future is not futures[0]:
+                    _budget.count_win()
+                return future.result()
+            first_error = first_error or future.exception()
+    raise first_error
+
+
+async def ahedged(section: str, attempt: Callable[[], object]):
+    """hedged() for coroutines; the losing attempt is simply cancelled."""
+    _budget.count_call()
+    delay = _hedge_delay(section)
+
+    async def timed():
+        start = time.monotonic()
+        result = await attempt()
+        _latency.add(section, time.monotonic() - start)
+        return result
+
+    if delay is None:
+        return await timed()
+
+    tasks = [asyncio.ensure_future(timed())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and _budget.try_spend():
+            tasks.append(asyncio.ensure_future(timed()))
+        pending = set(tasks)
+        first_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        _budget.count_win()
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def hedge_stats() -> Dict:
+    stats = {
+        "enabled": HEDGE_ENABLED,
+        "calls": _budget.calls,
+        "hedges": _budget.hedges,
+        "hedge_wins": _budget.hedge_wins,
+        "delay": {},
+    }
+    for section in ("ideas", "invitations", "timeline", "plan"):
+        delay = _latency.percentile(section, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+        if delay is not None:
+            stats["delay"][section] = round(max(delay, HEDGE_MIN_DELAY), 4)
+    return stats
@@ -0,0 +1,123 @@
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+Path = Tuple[str, ...]
+_WS = " \t\r\n"
+
+
+class JsonItemStream:
+    """
+    Incremental parser for a streamed JSON object.
+
+    Feed it text chunks as they arrive; every element of the watched arrays is decoded as
+    soon as it is complete and handed to on_item(path, item). A path is the chain of object
+    keys leading to the array, e.g. ("Themes",) or ("ideas", "Themes"); "*" stands for an
+    array position along the way. Each watched path has a cap, and once every cap is met
+    `done` flips to True so the caller can stop reading the stream.
+    """
+
+    def __init__(self, caps: Dict[Path, int], on_item: Optional[Callable[[Path, object], None]] = None):
+        self.caps = dict(caps)
+        self.items: Dict[Path, List] = {path: [] for path in caps}
+        self.on_item = on_item
+        self.text = ""
+        self._pos = 0
+        # Each frame: [kind, path, expecting_key, pending_key, element_start]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    @property
+    def done(self) -> bool:
+        return all(len(self.items[path]) >= cap for path, cap in self.caps.items())
+
+    def feed(self, chunk: str) -> None:
+        self.text += chunk
+        text = self.text
+        stack = self._stack
+        i = self._pos
+        n = len(text)
+        while i < n:
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    top = stack[-1] if stack else None
+                    if top is not None and top[0] == "obj" and top[2]:
+                        top[3] = json.loads(text[self._string_start:i + 1])
+                        top[2] = False
+                i += 1
+                continue
+
+            top = stack[-1] if stack else None
+            if top is not None and top[0] == "arr" and top[4] is None and ch not in _WS + ",]":
+                top[4] = i  # a new element starts here
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                path = self._child_path()
+                stack.append(["obj" if ch == "{" else "arr", path, ch == "{", None, None])
+            elif ch in "}]":
+                if top is not None and top[0] == "arr":
+                    self._finish_element(top, i)
+                stack.pop()
+            elif ch == ",":
+                if top is not None and top[0] == "arr":
+                    self._finish_element(top, i)
+                elif top is not None:
+                    top[2] = True
+            i += 1
+        self._pos = n
+
+    def _child_path(self) -> Path:
+        if not self._stack:
+            return ()
+        top = self._stack[-1]
+        if top[0] == "obj":
+            return top[1] + (str(top[3]),)
+        return top[1] + ("*",)
+
+    def _finish_element(self, frame: list, end: int) -> None:
+        start = frame[4]
+        frame[4] = None
+        if start is None:
+            return
+        path = frame[1]
+        bucket = self.items.get(path)
+        if bucket is None or len(bucket) >= self.caps[path]:
+            return
+        item = json.loads(self.text[start:end])
+        bucket.append(item)
+        if self.on_item is not None:
+            self.on_item(path, item)
+
+    def result(self) -> dict:
+        """
+        The whole object if the stream completed. The watched arrays gathered so far are only
+        returned once every cap is met (the caller hung up on purpose); any other incomplete
+        or malformed text raises ValueError like json.loads, so it is never taken for an answer.
+        """
+        if not self.done:
+            data = json.loads(self.text)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+            return data
+        try:
+            data = json.loads(self.text)
+            if isinstance(data, dict):
+                return data
+        except ValueError:
+            pass
+        data = {}
+        for path, items in self.items.items():
+            node = data
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = list(items)
+        return data
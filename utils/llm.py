@@ -0,0 +1,323 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional
+
+from openai import APITimeoutError, RateLimitError
+
+from utils.admission import (
+    CHARS_PER_TOKEN, MESSAGE_OVERHEAD, aadmitted, admitted, estimate_tokens, observe_output, throttle,
+)
+from utils.breaker import CircuitOpen, breaker_guard, breaker_record, breaker_release
+from utils.cassette import labelled
+from utils.config import MODEL, OPENAI_STREAM_DRAIN, OPENAI_STREAMING, get_async_openai_client, get_openai_client
+from utils.deadline import DeadlineExceeded, check_deadline, expired, record_timeout
+from utils.hedge import HedgeCancelled, ahedged, hedged
+from utils.jsonstream import JsonItemStream, Path
+from utils.metrics import OPENAI_CALLS, OPENAI_SECONDS, OPENAI_TOKENS
+from utils.retry import awith_retries, with_retries
+from utils.tracing import span
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised when OpenAI is disabled or no API key is configured."""
+
+
+_usage: Dict[str, Dict[str, int]] = {}
+_usage_lock = threading.Lock()
+
+
+def _record_usage(section: str, resp, cut_off: bool = False) -> Optional[int]:
+    """Count the call and its tokens; returns the total tokens, or None when the response carried no usage."""
+    usage = getattr(resp, "usage", None)
+    with _usage_lock:
+        tally = _usage.setdefault(
+            section, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "early_cutoffs": 0}
+        )
+        tally["calls"] += 1
+        tally["early_cutoffs"] += int(cut_off)
+        if usage is not None:
+            tally["prompt_tokens"] += usage.prompt_tokens or 0
+            tally["completion_tokens"] += usage.completion_tokens or 0
+    if usage is None:
+        return None
+    OPENAI_TOKENS.inc(section, "prompt", amount=usage.prompt_tokens or 0)
+    OPENAI_TOKENS.inc(section, "completion", amount=usage.completion_tokens or 0)
+    observe_output(section, usage.completion_tokens or 0)
+    return (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+
+
+def usage_stats() -> Dict[str, Dict[str, int]]:
+    """Calls and token totals per section since startup (or the last reset)."""
+    with _usage_lock:
+        return {section: dict(tally) for section, tally in _usage.items()}
+
+
+def reset_usage() -> None:
+    with _usage_lock:
+        _usage.clear()
+
+
+def _request(model: str, system: str, user: str, temperature: float) -> dict:
+    return dict(
+        model=model,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        temperature=temperature,
+    )
+
+
+def _with_deadline(section: str, client):
+    """Bound the call by whatever is left of the request budget (and don't let the SDK retry past it)."""
+    left = check_deadline(section)
+    if left is None:
+        return client
+    return client.with_options(timeout=left, max_retries=0)
+
+
+@contextmanager
+def _upstream(section: str):
+    """Breaker check before the call, and its outcome and latency reported after (breaker and metrics)."""
+    try:
+        ticket = breaker_guard(section)
+    except CircuitOpen:
+        OPENAI_CALLS.inc(section, "rejected")
+        raise
+    start = time.monotonic()
+    try:
+        with span(f"{section}.upstream"), labelled(section):
+            yield
+    except ValueError:
+        # Malformed model output: the backend itself is fine
+        breaker_record(ticket, True, time.monotonic() - start)
+        OPENAI_CALLS.inc(section, "json_error")
+        raise
+    except (HedgeCancelled, asyncio.CancelledError):
+        # A hedged twin answered first, or the client went away: nothing was learned about the backend
+        breaker_release(ticket)
+        OPENAI_CALLS.inc(section, "cancelled")
+        raise
+    except RateLimitError:
+        throttle()
+        breaker_record(ticket, False, time.monotonic() - start)
+        OPENAI_CALLS.inc(section, "api_error")
+        raise
+    except (APITimeoutError, DeadlineExceeded) as e:
+        if isinstance(e, APITimeoutError):
+            record_timeout(section)
+        if isinstance(e, DeadlineExceeded) or expired():
+            # The caller's budget ran out (the SDK timeout is sized to it): not the backend's fault
+            breaker_release(ticket)
+        else:
+            breaker_record(ticket, False, time.monotonic() - start)
+        OPENAI_CALLS.inc(section, "timeout")
+        raise
+    except BaseException:
+        breaker_record(ticket, False, time.monotonic() - start)
+        OPENAI_CALLS.inc(section, "api_error")
+        raise
+    elapsed = time.monotonic() - start
+    breaker_record(ticket, True, elapsed)
+    OPENAI_CALLS.inc(section, "success")
+    OPENAI_SECONDS.observe(elapsed, section)
+
+
+def _parse_object(section: str, raw: str) -> dict:
+    with span(f"{section}.parse"):
+        data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError(f"{section}: expected a JSON object")
+    return data
+
+
+def _estimated_usage(request: dict, completion_chars: int):
+    """Usage for a stream we hung up on before its usage chunk, from the prompt and the text we read."""
+    messages = request["messages"]
+    prompt = sum(len(m["content"]) for m in messages) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD * len(messages)
+    # Shaped like the usage chunk, for _record_usage
+    usage = SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion_chars // CHARS_PER_TOKEN)
+    return SimpleNamespace(usage=usage)
+
+
+class _Tail:
+    """What a stream sent after every cap was met: its usage chunk (if we got that far) and how much text."""
+
+    def __init__(self):
+        self.usage_chunk = None
+        self.chars = 0
+        self.stop = time.monotonic() + OPENAI_STREAM_DRAIN
+
+    def add(self, chunk, cancel=None) -> bool:
+        """Take one chunk; False once the drain should give up (too long, budget spent, or cancelled)."""
+        if chunk.usage is not None:
+            self.usage_chunk = chunk
+        if chunk.choices and chunk.choices[0].delta.content:
+            self.chars += len(chunk.choices[0].delta.content)
+        return not (time.monotonic() > self.stop or expired() or (cancel is not None and cancel.is_set()))
+
+
+def _settle_stream(section: str, request: dict, parser: JsonItemStream, usage_chunk, tail, permit) -> None:
+    if usage_chunk is None and tail is not None:
+        usage_chunk = tail.usage_chunk or _estimated_usage(request, len(parser.text) + tail.chars)
+    permit.settle(_record_usage(section, usage_chunk, cut_off=tail is not None))
+
+
+def _stream_json(section: str, client, request: dict, caps: Dict[Path, int], on_item, permit, cancel=None) -> dict:
+    """
+    Stream the completion through JsonItemStream and stop parsing as soon as every cap is met.
+    The rest of the stream is still read (for up to OPENAI_STREAM_DRAIN seconds): hanging up
+    on a half-read HTTP/1.1 response throws its pooled connection away, and the usage only
+    comes in the last chunk.
+    """
+    parser = JsonItemStream(caps, on_item)
+    stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)
+    chunks = iter(stream)
+    usage_chunk = tail = None
+    try:
+        for chunk in chunks:
+            check_deadline(section)
+            if cancel is not None and cancel.is_set():
+                raise HedgeCancelled(section)
+            if chunk.usage is not None:
+                usage_chunk = chunk  # the final chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                parser.feed(chunk.choices[0].delta.content)
+                if parser.done:
+                    break
+        if parser.done and usage_chunk is None:
+            tail = _Tail()
+            try:
+                for chunk in chunks:
+                    if not tail.add(chunk, cancel):
+                        break
+            except Exception:
+                pass  # the answer is already in hand
+    finally:
+        stream.close()
+    _settle_stream(section, request, parser, usage_chunk, tail, permit)
+    return parser.result()
+
+
+def complete_json(
+    section: str,
+    system: str,
+    user: str,
+    temperature: float,
+    model: str = MODEL,
+    caps: Optional[Dict[Path, int]] = None,
+    on_item: Optional[Callable[[Path, object], None]] = None,
+    validate: Optional[Callable[[dict], object]] = None,
+):
+    """
+    One JSON-mode chat completion on the shared client; returns the parsed object.
+    caps maps array paths to the most items the caller keeps, e.g. {("invitations",): 3};
+    with OPENAI_STREAMING on, the response is streamed, items are passed to on_item as they
+    complete and the answer is returned once every cap is reached (see _stream_json).
+    validate(data) checks and converts the object, raising ValueError when it is unusable;
+    its result is returned, and its errors count as json_error like malformed JSON does.
+    Transient errors are retried (utils/retry.py) while the request budget allows.
+    Raises on any failure so callers can serve their fallback.
+    """
+    shared = get_openai_client()
+    if not shared:
+        raise LLMUnavailable("OpenAI disabled or OPENAI_API_KEY missing")
+    request = _request(model, system, user, temperature)
+    cost = estimate_tokens(section, system, user)
+    emitted = []
+    if on_item is not None:
+        def on_item(path, item, _on_item=on_item):
+            emitted.append(path)
+            _on_item(path, item)
+
+    def attempt(cancel):
+        with admitted(section, cost) as permit:
+            if cancel is not None and cancel.is_set():
+                raise HedgeCancelled(section)  # the other attempt answered while this one was queued
+            client = _with_deadline(section, shared)  # each retry gets what is left of the budget
+            with _upstream(section):
+                if caps and OPENAI_STREAMING:
+                    data = _stream_json(section, client, request, caps, on_item, permit, cancel)
+                else:
+                    resp = client.chat.completions.create(**request)
+                    permit.settle(_record_usage(section, resp))
+                    data = _parse_object(section, resp.choices[0].message.content)
+                # Inside _upstream, so unusable output is a json_error rather than a success
+                return validate(data) if validate is not None else data
+
+    if on_item is not None:
+        # no hedging: a twin would hand the caller duplicate items, and neither would a retry once some are out
+        return with_retries(section, lambda: attempt(None), can_retry=lambda: not emitted)
+    return with_retries(section, lambda: hedged(section, attempt))
+
+
+async def _astream_json(section: str, client, request: dict, caps: Dict[Path, int], on_item, permit) -> dict:
+    parser = JsonItemStream(caps, on_item)
+    stream = await client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)
+    chunks = stream.__aiter__()
+    usage_chunk = tail = None
+    try:
+        async for chunk in chunks:
+            check_deadline(section)
+            if chunk.usage is not None:
+                usage_chunk = chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                parser.feed(chunk.choices[0].delta.content)
+                if parser.done:
+                    break
+        if parser.done and usage_chunk is None:
+            tail = _Tail()
+            try:
+                async for chunk in chunks:
+                    if not tail.add(chunk):
+                        break
+            except Exception:
+                pass
+    finally:
+        await stream.close()
+    _settle_stream(section, request, parser, usage_chunk, tail, permit)
+    return parser.result()
+
+
+async def acomplete_json(
+    section: str,
+    system: str,
+    user: str,
+    temperature: float,
+    model: str = MODEL,
+    caps: Optional[Dict[Path, int]] = None,
+    on_item: Optional[Callable[[Path, object], None]] = None,
+    validate: Optional[Callable[[dict], object]] = None,
+):
+    """complete_json on the AsyncOpenAI client; awaits instead of blocking a thread."""
+    shared = get_async_openai_client()
+    if not shared:
+        raise LLMUnavailable("OpenAI disabled or OPENAI_API_KEY missing")
+    request = _request(model, system, user, temperature)
+    cost = estimate_tokens(section, system, user)
+    emitted = []
+    if on_item is not None:
+        def on_item(path, item, _on_item=on_item):
+            emitted.append(path)
+            _on_item(path, item)
+
+    async def attempt():
+        async with aadmitted(section, cost) as permit:
+            client = _with_deadline(section, shared)
+            with _upstream(section):
+                if caps and OPENAI_STREAMING:
+                    data = await _astream_json(section, client, request, caps, on_item, permit)
+                else:
+                    resp = await client.chat.completions.create(**request)
+                    permit.settle(_record_usage(section, resp))
+                    data = _parse_object(section, resp.choices[0].message.content)
+                return validate(data) if validate is not None else data
+
+    if on_item is not None:
+        return await awith_retries(section, attempt, can_retry=lambda: not emitted)
+    return await awith_retries(section, lambda: ahedged(section, attempt))
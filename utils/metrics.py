@@ -0,0 +1,258 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Every thread counts into its own dict, so the hot path is a dict update with no lock;
+# a scrape sums the dicts. A thread that exits hands its dict over to be folded into _retired.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+_local = threading.local()
+_shards: List[dict] = []
+_exited: List[dict] = []
+_retired: Dict[tuple, object] = {}
+_registry_lock = threading.Lock()
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[tuple]]] = []
+
+
+class _ThreadMarker:
+    """Lives in the thread's locals; when the thread exits it is freed and its counts retire."""
+    __slots__ = ("__weakref__",)
+
+
+def _shard() -> dict:
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        _local.marker = _ThreadMarker()
+        with _registry_lock:
+            _shards.append(shard)
+        weakref.finalize(_local.marker, _exited.append, shard)  # list.append: safe from any thread
+        return shard
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        _metrics.append(self)
+
+    def _samples(self, labels: tuple, value) -> Iterable[Tuple[str, str, float]]:
+        yield self.name, _labels(self.labels, labels), value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        try:
+            shard = _local.shard
+        except AttributeError:
+            shard = _shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        try:
+            shard = _local.shard
+        except AttributeError:
+            shard = _shard()
+        key = (self.name, labels)
+        counts = shard.get(key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the running sum
+            counts = shard[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _samples(self, labels: tuple, counts) -> Iterable[Tuple[str, str, float]]:
+        cumulative = 0
+        for edge, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = "+Inf" if edge == math.inf else repr(edge)
+            yield f"{self.name}_bucket", _labels(self.labels + ("le",), labels + (le,)), cumulative
+        yield f"{self.name}_sum", _labels(self.labels, labels), counts[-1]
+        yield f"{self.name}_count", _labels(self.labels, labels), cumulative
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _merge(into: dict, shard: dict) -> None:
+    for _ in range(3):
+        try:
+            items = list(shard.items())  # the owning thread may add a key meanwhile
+            break
+        except RuntimeError:
+            continue
+    else:
+        return
+    for key, value in items:
+        if isinstance(value, list):
+            total = into.get(key)
+            if total is None:
+                into[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    total[i] += v
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def snapshot() -> Dict[tuple, object]:
+    """Totals over all threads: {(metric name, label values): count, or histogram slots}."""
+    with _registry_lock:
+        while _exited:
+            shard = _exited.pop()
+            _merge(_retired, shard)
+            _shards[:] = [s for s in _shards if s is not shard]
+        totals: Dict[tuple, object] = {}
+        _merge(totals, _retired)
+        shards = list(_shards)
+    for shard in shards:
+        _merge(totals, shard)
+    return totals
+
+
+def add_collector(collector: Callable[[], Iterable[tuple]]) -> None:
+    """collector() yields (name, kind, help, [(labels dict, value), ...]) for values read at scrape time."""
+    _collectors.append(collector)
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    totals = snapshot()
+    by_name: Dict[str, List[tuple]] = {}
+    for (name, labels), value in totals.items():
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in sorted(by_name.get(metric.name, ()), key=lambda item: item[0]):
+            lines.extend(f"{name}{label_text} {_number(v)}" for name, label_text, v in metric._samples(labels, value))
+    for collector in _collectors:
+        for name, kind, help_text, samples in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def timed(histogram: Histogram, *labels):
+    """Observe how long each call of the decorated function (sync or async) takes, errors included."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start, *labels)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+
+        return wrapper
+
+    return decorator
+
+
+# ---- the app's metrics ----
+
+SECTION_SECONDS = Histogram(
+    "plan_section_seconds", "Time to produce a plan section, whatever it was served from", ("section",)
+)
+OPENAI_CALLS = Counter(
+    "openai_calls_total",
+    "Upstream completions by outcome (success, json_error, timeout, api_error, rejected, cancelled); "
+    "fallback counts sections served from their fallback after the model could not answer",
+    ("section", "outcome"),
+)
+OPENAI_SECONDS = Histogram("openai_call_seconds", "Latency of successful upstream completions", ("section",))
+OPENAI_TOKENS = Counter("openai_tokens_total", "Tokens reported by the API", ("section", "kind"))
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds", "Time completions spent queued for an upstream slot", ("class",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+HTTP_SECONDS = Histogram(
+    "http_request_seconds", "Request handling time until the response (or its first chunk) is returned",
+    ("endpoint", "method", "status"),
+)
+
+
+class FallbackOnce:
+    """
+    Counts each section's fallback at most once for one piece of work: the plan layer serves a
+    section's fallback when it stops waiting, and the generator it gave up on falls back again
+    when its call finally ends.
+    """
+
+    def __init__(self):
+        self._counted = set()
+        self._lock = threading.Lock()
+
+    def count(self, section: str) -> None:
+        with self._lock:
+            if section in self._counted:
+                return
+            self._counted.add(section)
+        OPENAI_CALLS.inc(section, "fallback")
+
+
+_fallback_once = contextvars.ContextVar("fallback_once", default=None)
+
+
+def enter_fallback_scope() -> FallbackOnce:
+    """Make count_fallback in the current context (a copied one, or a task's) count through the returned tally."""
+    once = FallbackOnce()
+    _fallback_once.set(once)
+    return once
+
+
+def count_fallback(section: str) -> None:
+    once = _fallback_once.get()
+    if once is not None:
+        once.count(section)
+    else:
+        OPENAI_CALLS.inc(section, "fallback")
@@ -0,0 +1,193 @@
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+from utils.config import ADMIN_TOKEN, PROFILE_DIR, PROFILE_INTERVAL, PROFILE_KEEP
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("sample", "cprofile")
+_NAME = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}-(sample|cprofile)\.(folded|prof)$")
+
+# One profile at a time: samples of two profiled requests would mix
+_busy = threading.Lock()
+
+
+def authorized(token: Optional[str]) -> bool:
+    """True for the configured ADMIN_TOKEN; with none configured, profiling is off for everyone."""
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def requested_mode(flag: Optional[str], token: Optional[str]) -> Optional[str]:
+    """
+    The profiler asked for by X-Profile / ?profile= ("1" means sample, or "sample"/"cprofile"),
+    or None when nothing was asked for or the admin token doesn't match.
+    """
+    flag = (flag or "").strip().lower()
+    if not flag or flag in {"0", "false", "no"} or not authorized(token):
+        return None
+    return "sample" if flag in {"1", "true", "yes"} else flag
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    if path.startswith(ROOT + os.sep) and "site-packages" not in path:
+        path = os.path.relpath(path, ROOT)
+    else:
+        path = os.path.basename(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads every `interval` seconds and counts them in collapsed
+    ("folded") form: one "thread;outer;...;inner count" line per distinct stack, which
+    flamegraph.pl, speedscope and most flame graph viewers read directly. Only stacks that
+    pass through this repo's code are kept, so idle pool threads and the server loop don't
+    drown out the request (another request running at the same time does show up).
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.ticks = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._labels: Dict[object, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                ours = False
+                while frame is not None:
+                    code = frame.f_code
+                    ours = ours or (code.co_filename.startswith(ROOT) and "site-packages" not in code.co_filename)
+                    stack.append(self._label(code))
+                    frame = frame.f_back
+                if ours:
+                    stack.append(names.get(ident, str(ident)))
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfile:
+    """
+    A profile of one request, started by start_profile() and written by finish_profile().
+    cProfile only sees the thread that enabled it, so a caller using mode "cprofile" should
+    do the request's work on that thread (or, under asyncio, on the loop).
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self.name = f"{stamp}-{uuid.uuid4().hex[:8]}-{mode}.{'prof' if mode == 'cprofile' else 'folded'}"
+        self.started = time.perf_counter()
+        self._profiler = cProfile.Profile() if mode == "cprofile" else SamplingProfiler(PROFILE_INTERVAL)
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def stop(self) -> str:
+        if self.mode == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, self.name)
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(path)  # pstats format: snakeviz, flameprof, python -m pstats
+        else:
+            self._profiler.write(path)
+        _prune()
+        return self.name
+
+
+def start_profile(mode: str = "sample") -> Optional[RequestProfile]:
+    """Start profiling the current request; None if the mode is unknown or another profile is running."""
+    if mode not in MODES or not _busy.acquire(blocking=False):
+        return None
+    try:
+        profile = RequestProfile(mode)
+        profile.start()
+    except BaseException:
+        _busy.release()
+        raise
+    return profile
+
+
+def finish_profile(profile: Optional[RequestProfile]) -> Optional[str]:
+    """Stop and save the profile; returns its file name (None if there was none or it was already saved)."""
+    if profile is None or getattr(profile, "done", False):
+        return None
+    profile.done = True
+    try:
+        return profile.stop()
+    finally:
+        _busy.release()
+
+
+def _prune() -> None:
+    profiles = list_profiles()
+    for old in profiles[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old["name"]))
+        except OSError:
+            pass
+
+
+def list_profiles() -> List[Dict]:
+    """Saved profiles, newest first."""
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if _NAME.match(n)]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        stat = os.stat(os.path.join(PROFILE_DIR, name))
+        profiles.append({
+            "name": name,
+            "mode": _NAME.match(name).group(1),
+            "bytes": stat.st_size,
+            "created": round(stat.st_mtime, 3),
+        })
+    return sorted(profiles, key=lambda p: p["name"], reverse=True)
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a saved profile, or None for names that aren't profiles (no path tricks)."""
+    if not _NAME.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,168 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+from utils.config import (
+    RETRY_BASE_DELAY, RETRY_BUDGET_BURST, RETRY_BUDGET_RATIO, RETRY_ENABLED, RETRY_MAX_ATTEMPTS, RETRY_MAX_DELAY,
+)
+from utils.deadline import remaining
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RetryBudget:
+    """
+    Every first attempt banks `ratio` of a retry (up to `burst` banked); every retry spends one.
+    When the backend is failing across the board this caps retries at `ratio` extra calls
+    instead of multiplying the load.
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.balance = burst
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.balance = min(self.burst, self.balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+_budget = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_BURST)
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _count(section: str, what: str) -> None:
+    with _stats_lock:
+        tally = _stats.setdefault(
+            section, {"retries": 0, "recovered": 0, "exhausted": 0, "no_budget": 0, "no_time": 0, "not_retryable": 0}
+        )
+        tally[what] += 1
+
+
+def retryable(error: BaseException) -> bool:
+    """Transient upstream failures only; bad requests, auth errors, breaker/deadline/admission refusals are not."""
+    if isinstance(error, APITimeoutError):
+        return True  # a per-attempt timeout shorter than the budget; the deadline check below decides
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms or Retry-After, seconds or HTTP date), if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter: uniform between 0 and base * 2^attempt, capped at RETRY_MAX_DELAY."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _next_delay(section: str, error: BaseException, attempt: int) -> Optional[float]:
+    """Seconds to sleep before retrying after `error`, or None to give up and re-raise it."""
+    if not retryable(error):
+        _count(section, "not_retryable")
+        return None
+    if attempt + 1 >= RETRY_MAX_ATTEMPTS:
+        _count(section, "exhausted")
+        return None
+    asked = retry_after(error)
+    if asked is not None and asked > RETRY_MAX_DELAY:
+        _count(section, "no_time")
+        return None
+    delay = asked if asked is not None else backoff(attempt)
+    left = remaining()
+    # Leave the retry at least as long again as the wait, or it can only time out
+    if left is not None and left <= 2 * delay + RETRY_BASE_DELAY:
+        _count(section, "no_time")
+        return None
+    if not _budget.try_spend():
+        _count(section, "no_budget")
+        return None
+    _count(section, "retries")
+    return delay
+
+
+def with_retries(section: str, call: Callable[[], object], can_retry: Callable[[], bool] = lambda: True):
+    """
+    call() until it succeeds or the error is not worth retrying. can_retry() is checked after
+    each failure, e.g. to stop once a streaming caller has already been handed items.
+    """
+    if not RETRY_ENABLED:
+        return call()
+    _budget.deposit()
+    attempt = 0
+    while True:
+        try:
+            result = call()
+        except Exception as e:
+            delay = _next_delay(section, e, attempt) if can_retry() else None
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if attempt:
+            _count(section, "recovered")
+        return result
+
+
+async def awith_retries(section: str, call: Callable[[], object], can_retry: Callable[[], bool] = lambda: True):
+    """with_retries() for coroutines; backs off with asyncio.sleep."""
+    if not RETRY_ENABLED:
+        return await call()
+    _budget.deposit()
+    attempt = 0
+    while True:
+        try:
+            result = await call()
+        except Exception as e:
+            delay = _next_delay(section, e, attempt) if can_retry() else None
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if attempt:
+            _count(section, "recovered")
+        return result
+
+
+def retry_stats() -> Dict:
+    with _stats_lock:
+        sections = {section: dict(tally) for section, tally in _stats.items()}
+    return {"enabled": RETRY_ENABLED, "budget": round(_budget.balance, 2), "sections": sections}
@@ -0,0 +1,200 @@
+import copy
+import functools
+import inspect
+import math
+import re
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.cache import _bypass
+from utils.config import (
+    CACHE_ENABLED, CACHE_TTL, SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_GUEST_RATIO,
+    SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_THRESHOLD,
+)
+
+# Spelling variants that should not count as different text
+_ABBREVIATIONS = {
+    "st": "street", "str": "street", "ave": "avenue", "av": "avenue", "rd": "road", "blvd": "boulevard",
+    "dr": "drive", "ln": "lane", "ct": "court", "pl": "place", "pkwy": "parkway", "sq": "square",
+    "n": "north", "s": "south", "e": "east", "w": "west", "mt": "mount", "ft": "fort",
+    "&": "and", "bbq": "barbecue", "nbhd": "neighborhood", "neighbourhood": "neighborhood",
+}
+_WORD = re.compile(r"[^\W_]+|&")
+
+
+def canonical_text(text: str) -> str:
+    words = _WORD.findall(str(text or "").casefold())
+    return " ".join(_ABBREVIATIONS.get(w, w) for w in words)
+
+
+def embed(text: str, dim: int = SEMANTIC_CACHE_DIM, n: int = 3) -> np.ndarray:
+    """
+    Unit-length feature vector of hashed character n-grams plus whole words (signed feature hashing),
+    so cosine similarity is a plain dot product.
+    """
+    text = canonical_text(text)
+    padded = f" {text} "
+    grams = [padded[i:i + n] for i in range(len(padded) - n + 1)] + text.split()
+    if not grams:
+        return np.zeros(dim, dtype=np.float32)
+    hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+    vec = np.bincount(hashes % dim, weights=signs, minlength=dim).astype(np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+class SimilarityCache:
+    """
+    Near-duplicate cache: each entry is a feature vector in a preallocated (max_entries x dim) matrix.
+    A lookup is one matrix-vector product over the live rows. The best row is a hit when its cosine
+    similarity reaches the threshold, it is in the same partition (exact-match fields) and its
+    quantity (guest count) is within `ratio` of the query's. When full, the least recently used row is replaced.
+    """
+
+    def __init__(self, max_entries: int, dim: int, threshold: float, ratio: float, ttl: float):
+        self.max_entries = max_entries
+        self.dim = dim
+        self.threshold = threshold
+        self.max_log_ratio = math.log(max(ratio, 1.0))
+        self.ttl = ttl
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._log_qty = np.zeros(max_entries, dtype=np.float32)
+        self._partition = np.zeros(max_entries, dtype=np.int64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._used = np.zeros(max_entries, dtype=np.int64)
+        self._values: List[object] = [None] * max_entries
+        self._partitions: Dict[Hashable, int] = {}
+        self._size = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "inserts": 0, "evictions": 0, "lookup_seconds": 0.0}
+
+    def _partition_id(self, partition: Hashable) -> int:
+        return self._partitions.setdefault(partition, len(self._partitions))
+
+    def get(self, text: str, partition: Hashable = None, quantity: Optional[float] = None):
+        """(value, similarity) for the closest usable entry, or None."""
+        vec = embed(text, self.dim)
+        start = time.perf_counter()
+        with self._lock:
+            self._stats["lookups"] += 1
+            n = self._size
+            part = self._partitions.get(partition)
+            if n == 0 or part is None:
+                self._stats["lookup_seconds"] += time.perf_counter() - start
+                return None
+            sims = self._vectors[:n] @ vec
+            # Only rows above the threshold (usually a handful) go through the exact-match filters
+            rows = np.flatnonzero(sims >= self.threshold)
+            if len(rows):
+                usable = (self._partition[rows] == part) & (self._expires[rows] >= time.time())
+                if quantity is not None:
+                    usable &= np.abs(self._log_qty[rows] - math.log(max(quantity, 1))) <= self.max_log_ratio
+                rows = rows[usable]
+            self._stats["lookup_seconds"] += time.perf_counter() - start
+            if not len(rows):
+                return None
+            best = int(rows[np.argmax(sims[rows])])
+            score = float(sims[best])
+            self._tick += 1
+            self._used[best] = self._tick
+            self._stats["hits"] += 1
+            return copy.deepcopy(self._values[best]), score
+
+    def set(self, text: str, value, partition: Hashable = None, quantity: Optional[float] = None) -> None:
+        vec = embed(text, self.dim)
+        with self._lock:
+            if self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                # Full: reuse an expired row if there is one, else the least recently used
+                expired = np.flatnonzero(self._expires < time.time())
+                row = int(expired[0]) if len(expired) else int(np.argmin(self._used))
+                self._stats["evictions"] += 1
+            self._tick += 1
+            self._vectors[row] = vec
+            self._log_qty[row] = math.log(max(quantity, 1)) if quantity is not None else 0.0
+            self._partition[row] = self._partition_id(partition)
+            self._expires[row] = time.time() + self.ttl
+            self._used[row] = self._tick
+            self._values[row] = copy.deepcopy(value)
+            self._stats["inserts"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            tally = dict(self._stats)
+            tally["entries"] = self._size
+        lookups = tally["lookups"]
+        tally["hit_rate"] = round(tally["hits"] / lookups, 3) if lookups else 0.0
+        tally["avg_lookup_ms"] = round(tally.pop("lookup_seconds") * 1000 / lookups, 3) if lookups else 0.0
+        return tally
+
+    def __len__(self) -> int:
+        return self._size
+
+
+_caches: Dict[str, SimilarityCache] = {}
+_caches_lock = threading.Lock()
+
+
+def _cache_for(section: str) -> SimilarityCache:
+    with _caches_lock:
+        cache = _caches.get(section)
+        if cache is None:
+            cache = _caches[section] = SimilarityCache(
+                SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_THRESHOLD,
+                SEMANTIC_CACHE_GUEST_RATIO, CACHE_TTL,
+            )
+        return cache
+
+
+def semantic_cache_stats() -> Dict[str, Dict[str, float]]:
+    with _caches_lock:
+        caches = dict(_caches)
+    return {section: cache.stats() for section, cache in caches.items()}
+
+
+def near_duplicate(section: str, features_fn: Callable[..., Tuple[str, Hashable, Optional[float]]]):
+    """
+    Reuse the result of a similar earlier call. features_fn maps the call arguments to
+    (free text compared by similarity, partition that must match exactly, quantity compared by ratio).
+    Like cached(), only returned values are stored and cache_bypass skips the lookup.
+    """
+    def decorator(fn):
+        if not (CACHE_ENABLED and SEMANTIC_CACHE_ENABLED):
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                text, partition, quantity = features_fn(*args, **kwargs)
+                cache = _cache_for(section)
+                hit = None if _bypass.get() else cache.get(text, partition, quantity)
+                if hit is not None:
+                    return hit[0]
+                result = await fn(*args, **kwargs)
+                cache.set(text, result, partition, quantity)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            text, partition, quantity = features_fn(*args, **kwargs)
+            cache = _cache_for(section)
+            hit = None if _bypass.get() else cache.get(text, partition, quantity)
+            if hit is not None:
+                return hit[0]
+            result = fn(*args, **kwargs)
+            cache.set(text, result, partition, quantity)
+            return result
+
+        return wrapper
+
+    return decorator
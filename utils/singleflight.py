@@ -0,0 +1,142 @@
+import asyncio
+import copy
+import functools
+import inspect
+import threading
+from typing import Callable, Dict
+
+from utils.admission import current_priority
+from utils.cache import make_key
+from utils.deadline import DeadlineExceeded, record_timeout, remaining
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key onto one execution.
+    The first caller runs the function; everyone who arrives while it is in flight
+    waits for it and gets a copy of the same result (or the same exception). A leader
+    that ran out of its own request budget is not a failure of the call, so its
+    followers run it again under theirs instead of inheriting the DeadlineExceeded.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def do(self, section: str, key: str, fn: Callable, *args, **kwargs):
+        with self._lock:
+            tally = self._stats.setdefault(section, {"executed": 0, "coalesced": 0})
+            call = self._calls.get(key)
+            if call is not None:
+                tally["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                tally["executed"] += 1
+                leader = True
+
+        if not leader:
+            # A follower still honours its own request budget, even if the leader has none
+            if not call.done.wait(remaining()):
+                record_timeout(section)
+                raise DeadlineExceeded(f"{section}: request time budget exhausted")
+            if isinstance(call.error, DeadlineExceeded):
+                return self.do(section, key, fn, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def do_async(self, section: str, key: str, fn: Callable, *args, **kwargs):
+        """
+        do() for coroutines. The shared call runs as its own task on the caller's loop, so a
+        caller that is cancelled (client went away) doesn't cancel it for everyone else.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = f"{id(loop)}:{key}"
+        with self._lock:
+            tally = self._stats.setdefault(section, {"executed": 0, "coalesced": 0})
+            task = self._async_calls.get(flight_key)
+            leader = task is None
+            if leader:
+                task = self._async_calls[flight_key] = loop.create_task(fn(*args, **kwargs))
+                task.add_done_callback(functools.partial(self._async_done, flight_key))
+                tally["executed"] += 1
+            else:
+                tally["coalesced"] += 1
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), remaining())
+        except DeadlineExceeded:
+            # Raised by the shared call (DeadlineExceeded is a TimeoutError, so this comes first)
+            if leader:
+                raise
+            return await self.do_async(section, key, fn, *args, **kwargs)
+        except asyncio.TimeoutError:
+            record_timeout(section)
+            raise DeadlineExceeded(f"{section}: request time budget exhausted") from None
+        return result if leader else copy.deepcopy(result)
+
+    def _async_done(self, key: str, task: asyncio.Task) -> None:
+        with self._lock:
+            self._async_calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter has gone
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {section: dict(tally) for section, tally in self._stats.items()}
+
+
+_flight = SingleFlight()
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """Per section: calls that reached upstream ("executed") and calls that piggybacked on one ("coalesced")."""
+    return _flight.stats()
+
+
+def coalesced(section: str, key_fn: Callable[..., tuple]):
+    """
+    Decorator: identical concurrent calls (same normalized key) share one in-flight execution.
+    Calls from different admission classes never share one, so an interactive request doesn't
+    wait behind a bulk leader queued for admission.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(section, current_priority(), *key_fn(*args, **kwargs))
+                return await _flight.do_async(section, key, fn, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = make_key(section, current_priority(), *key_fn(*args, **kwargs))
+            return _flight.do(section, key, fn, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,142 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from utils.config import TRACE_FILE, TRACING_ENABLED
+
+_current = contextvars.ContextVar("trace", default=None)
+_file = None
+_file_pid = None
+_file_lock = threading.Lock()
+
+
+class Trace:
+    """Spans of one request. Worker threads and tasks that copied the request's context append to it too."""
+
+    __slots__ = ("name", "start", "wall", "spans", "token", "done")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall = time.time()
+        self.spans: List[tuple] = []  # (name, start, seconds); list.append is safe across threads
+        self.token = None
+        self.done = False
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds per span name; spans of the same name (e.g. overlapping retries) are summed."""
+        totals: Dict[str, float] = {}
+        for name, _, seconds in list(self.spans):
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+class _Span:
+    __slots__ = ("name", "trace", "start")
+
+    def __init__(self, name: str, trace: Trace):
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.spans.append((self.name, self.start, time.perf_counter() - self.start))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Time the block as `name` in the current request's trace; a no-op outside a trace or with tracing off."""
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(name, trace)
+
+
+def spanned(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_trace(name: str) -> Optional[Trace]:
+    """Begin tracing the current request (None when TRACING_ENABLED is off). Pair with end_trace()."""
+    if not TRACING_ENABLED:
+        return None
+    trace = Trace(name)
+    trace.token = _current.set(trace)
+    return trace
+
+
+def end_trace(trace: Optional[Trace]) -> Optional[str]:
+    """Stop the trace, write its JSONL record if TRACE_FILE is set, and return the Server-Timing value."""
+    if trace is None or trace.done:
+        return None
+    trace.done = True
+    total = time.perf_counter() - trace.start
+    try:
+        _current.reset(trace.token)
+    except ValueError:
+        pass  # ended from another context (e.g. a streamed response); it is gone with that context
+    if TRACE_FILE and trace.spans:
+        _write(trace, total)
+    return trace.server_timing(total)
+
+
+def _write(trace: Trace, total: float) -> None:
+    global _file, _file_pid
+    record = {
+        "ts": round(trace.wall, 3),
+        "name": trace.name,
+        "total_ms": round(total * 1000, 3),
+        "spans": [
+            [name, round((start - trace.start) * 1000, 3), round(seconds * 1000, 3)]
+            for name, start, seconds in sorted(trace.spans, key=lambda s: s[1])
+        ],
+    }
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    with _file_lock:
+        if _file is None or _file_pid != os.getpid():
+            _file = open(TRACE_FILE, "a", encoding="utf-8", buffering=1)
+            _file_pid = os.getpid()
+        _file.write(line)
@@ -0,0 +1,121 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from utils.cache import make_key
+from utils.config import WARM_STORE
+
+# File layout (little endian):
+#   header  MAGIC, entry count, meta offset, meta length
+#   index   count x uint64 key hashes (sorted), count x uint64 value offsets, count x uint32 value lengths
+#   values  UTF-8 JSON blobs back to back, then one JSON metadata blob
+# Opening maps the file and wraps the index in NumPy views: nothing is parsed until a key is hit,
+# and every worker shares the same page-cache pages.
+MAGIC = b"PLWARM01"
+_HEADER = struct.Struct("<8sQQQ")
+
+
+def _hash(section: str, parts: tuple) -> int:
+    return int(make_key(section, *parts)[:16], 16)
+
+
+def write_store(path: str, entries: Iterable[Tuple[str, tuple, object]], meta: Optional[Dict] = None) -> int:
+    """Write (section, key parts, value) entries to path atomically. Returns the entry count."""
+    items = {}
+    for section, parts, value in entries:
+        items[_hash(section, tuple(parts))] = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+    hashes = np.array(sorted(items), dtype="<u8")
+    blobs = [items[int(h)] for h in hashes]
+    count = len(blobs)
+    base = _HEADER.size + count * (8 + 8 + 4)
+    lengths = np.array([len(b) for b in blobs], dtype="<u4")
+    offsets = (base + np.concatenate(([0], np.cumsum(lengths, dtype="<u8")[:-1]))).astype("<u8") if count \
+        else np.zeros(0, dtype="<u8")
+    meta_blob = json.dumps(dict(meta or {}, entries=count, built=time.time())).encode()
+    meta_offset = base + int(lengths.sum())
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, count, meta_offset, len(meta_blob)))
+        f.write(hashes.tobytes())
+        f.write(offsets.tobytes())
+        f.write(lengths.tobytes())
+        for blob in blobs:
+            f.write(blob)
+        f.write(meta_blob)
+    os.replace(tmp, path)  # workers that already mapped the old file keep reading it
+    return count
+
+
+class WarmStore:
+    """Read-only, memory-mapped lookup table written by write_store()."""
+
+    def __init__(self, path: str):
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, meta_offset, meta_len = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a warm store file")
+        pos = _HEADER.size
+        self._hashes = np.frombuffer(self._map, dtype="<u8", count=count, offset=pos)
+        self._offsets = np.frombuffer(self._map, dtype="<u8", count=count, offset=pos + 8 * count)
+        self._lengths = np.frombuffer(self._map, dtype="<u4", count=count, offset=pos + 16 * count)
+        self.meta = json.loads(self._map[meta_offset:meta_offset + meta_len])
+        self.path = path
+        self.size_bytes = len(self._map)
+        self.load_ms = (time.perf_counter() - start) * 1000
+        self._stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def get(self, section: str, *parts):
+        h = _hash(section, parts)
+        i = int(np.searchsorted(self._hashes, h))
+        found = i < len(self._hashes) and int(self._hashes[i]) == h
+        with self._lock:
+            self._stats["hits" if found else "misses"] += 1
+        if not found:
+            return None
+        offset, length = int(self._offsets[i]), int(self._lengths[i])
+        return json.loads(self._map[offset:offset + length])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tally = dict(self._stats)
+        return dict(tally, entries=len(self._hashes), bytes=self.size_bytes, load_ms=round(self.load_ms, 3),
+                    built=self.meta.get("built"))
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
+_store = None
+_store_lock = threading.Lock()
+_store_checked = False
+
+
+def warm_store() -> Optional[WarmStore]:
+    """The store at WARM_STORE, opened once per process; None when it is disabled or not built yet."""
+    global _store, _store_checked
+    if _store_checked:
+        return _store
+    with _store_lock:
+        if not _store_checked:
+            if WARM_STORE and os.path.exists(WARM_STORE):
+                try:
+                    _store = WarmStore(WARM_STORE)
+                except (OSError, ValueError, struct.error):
+                    _store = None
+            _store_checked = True
+    return _store
+
+
+def warm_store_stats() -> Optional[Dict]:
+    store = warm_store()
+    return store.stats() if store is not None else None